@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+#
+# Load test for the redirector.
+#
+# Without arguments, calls the bottle app and the fast path WSGI app
+# in-process with a mix of bundle URLs and reports requests/sec for both.
+#
+#   python loadtest.py --requests 100000
+#
+# With --url, sends the same mix of requests over HTTP to a running
+# redirector, e.g. started with `gunicorn main:app --config config.py`.
+#
+#   python loadtest.py --url http://localhost:8000 --requests 10000 --concurrency 16
+#
+import argparse
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+from urllib.parse import quote, urlparse
+from wsgiref.util import setup_testing_defaults
+
+import main
+import redirect
+
+LOCALES = list(redirect.PRECOMPUTED_LOCALES) + ['el', 'fy-NL', 'ga-IE', 'xx', 'es']
+DISTRIBUTIONS = ['default'] * 8 + ['canonical', 'experiment-foo']
+
+
+def bundle_paths(count, seed=0):
+    rng = random.Random(seed)
+    return [
+        (f'/6/Firefox/84.0/20201221152838/WINNT_x86_64-msvc/{rng.choice(LOCALES)}/release/'
+         f'Windows_NT 10.0/{rng.choice(DISTRIBUTIONS)}/default/')
+        for _ in range(count)
+    ]
+
+
+def run_wsgi(app, paths):
+    def start_response(status, headers, exc_info=None):
+        pass
+
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+    }
+    setup_testing_defaults(environ)
+
+    start = time.perf_counter()
+    for path in paths:
+        request_environ = dict(environ, PATH_INFO=path)
+        for _ in app(request_environ, start_response):
+            pass
+    return len(paths) / (time.perf_counter() - start)
+
+
+def run_http(url, paths, concurrency):
+    parsed_url = urlparse(url)
+    chunks = [paths[idx::concurrency] for idx in range(concurrency)]
+
+    def worker(chunk):
+        connection = HTTPConnection(parsed_url.netloc)
+        for path in chunk:
+            connection.request('GET', quote(path))
+            response = connection.getresponse()
+            response.read()
+            if response.status not in (302, 303):
+                raise Exception(f'Unexpected status {response.status} for {path}')
+        connection.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, chunks))
+    return len(paths) / (time.perf_counter() - start)
+
+
+def loadtest():
+    parser = argparse.ArgumentParser(description='Load test the redirector.')
+    parser.add_argument('--requests', type=int, default=50000)
+    parser.add_argument('--url', help='Load test a running redirector instead.')
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    if not (redirect.CDN_URL or redirect.SITE_URL):
+        sys.exit('Set CDN_URL or SITE_URL, relative redirects skip the fast path.')
+
+    paths = bundle_paths(args.requests)
+
+    if args.url:
+        print(f'{args.url}: {run_http(args.url, paths, args.concurrency):.0f} requests/sec')
+        return
+
+    # Warm up the LRU cache like a long running process.
+    run_wsgi(main.app, paths[:1000])
+    for name, app in [('bottle', main.bottle_app), ('fast path', main.app)]:
+        print(f'{name}: {run_wsgi(app, paths):.0f} requests/sec')
+
+
+if __name__ == '__main__':
+    loadtest()
@@ -3,7 +3,7 @@
 from bottle import redirect, response, route, run, default_app
 from decouple import config
 
-from redirect import calculate_redirect
+from redirect import calculate_redirect, get_redirect
 
 DEBUG = config('DEBUG', default=False, cast=bool)
 
@@ -16,12 +16,14 @@ CLUSTER_NAME = config('CLUSTER_NAME', default='cluster')
 K8S_NAMESPACE = config('K8S_NAMESPACE', default='namespace')
 K8S_POD_NAME = config('K8S_POD_NAME', default='pod')
 
-app = default_app()
+X_BACKEND_SERVER = f'{CLUSTER_NAME}/{K8S_NAMESPACE}/{K8S_POD_NAME}'
+
+bottle_app = default_app()
 
 
 def set_xbackend_header(fn):
     def _inner(*args, **kwargs):
-        response.add_header('X-Backend-Server', f'{CLUSTER_NAME}/{K8S_NAMESPACE}/{K8S_POD_NAME}')
+        response.add_header('X-Backend-Server', X_BACKEND_SERVER)
         return fn(*args, **kwargs)
 
     return _inner
@@ -60,6 +62,50 @@ def redirect_to_bundle(*args, **kwargs):
     return redirect(full_url)
 
 
+class RedirectFastPath:
+    """WSGI app that redirects bundle requests without going through bottle.
+
+    Bundle requests are by far the most common requests, so they skip
+    bottle's router and request / response objects and get redirected with
+    the same headers `redirect_to_bundle` sets. Redirects come from the
+    precomputed table or the LRU cache of `get_redirect`.
+
+    All other requests are passed to bottle, as are bundle requests when the
+    bundle URL is relative, i.e. without CDN_URL or SITE_URL, since bottle
+    resolves those against the request URL.
+
+    """
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        # /<startpage_version>/<name>/<version>/<appbuildid>/<build_target>/
+        # <locale>/<channel>/<os_version>/<distribution>/<distribution_version>/
+        parts = environ.get('PATH_INFO', '').split('/')
+        if (len(parts) == 12 and not parts[11] and all(parts[1:11]) and
+                parts[6].isascii() and parts[9].isascii() and
+                environ.get('REQUEST_METHOD') in ('GET', 'HEAD')):
+            full_url = get_redirect(parts[6], parts[9])[2]
+            if full_url.startswith(('https://', 'http://')):
+                if environ.get('SERVER_PROTOCOL') == 'HTTP/1.1':
+                    status = '303 See Other'
+                else:
+                    status = '302 Found'
+                start_response(status, [
+                    ('X-Backend-Server', X_BACKEND_SERVER),
+                    ('Cache-Control', f'public, max-age={SNIPPET_BUNDLE_PREGEN_REDIRECT_TIMEOUT}'),
+                    ('Location', full_url),
+                    ('Content-Length', '0'),
+                    ('Content-Type', 'text/html; charset=UTF-8'),
+                ])
+                return [b'']
+
+        return self.app(environ, start_response)
+
+
+app = RedirectFastPath(bottle_app)
+
+
 if __name__ == '__main__':
     if DEBUG:
-        run(host='localhost', port=8000)
+        run(app, host='localhost', port=8000)
@@ -1,11 +1,21 @@
+from functools import lru_cache
 from urllib.parse import urljoin
 
-from decouple import config
+from decouple import Csv, config
 
 MEDIA_BUNDLES_PREGEN_ROOT = config('MEDIA_BUNDLES_PREGEN_ROOT', default='bundles-pregen/')
 SITE_URL = config('SITE_URL', default='')
 CDN_URL = config('CDN_URL', default='')
 
+# Redirects are precomputed for the most common locales with the `default`
+# distribution, as sent by clients. Other combinations are cached in an LRU.
+PRECOMPUTED_LOCALES = config(
+    'REDIRECT_PRECOMPUTED_LOCALES',
+    default=('en-US,de,fr,es-ES,ru,pl,it,zh-CN,ja,pt-BR,en-GB,es-MX,nl,'
+             'id,zh-TW,tr,cs,es-AR,sv-SE,hu,en-CA,uk,es-CL,ko'),
+    cast=Csv())
+REDIRECT_CACHE_SIZE = config('REDIRECT_CACHE_SIZE', default=4096, cast=int)
+
 
 def calculate_redirect(*args, **kwargs):
     product = 'Firefox'
@@ -33,3 +43,28 @@ def calculate_redirect(*args, **kwargs):
 
     # Return calculated locale, distribution, full_url
     return locale, distribution, full_url
+
+
+def precompute_redirects():
+    return {
+        (locale, 'default'): calculate_redirect(locale=locale, distribution='default')
+        for locale in PRECOMPUTED_LOCALES
+    }
+
+
+REDIRECTS = precompute_redirects()
+
+
+@lru_cache(maxsize=REDIRECT_CACHE_SIZE)
+def _cached_redirect(locale, distribution):
+    return calculate_redirect(locale=locale, distribution=distribution)
+
+
+def get_redirect(locale, distribution):
+    """Returns `calculate_redirect` results for the locale and distribution
+    exactly as sent by the client, from the precomputed REDIRECTS or the
+    LRU cache."""
+    redirect = REDIRECTS.get((locale, distribution))
+    if redirect is None:
+        redirect = _cached_redirect(locale, distribution)
+    return redirect
@@ -1,10 +1,32 @@
 #!/usr/bin/env python3
 
-from unittest.mock import patch
+from unittest.mock import Mock, patch
+from wsgiref.util import setup_testing_defaults
 
 import main
 import redirect
 
+BUNDLE_PATH = ('/6/Firefox/62.0.1/20160922113459/WINNT_x86-msvc/'
+               'en-US/release/Windows_NT 6.1/default/default/')
+
+
+def call_wsgi(app, path, method='GET'):
+    environ = {
+        'PATH_INFO': path,
+        'REQUEST_METHOD': method,
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+    }
+    setup_testing_defaults(environ)
+    start_response = Mock()
+    body = b''.join(app(environ, start_response))
+    status, headers = start_response.call_args[0][:2]
+    return status, dict(headers), body
+
+
+def fake_bottle_app(environ, start_response):
+    start_response('200 OK', [])
+    return [b'bottle']
+
 
 def test_redirect_calculate_redirect_locale_lower():
     assert redirect.calculate_redirect(locale='el-GR', distribution='default')[0] == 'el-gr'
@@ -58,3 +80,52 @@ def test_main_redirect_to_bundle(calculate_redirect, redirect_mock, response_moc
     main.redirect_to_bundle(locale='fr', distribution='default')
     assert redirect_mock.called_with('https://www.example.com/bundle.json')
     response_mock.set_header.assert_called_with('Cache-Control', 'public, max-age=90')
+
+
+@patch('redirect.SITE_URL', 'https://www.example.com')
+def test_redirect_get_redirect():
+    redirect._cached_redirect.cache_clear()
+    with patch.dict('redirect.REDIRECTS', {('en-US', 'default'): ('en-us', 'default', 'foo')}):
+        assert redirect.get_redirect('en-US', 'default') == ('en-us', 'default', 'foo')
+        assert redirect.get_redirect('el-GR', 'experiment-bar') == (
+            'el-gr', 'bar', 'https://www.example.com/bundles-pregen/Firefox/el-gr/bar.json')
+    assert redirect._cached_redirect.cache_info().currsize == 1
+
+
+@patch('redirect.SITE_URL', 'https://www.example.com')
+def test_redirect_precompute_redirects():
+    with patch('redirect.PRECOMPUTED_LOCALES', ['en-US', 'el']):
+        redirects = redirect.precompute_redirects()
+    assert redirects == {
+        ('en-US', 'default'): (
+            'en-us', 'default',
+            'https://www.example.com/bundles-pregen/Firefox/en-us/default.json'),
+        ('el', 'default'): (
+            'el', 'default', 'https://www.example.com/bundles-pregen/Firefox/el/default.json'),
+    }
+
+
+@patch('main.get_redirect')
+@patch('main.calculate_redirect')
+def test_main_fast_path_matches_bottle(calculate_redirect, get_redirect):
+    get_redirect.return_value = calculate_redirect.return_value = (
+        'en-us', 'default', 'https://www.example.com/bundle.json')
+    fast_path = call_wsgi(main.app, BUNDLE_PATH)
+    bottle = call_wsgi(main.bottle_app, BUNDLE_PATH)
+    assert fast_path == bottle
+    assert fast_path[0] == '303 See Other'
+    get_redirect.assert_called_with('en-US', 'default')
+
+
+@patch('main.get_redirect')
+def test_main_fast_path_relative_url(get_redirect):
+    get_redirect.return_value = ('en-us', 'default', '/bundle.json')
+    app = main.RedirectFastPath(fake_bottle_app)
+    assert call_wsgi(app, BUNDLE_PATH)[2] == b'bottle'
+
+
+def test_main_fast_path_other_paths():
+    app = main.RedirectFastPath(fake_bottle_app)
+    assert call_wsgi(app, '/healthz/')[2] == b'bottle'
+    assert call_wsgi(app, BUNDLE_PATH[:-1])[2] == b'bottle'
+    assert call_wsgi(app, BUNDLE_PATH, method='POST')[2] == b'bottle'
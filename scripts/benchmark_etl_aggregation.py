@@ -0,0 +1,179 @@
+##
+#
+# Benchmark for etl.aggregate_rows
+#
+# Generates synthetic Redash `bq-job` rows at realistic volumes, i.e. a few
+# hundred Jobs, all countries, all channels and events, and aggregates them
+# with etl.aggregate_rows. Pass `legacy` to also time the previous list based
+# implementation, which is quadratic and slow for large row counts.
+#
+# Use:
+#  - ./manage.py runscript benchmark_etl_aggregation --script-args 300000
+#  - ./manage.py runscript benchmark_etl_aggregation --script-args 20000 legacy
+#
+##
+import collections
+import json
+import random
+import time
+
+from snippets.base.etl import aggregate_rows
+from snippets.base.models import CHANNELS
+
+
+EVENTS = [
+    ('{}', 'IMPRESSION'),
+    ('{}', 'IMPRESSION'),
+    ('{}', 'IMPRESSION'),
+    ('{}', 'CLICK_BUTTON'),
+    ('{}', 'BLOCK'),
+    ('{}', 'DISMISS'),
+    ('scene1-button-learn-more', 'CLICK_BUTTON'),
+    ('conversion-subscribe-activation', 'CLICK_BUTTON'),
+    ('', 'UNKNOWN'),
+]
+COUNTRIES = ['XX', 'ERROR'] + [
+    a + b for a in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ' for b in 'ABCDEFGHIJ'
+][:248]
+
+
+def synthetic_rows(count, jobs=300, seed=0):
+    """Yields `count` Redash rows for `jobs` Job IDs, starting from 1."""
+    rng = random.Random(seed)
+    channels = list(CHANNELS) + ['release-cck-foo', 'nightly-try', '']
+    for _ in range(count):
+        event_context, event = rng.choice(EVENTS)
+        yield {
+            'message_id': str(rng.randint(1, jobs)),
+            'event_context': event_context,
+            'event': event,
+            'additional_properties': '{}',
+            'channel': rng.choice(channels),
+            'country_code': rng.choice(COUNTRIES),
+            'counts': rng.randint(1, 10_000),
+            'no_clients': rng.randint(1, 1_000),
+            'no_clients_total': 0,
+        }
+
+
+def legacy_aggregate_rows(rows, job_ids, key='message_id'):
+    job_ids = list(job_ids)
+    new_rows = []
+    for row in sorted(rows, key=lambda x: x[key]):
+        # Remove rows with invalid Job IDs
+        if row['message_id'] not in job_ids:
+            continue
+
+        # Redash uses {} instead of null
+        if row['event_context'] == '{}':
+            row['event_context'] = ''
+
+        # Sometimes data in Telemetry populate `event_context`, some
+        # other times it uses `additional_properties['value']` to
+        # place the event context. Extract information from both
+        # places to identify the event.
+        properties = json.loads(row.get('additional_properties', '{}'))
+
+        # Fundraising metrics need special treatment.
+        if row['event_context'] == 'EOYSnippetForm' and row['event'] == 'CLICK_BUTTON':
+            event = 'CLICK'
+        else:
+            event = row['event_context'] or properties.get('value', '') or row['event']
+
+        if event in ['CLICK_BUTTON', 'CLICK']:
+            event = 'click'
+        elif event == 'IMPRESSION':
+            event = 'impression'
+        elif event == 'BLOCK':
+            event = 'block'
+        elif event == 'DISMISS':
+            event = 'dismiss'
+        elif event == 'scene1-button-learn-more':
+            event = 'go_to_scene2'
+        elif event in ['subscribe-success',
+                       'subscribe-error',
+                       'conversion-subscribe-activation']:
+            event = event.replace('-', '_')
+        else:
+            # Ignore invalid event
+            continue
+
+        row['event'] = event
+
+        # Normalize channel name, based on what kind of snippets they get.
+        channel = row['channel']
+        if not channel:
+            channel = 'release'
+        row['channel'] = next(
+            (item for item in CHANNELS if
+             channel.startswith(item)), 'release'
+        )
+
+        # Normalize country
+        country_code = row['country_code']
+        if country_code in ['ERROR', None]:
+            row['country_code'] = 'XX'
+
+        # Not needed anymore
+        row.pop('event_context', None)
+        row.pop('additional_properties', None)
+
+        new_rows.append(row)
+
+    # Aggregate counts of same events for the global count.
+    processed = collections.defaultdict(dict)
+    for row in new_rows:
+        event = row['event']
+        processed[row[key]][event] = processed[row[key]].get(event, 0) + row['counts']
+        if event == 'impression':
+            processed[row[key]]['impression_no_clients_total'] = (
+                processed[row[key]].get('impression_no_clients_total', 0) +
+                row['no_clients_total']
+            )
+
+        detail = [{
+            'event': row['event'],
+            'channel': row['channel'],
+            'country': row['country_code'],
+            'counts': row['counts'],
+            'no_clients': row['no_clients'],
+            'no_clients_total': row['no_clients_total'],
+        }]
+
+        if not processed[row[key]].get('details'):
+            processed[row[key]]['details'] = detail
+        else:
+            for drow in processed[row[key]]['details']:
+                if ((drow['event'] == row['event'] and
+                     drow['channel'] == row['channel'] and
+                     drow['country'] == row['country_code'])):
+                    drow['counts'] += row['counts']
+                    drow['no_clients'] += row['no_clients']
+                    drow['no_clients_total'] += row['no_clients_total']
+                    break
+            else:
+                processed[row[key]]['details'] += detail
+
+    return processed
+
+
+def run(*args):
+    count = int(args[0]) if args else 300_000
+    jobs = 300
+    job_ids = {str(job_id) for job_id in range(1, jobs + 1)}
+    # Stale Jobs still sending Telemetry.
+    rows = list(synthetic_rows(count, jobs=jobs + 50))
+
+    implementations = [('current', aggregate_rows)]
+    if 'legacy' in args:
+        implementations.append(('legacy', legacy_aggregate_rows))
+
+    print(f'{count} rows, {jobs} jobs')
+    for name, aggregate in implementations:
+        # The legacy implementation modifies rows, pass copies.
+        rows_copy = [dict(row) for row in rows]
+        start = time.perf_counter()
+        processed = aggregate(rows_copy, job_ids)
+        elapsed = time.perf_counter() - start
+        details = sum(len(metrics['details']) for metrics in processed.values())
+        print(f'{name}: {elapsed:.2f}s, {count / elapsed:.0f} rows/sec, {details} details')
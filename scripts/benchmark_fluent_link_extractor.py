@@ -0,0 +1,114 @@
+##
+#
+# Micro-benchmark for util.fluent_link_extractor
+#
+# Runs the link extractor over the rich text fields of every Template
+# subclass and compares it against the previous implementation which
+# deep copied the data and compiled the link patterns for every link.
+#
+# Use:
+#  - ./manage.py runscript benchmark_fluent_link_extractor --script-args 10000
+#
+##
+import copy
+import re
+import sys
+import timeit
+
+from snippets.base.models import Template
+from snippets.base.util import convert_special_link, fluent_link_extractor
+
+
+RICH_TEXT = (
+    'We have an <a href="https://example.com/?utm_term=[[job_id]]">example</a> and a '
+    '<a data-metric="custom-click" href="https://mozilla.org">custom metric</a>, '
+    'a <a href="special:about:logins">special link</a> and '
+    '<a href="special:preferences">preferences</a>.'
+)
+
+
+def legacy_fluent_link_extractor(data, variables):
+    class Replacer:
+        link_counter = 0
+        links = {}
+
+        def __call__(self, matchobj):
+            keyname = 'link{0}'.format(self.link_counter)
+            replacement = '<{keyname}>{text}</{keyname}>'.format(
+                keyname=keyname,
+                text=matchobj.group('innerText'))
+            url_match = re.search('href="(?P<url>.+?)"', matchobj.group('attrs'))
+            url = ''
+
+            if url_match:
+                url = url_match.group('url')
+
+            action, args, entrypoint_name, entrypoint_value = convert_special_link(url)
+
+            if action:
+                self.links[keyname] = {
+                    'action': action,
+                }
+                if args:
+                    self.links[keyname]['args'] = args
+                if entrypoint_name:
+                    self.links[keyname]['entrypoint_name'] = entrypoint_name
+                if entrypoint_value:
+                    self.links[keyname]['entrypoint_value'] = entrypoint_value
+            else:
+                self.links[keyname] = {
+                    'url': url,
+                }
+
+            metric_match = re.search('data-metric="(?P<metric>.+?)"', matchobj.group('attrs'))
+            if metric_match:
+                self.links[keyname]['metric'] = metric_match.group('metric')
+
+            self.link_counter += 1
+            return replacement
+
+    local_data = copy.deepcopy(data)
+    replacer = Replacer()
+    for variable in variables:
+        if variable not in local_data:
+            continue
+        local_data[variable] = re.sub('(<a(?P<attrs> .*?)>)(?P<innerText>.+?)(</a>)',
+                                      replacer, local_data[variable])
+
+    local_data['links'] = replacer.links
+    return local_data
+
+
+def template_data(template):
+    """Returns rendered-like data with sample rich text for all rich text
+    fields of the template, next to a few plain fields."""
+    data = {
+        'title': 'Title',
+        'icon': 'https://example.com/icon.png',
+        'block_button_text': 'Remove this',
+        'do_not_autoblock': False,
+        'button_url': 'https://example.com',
+    }
+    for field in template.get_rich_text_fields():
+        data[field] = RICH_TEXT
+    return data
+
+
+def run(*args):
+    number = int(args[0]) if args else 10000
+
+    print('template;fields;legacy (ms);current (ms);speedup')
+    for template_class in sorted(Template.__subclasses__(), key=lambda cls: cls.__name__):
+        template = template_class()
+        variables = template.get_rich_text_fields()
+        data = template_data(template)
+
+        if (legacy_fluent_link_extractor(data, variables)['links'] !=
+                fluent_link_extractor(data, variables)['links']):
+            sys.exit(f'{template_class.__name__}: results differ')
+
+        legacy = timeit.timeit(lambda: legacy_fluent_link_extractor(data, variables),
+                               number=number)
+        current = timeit.timeit(lambda: fluent_link_extractor(data, variables), number=number)
+        print(f'{template_class.__name__};{len(variables)};'
+              f'{legacy * 1000:.1f};{current * 1000:.1f};{legacy / current:.2f}x')
@@ -2,10 +2,12 @@ from __future__ import print_function
 import datetime
 import os
 import sys
+import time
 from subprocess import check_call
 
 from django.conf import settings
-from django.db import connection
+from django.core import management
+from django.db import close_old_connections, connection
 
 import babis
 from apscheduler.schedulers.blocking import BlockingScheduler
@@ -16,14 +18,41 @@ from snippets.base.util import create_countries
 MANAGE = os.path.join(settings.ROOT, 'manage.py')
 schedule = BlockingScheduler()
 
-# Used by generate_bundles commands. This is intentionally here and not in
-# a persistent storage to force all bundle regeneration when we restart the
-# service, which is typically when we push new code.
-last_timestamp = 0
 
+def call_command(command, *args):
+    """Run management `command` with command line `args`.
 
-def call_command(command):
-    check_call('python {0} {1}'.format(MANAGE, command), shell=True)
+    Commands run in the clock process, saving the interpreter and Django
+    startup on every run, unless CRON_SUBPROCESS is set.
+
+    """
+    if settings.CRON_SUBPROCESS:
+        check_call([sys.executable, MANAGE, command, *args])
+        return
+
+    # Drop connections that are broken or older than CONN_MAX_AGE, before
+    # and after the command, like Django does around each request.
+    close_old_connections()
+    try:
+        management.call_command(command, *args)
+    finally:
+        close_old_connections()
+
+
+def cpu_time():
+    """Returns the CPU seconds to measure the jobs with.
+
+    The scheduler runs jobs concurrently in a thread pool, so commands
+    running in the clock process get measured with the CPU time of the
+    current thread, which excludes threads started by the command. Commands
+    running in subprocesses get measured with the CPU time of the
+    terminated children.
+
+    """
+    if settings.CRON_SUBPROCESS:
+        times = os.times()
+        return times.children_user + times.children_system
+    return time.thread_time()
 
 
 class scheduled_job(object):
@@ -42,13 +71,19 @@ class scheduled_job(object):
 
     def run(self):
         self.log('starting')
+        start_wall = time.monotonic()
+        start_cpu = cpu_time()
         try:
             self.callback()
         except Exception as e:
-            self.log('CRASHED: {}'.format(e))
+            self.log('CRASHED: {} ({})'.format(e, self.timings(start_wall, start_cpu)))
             raise
         else:
-            self.log('finished successfully')
+            self.log('finished successfully ({})'.format(self.timings(start_wall, start_cpu)))
+
+    def timings(self, start_wall, start_cpu):
+        return 'wall: {:.2f}s, cpu: {:.2f}s'.format(
+            time.monotonic() - start_wall, cpu_time() - start_cpu)
 
     def log(self, message):
         msg = '[{}] Clock job {}@{}: {}'.format(
@@ -68,14 +103,15 @@ def job_update_product_details():
 @scheduled_job('cron', month='*', day='*', hour='*', minute='*', max_instances=1, coalesce=True)
 @babis.decorator(ping_after=settings.DEAD_MANS_SNITCH_UPDATE_JOBS)
 def job_update_jobs():
-    global last_timestamp
     call_command('update_jobs')
-    utc_now = datetime.datetime.utcnow()
-    if last_timestamp:
-        call_command('generate_bundles --timestamp "{}"'.format(last_timestamp))
-    else:
-        call_command('generate_bundles')
-    last_timestamp = utc_now
+    # generate_bundles keeps a watermark in the database and regenerates all
+    # bundles when the code version changes, which is typically when we
+    # push new code.
+    call_command('generate_bundles', '--incremental')
+
+
+def job_send_slack_messages():
+    call_command('send_slack_messages')
 
 
 @babis.decorator(ping_after=settings.DEAD_MANS_SNITCH_FETCH_METRICS)
@@ -96,6 +132,11 @@ if settings.REDASH_API_KEY:
         'cron', month='*', day='*', hour='4', minute='0', max_instances=1, coalesce=True
     )(job_fetch_daily_metrics)
 
+if settings.SLACK_ENABLE:
+    scheduled_job(
+        'cron', month='*', day='*', hour='*', minute='*', max_instances=1, coalesce=True
+    )(job_send_slack_messages)
+
 
 def run():
     try:
@@ -1,8 +1,12 @@
 import csv
+import json
+import zlib
 from datetime import datetime
 
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import transaction
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 
 
 @transaction.atomic
@@ -12,19 +16,78 @@ def duplicate_snippets_action(modeladmin, request, queryset):
 duplicate_snippets_action.short_description = 'Duplicate selected snippets'  # noqa
 
 
-def export_as_csv(modeladmin, request, queryset):
-    """Adapted from https://books.agiliq.com/projects/django-admin-cookbook/en/latest/export.html"""
+class Echo:
+    """File-like object that returns what is written to it, for csv.writer."""
+    def write(self, value):
+        return value
+
+
+def _export_rows(queryset, field_names):
+    """Yields tuples of the values of `field_names` for every object in
+    `queryset`, fetching CSV_EXPORT_CHUNK_SIZE rows at a time.
+
+    """
+    return queryset.values_list(*field_names).iterator(
+        chunk_size=settings.CSV_EXPORT_CHUNK_SIZE)
+
+
+def _gzip(lines):
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for line in lines:
+        data = compressor.compress(line.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _export(modeladmin, queryset, extension, content_type, serialize, compress=False):
+    """Returns a StreamingHttpResponse with the fields of the objects in
+    `queryset`, each serialized as a line by `serialize`.
+
+    """
     meta = modeladmin.model._meta
     field_names = [field.name for field in meta.fields]
-    filename = f'{meta}-{datetime.today().strftime("%Y-%m-%d-%H-%M")}'
-
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename={}.csv'.format(filename)
-    writer = csv.writer(response)
+    filename = f'{meta}-{datetime.today().strftime("%Y-%m-%d-%H-%M")}.{extension}'
 
-    writer.writerow(field_names)
-    for obj in queryset:
-        writer.writerow([getattr(obj, field) for field in field_names])
+    lines = serialize(field_names, _export_rows(queryset, field_names))
+    if compress:
+        lines = _gzip(lines)
+        filename += '.gz'
+        content_type = 'application/gzip'
 
+    response = StreamingHttpResponse(lines, content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename={}'.format(filename)
     return response
+
+
+def _csv_lines(field_names, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(field_names)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _ndjson_lines(field_names, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(field_names, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def export_as_csv(modeladmin, request, queryset):
+    """Adapted from https://books.agiliq.com/projects/django-admin-cookbook/en/latest/export.html"""
+    return _export(modeladmin, queryset, 'csv', 'text/csv', _csv_lines)
 export_as_csv.short_description = 'Export Selected to CSV'  # noqa
+
+
+def export_as_csv_gzip(modeladmin, request, queryset):
+    return _export(modeladmin, queryset, 'csv', 'text/csv', _csv_lines, compress=True)
+export_as_csv_gzip.short_description = 'Export Selected to gzipped CSV'  # noqa
+
+
+def export_as_ndjson(modeladmin, request, queryset):
+    """Export one JSON object per line, keeping JSON fields like `details`
+    as JSON instead of their Python representation in CSV.
+
+    """
+    return _export(modeladmin, queryset, 'ndjson', 'application/x-ndjson', _ndjson_lines,
+                   compress=True)
+export_as_ndjson.short_description = 'Export Selected to gzipped NDJSON'  # noqa
@@ -4,7 +4,9 @@ import re
 from django.contrib import admin, messages
 from django.contrib.admin.utils import flatten_fieldsets
 from django.contrib.humanize.templatetags.humanize import intcomma
-from django.db.models import Sum, Q
+from django.db.models import (Count, ExpressionWrapper, F, FloatField, Func, IntegerField,
+                              OuterRef, Q, Subquery, Value)
+from django.db.models.functions import Cast, NullIf
 from django.http import HttpResponseRedirect
 from django.template.loader import get_template
 from django.urls import reverse
@@ -24,11 +26,26 @@ RESERVED_VARIABLES = ('_', 'snippet_id')
 
 
 class RelatedJobsMixin():
+    """Displays the number of related Jobs, counted for all objects in
+    `get_queryset`.
+
+    """
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        queryset = queryset.annotate(
+            published_jobs=Count(
+                'jobs', filter=Q(jobs__status=models.Job.PUBLISHED), distinct=True),
+            total_jobs=Count('jobs', distinct=True),
+        )
+        return queryset
+
     def related_published_jobs(self, obj):
-        return obj.jobs.filter(status=models.Job.PUBLISHED).count()
+        return obj.published_jobs
+    related_published_jobs.admin_order_field = 'published_jobs'
 
     def related_total_jobs(self, obj):
-        return obj.jobs.count()
+        return obj.total_jobs
+    related_total_jobs.admin_order_field = 'total_jobs'
 
     def jobs_list(self, obj):
         """List Related Jobs."""
@@ -41,12 +58,28 @@ class RelatedJobsMixin():
 
 
 class RelatedSnippetsMixin():
+    """Displays the number of related ASRSnippets and their Published Jobs,
+    counted for all objects in `get_queryset`.
+
+    """
+    def get_queryset(self, request):
+        return self.annotate_related_counts(super().get_queryset(request))
+
+    def annotate_related_counts(self, queryset):
+        return queryset.annotate(
+            published_jobs=Count(
+                'snippets__jobs', filter=Q(snippets__jobs__status=models.Job.PUBLISHED),
+                distinct=True),
+            total_snippets=Count('snippets', distinct=True),
+        )
+
     def related_published_jobs(self, obj):
-        return models.Job.objects.filter(
-            status=models.Job.PUBLISHED, snippet__in=obj.snippets.all()).count()
+        return obj.published_jobs
+    related_published_jobs.admin_order_field = 'published_jobs'
 
     def related_total_snippets(self, obj):
-        return obj.snippets.count()
+        return obj.total_snippets
+    related_total_snippets.admin_order_field = 'total_snippets'
 
     def snippet_list(self, obj):
         """List Related Snippets."""
@@ -58,6 +91,27 @@ class RelatedSnippetsMixin():
         )
 
 
+def _count_subquery(queryset):
+    """Returns a Subquery counting the distinct objects of `queryset`, which
+    can use OuterRef.
+
+    """
+    return Subquery(
+        queryset.order_by().values(
+            count=Func(F('pk'), template='COUNT(DISTINCT %(expressions)s)')),
+        output_field=IntegerField(),
+    )
+
+
+def _ratio(numerator, denominator):
+    """Returns `numerator` / `denominator` as a float, or NULL when the
+    denominator is zero."""
+    return ExpressionWrapper(
+        Cast(numerator, FloatField()) / NullIf(denominator, Value(0)),
+        output_field=FloatField(),
+    )
+
+
 class LogEntryAdmin(admin.ModelAdmin):
     list_display = ('user', 'content_type', 'object_id', 'object_repr', 'change_message')
     list_filter = ('user', 'content_type')
@@ -107,6 +161,24 @@ class IconAdmin(RelatedSnippetsMixin, admin.ModelAdmin):
         filters.IconRelatedPublishedASRSnippetFilter,
     ]
 
+    def annotate_related_counts(self, queryset):
+        # Icons relate to ASRSnippets through the Icon fields of each
+        # Template subclass.
+        def icon_query(prefix):
+            query = Q()
+            for lookup in models.Icon.get_template_lookups():
+                query |= Q(**{f'{prefix}template_relation__{lookup}': OuterRef('pk')})
+            return query
+
+        return queryset.annotate(
+            published_jobs=_count_subquery(
+                models.Job.objects
+                .filter(status=models.Job.PUBLISHED)
+                .filter(icon_query('snippet__'))
+            ),
+            total_snippets=_count_subquery(models.ASRSnippet.objects.filter(icon_query(''))),
+        )
+
     class Media:
         css = {
             'all': (
@@ -510,6 +582,7 @@ class ASRSnippetAdmin(admin.ModelAdmin):
     list_filter = [
         filters.TemplateFilter,
         ['locale', RelatedDropdownFilter],
+        filters.ASRSnippetLocaleCodeFilter,
         ['jobs__targets', RelatedOnlyDropdownFilter],
         'jobs__status',
         ['jobs__campaign', RelatedDropdownFilter],
@@ -766,7 +839,7 @@ class CampaignAdmin(RelatedJobsMixin, admin.ModelAdmin):
     ]
     list_filter = [
         filters.RelatedPublishedASRSnippetFilter,
-        filters.ChannelFilter,
+        filters.RelatedJobsChannelFilter,
     ]
 
     class Media:
@@ -823,7 +896,7 @@ class CategoryAdmin(RelatedSnippetsMixin, admin.ModelAdmin):
         'related_total_snippets',
     ]
     list_filter = [
-        filters.RelatedPublishedASRSnippetFilter,
+        filters.RelatedSnippetsPublishedASRSnippetFilter,
     ]
 
     class Media:
@@ -880,7 +953,7 @@ class ProductAdmin(RelatedSnippetsMixin, admin.ModelAdmin):
         'related_total_snippets',
     ]
     list_filter = [
-        filters.RelatedPublishedASRSnippetFilter,
+        filters.RelatedSnippetsPublishedASRSnippetFilter,
     ]
 
     class Media:
@@ -1047,6 +1120,7 @@ class JobAdmin(admin.ModelAdmin):
         ('campaign', RelatedDropdownFilter),
         ('targets', RelatedOnlyDropdownFilter),
         ('snippet__locale', RelatedOnlyDropdownFilter),
+        filters.LocaleCodeFilter,
         filters.ChannelFilter,
     ]
     search_fields = [
@@ -1219,42 +1293,52 @@ class JobAdmin(admin.ModelAdmin):
 
     def get_queryset(self, request):
         queryset = super().get_queryset(request)
+        # Read the totals maintained by the ETL instead of aggregating all
+        # JobDailyPerformance rows of each Job.
         queryset = queryset.annotate(
-            impressions=Sum('metrics__impression'),
-            adj_impressions=Sum('metrics__adj_impression'),
-            clicks=Sum('metrics__click'),
-            blocks=Sum('metrics__block'),
+            impressions=F('metrics_rollup__impression'),
+            adj_impressions=F('metrics_rollup__adj_impression'),
+            clicks=F('metrics_rollup__click'),
+            blocks=F('metrics_rollup__block'),
+            clicks_ratio=_ratio('metrics_rollup__click', 'metrics_rollup__adj_impression'),
+            blocks_ratio=_ratio('metrics_rollup__block', 'metrics_rollup__adj_impression'),
         )
         return queryset
 
     def impressions_humanized(self, obj):
         return intcomma(obj.impressions or 0)
+    impressions_humanized.admin_order_field = 'impressions'
     impressions_humanized.short_description = 'Impressions'
 
     def adj_impressions_humanized(self, obj):
         return intcomma(obj.adj_impressions or 0)
+    adj_impressions_humanized.admin_order_field = 'adj_impressions'
     adj_impressions_humanized.short_description = 'Adjusted Impressions'
 
     def clicks_humanized(self, obj):
         return intcomma(obj.clicks or 0)
+    clicks_humanized.admin_order_field = 'clicks'
     clicks_humanized.short_description = 'Clicks'
 
     def blocks_humanized(self, obj):
         return intcomma(obj.blocks or 0)
+    blocks_humanized.admin_order_field = 'blocks'
     blocks_humanized.short_description = 'Blocks'
 
     def clicks_ctr(self, obj):
-        if not (obj.clicks or obj.adj_impressions):
+        if not obj.adj_impressions:
             return 'N/A'
         ratio = (obj.clicks / obj.adj_impressions) * 100
         return format_html(f'<span class="">{ratio:.4f}%</span>')
+    clicks_ctr.admin_order_field = 'clicks_ratio'
     clicks_ctr.short_description = 'Adjusted CTR'
 
     def blocks_ctr(self, obj):
-        if not (obj.blocks or obj.adj_impressions):
+        if not obj.adj_impressions:
             return 'N/A'
         ratio = (obj.blocks / obj.adj_impressions) * 100
         return format_html(f'<span class="">{ratio:.4f}%</span>')
+    blocks_ctr.admin_order_field = 'blocks_ratio'
     blocks_ctr.short_description = 'Adjusted BR'
 
     def save_model(self, request, obj, form, change):
@@ -1432,6 +1516,8 @@ class JobDailyPerformanceAdmin(admin.ModelAdmin):
     ]
     actions = [
         actions.export_as_csv,
+        actions.export_as_csv_gzip,
+        actions.export_as_ndjson,
     ]
 
     def has_add_permission(self, request):
@@ -1458,6 +1544,8 @@ class DailyImpressionsAdmin(admin.ModelAdmin):
     ]
     actions = [
         actions.export_as_csv,
+        actions.export_as_csv_gzip,
+        actions.export_as_ndjson,
     ]
 
     def has_add_permission(self, request):
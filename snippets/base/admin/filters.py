@@ -41,8 +41,11 @@ class ModifiedFilter(admin.SimpleListFilter):
 
 
 class ChannelFilter(admin.SimpleListFilter):
+    """Filters Jobs by targeted channel. Subclass and set `field_path` to the
+    Target channels lookup of other models."""
     title = 'Channel'
     parameter_name = 'channel'
+    field_path = 'targets__filtr_channels'
 
     def lookups(self, request, model_admin):
         return (
@@ -57,9 +60,37 @@ class ChannelFilter(admin.SimpleListFilter):
         if self.value() is None:
             return queryset
 
-        if hasattr(queryset.model, 'jobs'):
-            return queryset.filter(jobs__targets__filtr_channels__contains=self.value()).distinct()
-        return queryset.filter(targets__filtr_channels__contains=self.value()).distinct()
+        return queryset.filter(**{f'{self.field_path}__contains': self.value()}).distinct()
+
+
+class RelatedJobsChannelFilter(ChannelFilter):
+    field_path = 'jobs__targets__filtr_channels'
+
+
+class LocaleCodeFilter(admin.SimpleListFilter):
+    """Filters Jobs by targeted locale code. Subclass and set `field_path` to
+    the Locale codes lookup of other models."""
+    title = 'Targeted Locale'
+    parameter_name = 'locale_code'
+    template = 'django_admin_listfilter_dropdown/dropdown_filter.html'
+    field_path = 'snippet__locale__codes'
+
+    def lookups(self, request, model_admin):
+        codes = set()
+        for locale_codes in models.Locale.objects.values_list('codes', flat=True):
+            codes.update(locale_codes)
+        return [(code, code) for code in sorted(codes)]
+
+    def queryset(self, request, queryset):
+        if self.value() is None:
+            return queryset
+
+        matching_codes = models.Locale.get_matching_codes(self.value())
+        return queryset.filter(**{f'{self.field_path}__overlap': matching_codes})
+
+
+class ASRSnippetLocaleCodeFilter(LocaleCodeFilter):
+    field_path = 'locale__codes'
 
 
 class TemplateFilter(admin.SimpleListFilter):
@@ -88,8 +119,11 @@ class TemplateFilter(admin.SimpleListFilter):
 
 
 class RelatedPublishedASRSnippetFilter(admin.SimpleListFilter):
+    """Filters models with related Jobs by whether a Job is Published.
+    Subclass and set `field_path` to the Job status lookup of other models."""
     title = 'Currently Published'
     parameter_name = 'is_currently_published'
+    field_path = 'jobs__status'
 
     def lookups(self, request, model_admin):
         return (
@@ -101,16 +135,15 @@ class RelatedPublishedASRSnippetFilter(admin.SimpleListFilter):
         if self.value() is None:
             return queryset
 
-        if hasattr(queryset.model, 'snippets'):
-            if self.value() == 'yes':
-                return queryset.filter(snippets__jobs__status=models.Job.PUBLISHED).distinct()
-            elif self.value() == 'no':
-                return queryset.exclude(snippets__jobs__status=models.Job.PUBLISHED).distinct()
-        else:
-            if self.value() == 'yes':
-                return queryset.filter(jobs__status=models.Job.PUBLISHED).distinct()
-            elif self.value() == 'no':
-                return queryset.exclude(jobs__status=models.Job.PUBLISHED).distinct()
+        published = {self.field_path: models.Job.PUBLISHED}
+        if self.value() == 'yes':
+            return queryset.filter(**published).distinct()
+        elif self.value() == 'no':
+            return queryset.exclude(**published).distinct()
+
+
+class RelatedSnippetsPublishedASRSnippetFilter(RelatedPublishedASRSnippetFilter):
+    field_path = 'snippets__jobs__status'
 
 
 class IconRelatedPublishedASRSnippetFilter(RelatedPublishedASRSnippetFilter):
@@ -118,11 +151,7 @@ class IconRelatedPublishedASRSnippetFilter(RelatedPublishedASRSnippetFilter):
         if self.value() is None:
             return queryset
 
-        icon_ids = []
-        for icon in queryset.all():
-            if icon.snippets.filter(jobs__status=models.Job.PUBLISHED).count():
-                icon_ids.append(icon.id)
-
+        icon_ids = models.Icon.get_used_icon_ids(snippet__jobs__status=models.Job.PUBLISHED)
         if self.value() == 'yes':
             return queryset.filter(id__in=icon_ids)
         elif self.value() == 'no':
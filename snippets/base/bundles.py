@@ -1,6 +1,10 @@
+import hashlib
 import itertools
 import json
 import os
+import time
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 from io import StringIO
 
@@ -8,6 +12,7 @@ import brotli
 from django.conf import settings
 from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
+from django.db import transaction
 from django.db.models import Q
 from product_details import product_details
 
@@ -16,7 +21,107 @@ from snippets.base import models
 
 def generate_bundles(timestamp=None, limit_to_locale=None,
                      limit_to_distribution_bundle=None, save_to_disk=True,
-                     stdout=StringIO()):
+                     skip_unchanged=False, workers=1, retries=0, stdout=StringIO()):
+    return _generate_bundles(
+        _query_bundle_jobs, timestamp=timestamp, limit_to_locale=limit_to_locale,
+        limit_to_distribution_bundle=limit_to_distribution_bundle, save_to_disk=save_to_disk,
+        skip_unchanged=skip_unchanged, workers=workers, retries=retries, stdout=stdout)
+
+
+def generate_bundles_single_pass(timestamp=None, limit_to_locale=None,
+                                 limit_to_distribution_bundle=None, save_to_disk=True,
+                                 skip_unchanged=False, workers=1, retries=0,
+                                 stdout=StringIO()):
+    """Generate the same bundles as `generate_bundles` in a bounded number of
+    queries.
+
+    All Published Jobs that belong to the DistributionBundles to process are
+    fetched at once along with everything needed to render them. Each Job is
+    rendered at most once and the rendered Jobs are then distributed to the
+    bundle files of each locale and DistributionBundle in memory.
+
+    """
+    return _generate_bundles(
+        _prefetch_bundle_jobs, timestamp=timestamp, limit_to_locale=limit_to_locale,
+        limit_to_distribution_bundle=limit_to_distribution_bundle, save_to_disk=save_to_disk,
+        skip_unchanged=skip_unchanged, workers=workers, retries=retries, stdout=stdout)
+
+
+def _generate_bundles(get_bundle_data, timestamp, limit_to_locale,
+                      limit_to_distribution_bundle, save_to_disk, skip_unchanged,
+                      workers, retries, stdout):
+    """Generate the bundle files selected by `timestamp` and the limits.
+
+    `get_bundle_data` gets the list of (distribution_bundle,
+    locales_to_process) tuples of the files to generate and returns a
+    function that returns the rendered Published Jobs of a DistributionBundle
+    and locale.
+
+    """
+    update_index = save_to_disk and not (limit_to_locale or limit_to_distribution_bundle)
+    changes, bundle_files = _bundle_files(
+        timestamp, limit_to_locale, limit_to_distribution_bundle, update_index, stdout)
+
+    stdout.write('Processing bundles…')
+    bundle_data = get_bundle_data(bundle_files)
+    writer = BundleWriter(skip_unchanged=skip_unchanged, workers=workers, retries=retries,
+                          stdout=stdout)
+    try:
+        for distribution_bundle, locales_to_process in bundle_files:
+            for locale_to_process in locales_to_process:
+                filename = 'Firefox/{locale}/{distribution}.json'.format(
+                    locale=locale_to_process,
+                    distribution=distribution_bundle.code_name,
+                )
+                filename = os.path.join(settings.MEDIA_BUNDLES_PREGEN_ROOT, filename)
+
+                # If DistributionBundle is not enabled, or if there are no
+                # Published Jobs for the locale / distribution
+                # combination, delete the current bundle file if it exists.
+                if save_to_disk and not distribution_bundle.enabled:
+                    writer.delete(filename)
+                    continue
+                data = bundle_data(distribution_bundle, locale_to_process)
+                if not data:
+                    writer.delete(filename)
+                    continue
+
+                if save_to_disk is True:
+                    writer.save(filename, data, locale_to_process,
+                                distribution_bundle.code_name)
+                else:
+                    return _bundle_content_file(
+                        data, locale_to_process, distribution_bundle.code_name)
+    finally:
+        if save_to_disk:
+            writer.close()
+
+    if update_index:
+        update_bundle_index(changes)
+
+    # If save_to_disk is False and we reach this point, it means that we didn't
+    # have any Jobs to return for the locale, channel, distribution combination.
+    # Return an empty bundle
+    if save_to_disk is False:
+        return _empty_bundle_content_file(limit_to_locale, limit_to_distribution_bundle)
+
+    return writer.counts
+
+
+def _bundle_files(timestamp, limit_to_locale, limit_to_distribution_bundle, update_index,
+                  stdout):
+    """Returns a tuple of the BundleChanges, or None, and the list of
+    (distribution_bundle, locales_to_process) tuples of the bundle files to
+    generate.
+
+    """
+    if timestamp and update_index:
+        stdout.write(
+            'Generating bundles with Jobs modified on or after {}'.format(timestamp)
+        )
+        changes = BundleChanges(timestamp)
+        return changes, changes.bundle_files()
+
     if not timestamp:
         stdout.write('Generating all bundles.')
         total_jobs = models.Job.objects.all()
@@ -29,17 +134,17 @@ def generate_bundles(timestamp=None, limit_to_locale=None,
             Q(distribution__distributionbundle__modified__gte=timestamp)
         ).distinct()
 
-    stdout.write('Processing bundles…')
     if limit_to_locale:
         all_locales_to_process = [
             limit_to_locale,
         ]
     else:
+        locale_codes = (total_jobs
+                        .order_by()
+                        .values_list('snippet__locale__codes', flat=True)
+                        .distinct())
         all_locales_to_process = set(
-            itertools.chain.from_iterable(
-                job.snippet.locale.code.strip(',').split(',')
-                for job in total_jobs
-            )
+            itertools.chain.from_iterable(codes for codes in locale_codes if codes)
         )
     distribution_bundles_to_process = models.DistributionBundle.objects.filter(
         distributions__jobs__in=total_jobs
@@ -49,83 +154,428 @@ def generate_bundles(timestamp=None, limit_to_locale=None,
         distribution_bundles_to_process = distribution_bundles_to_process.filter(
             name__iexact=limit_to_distribution_bundle
         )
+    locales_to_process = _file_locales(all_locales_to_process)
+    return None, [
+        (distribution_bundle, locales_to_process)
+        for distribution_bundle in
+        distribution_bundles_to_process.prefetch_related('distributions')
+    ]
 
-    for distribution_bundle in distribution_bundles_to_process:
-        distributions = distribution_bundle.distributions.all()
 
-        for locale in all_locales_to_process:
+def _query_bundle_jobs(bundle_files):
+    """Query and render the Jobs of each bundle file separately."""
+    def bundle_data(distribution_bundle, locale):
+        bundle_jobs = (
+            models.Job.objects
+            .filter(status=models.Job.PUBLISHED)
+            .filter(distribution__in=distribution_bundle.distributions.all())
+            .filter(snippet__locale__codes__overlap=models.Locale.get_matching_codes(locale))
+            .distinct()
+        )
+        return [job.render() for job in bundle_jobs]
 
-            all_jobs = (models.Job.objects
-                        .filter(status=models.Job.PUBLISHED)
-                        .filter(distribution__in=distributions))
+    return bundle_data
 
-            locales_to_process = [
-                key.lower() for key in product_details.languages.keys()
-                if key.lower().startswith(locale)
-            ]
 
-            for locale_to_process in locales_to_process:
-                filename = 'Firefox/{locale}/{distribution}.json'.format(
-                    locale=locale_to_process,
-                    distribution=distribution_bundle.code_name,
-                )
-                filename = os.path.join(settings.MEDIA_BUNDLES_PREGEN_ROOT, filename)
-                full_locale = ',{},'.format(locale_to_process.lower())
-                splitted_locale = ',{},'.format(locale_to_process.lower().split('-', 1)[0])
-                bundle_jobs = all_jobs.filter(
-                    Q(snippet__locale__code__contains=splitted_locale) |
-                    Q(snippet__locale__code__contains=full_locale)).distinct()
+def _prefetch_bundle_jobs(bundle_files):
+    """Fetch the Published Jobs of all bundle files at once and render each
+    Job at most once."""
+    distribution_bundles_to_process = [
+        distribution_bundle for distribution_bundle, locales in bundle_files
+    ]
+    published_jobs = list(
+        models.Job.objects
+        .filter(status=models.Job.PUBLISHED)
+        .filter(distribution__in=models.Distribution.objects.filter(
+            distributionbundle__in=distribution_bundles_to_process))
+        .select_related(*_job_render_related_fields())
+        .prefetch_related('targets')
+    )
 
-                # If DistributionBundle is not enabled, or if there are no
-                # Published Jobs for the locale / distribution
-                # combination, delete the current bundle file if it exists.
-                if save_to_disk and not distribution_bundle.enabled or not bundle_jobs.exists():
-                    if default_storage.exists(filename):
-                        stdout.write('Removing {}'.format(filename))
-                        default_storage.delete(filename)
-                    continue
+    job_locale_codes = {
+        job.id: set(job.snippet.locale.codes) if job.snippet.locale else set()
+        for job in published_jobs
+    }
+    rendered_jobs = {}
 
-                data = [
-                    job.render() for job in bundle_jobs
-                ]
-                bundle_content = json.dumps({
-                    'messages': data,
-                    'metadata': {
-                        'generated_at': datetime.utcnow().isoformat(),
-                        'number_of_snippets': len(data),
-                        'locale': locale_to_process,
-                        'distribution_bundle': distribution_bundle.code_name,
-                    }
-                })
-
-                # Convert str to bytes.
-                if isinstance(bundle_content, str):
-                    bundle_content = bundle_content.encode('utf-8')
-
-                if settings.BUNDLE_BROTLI_COMPRESS:
-                    content_file = ContentFile(brotli.compress(bundle_content))
-                    content_file.content_encoding = 'br'
-                else:
-                    content_file = ContentFile(bundle_content)
+    def _render(job):
+        if job.id not in rendered_jobs:
+            rendered_jobs[job.id] = job.render()
+        return rendered_jobs[job.id]
 
-                if save_to_disk is True:
-                    default_storage.save(filename, content_file)
-                    stdout.write('Writing bundle {}'.format(filename))
-                else:
-                    return content_file
+    def bundle_data(distribution_bundle, locale):
+        distribution_ids = {
+            distribution.id for distribution in distribution_bundle.distributions.all()
+        }
+        matching_codes = models.Locale.get_matching_codes(locale)
+        return [
+            _render(job) for job in published_jobs
+            if (job.distribution_id in distribution_ids and
+                not job_locale_codes[job.id].isdisjoint(matching_codes))
+        ]
 
-    # If save_to_disk is False and we reach this point, it means that we didn't
-    # have any Jobs to return for the locale, channel, distribution combination.
-    # Return an empty bundle
-    if save_to_disk is False:
-        return ContentFile(
-            json.dumps({
-                'messages': [],
-                'metadata': {
-                    'generated_at': datetime.utcnow().isoformat(),
-                    'number_of_snippets': 0,
-                    'locale': limit_to_locale,
-                    'distribution_bundle': limit_to_distribution_bundle,
-                }
-            })
+    return bundle_data
+
+
+def _file_locales(locale_codes):
+    """Returns the locales of the bundle files to generate for Jobs with
+    `locale_codes`.
+
+    """
+    languages = [key.lower() for key in product_details.languages.keys()]
+    return list(dict.fromkeys(
+        language
+        for locale in locale_codes
+        for language in languages
+        if language.startswith(locale)
+    ))
+
+
+def job_bundle_files(job_ids=None):
+    """Returns a dict of Published Job IDs to the locales and DistributionBundle
+    IDs of the bundle files each Job is part of.
+
+    Limited to the Jobs in `job_ids` if set.
+
+    """
+    bundles_by_distribution = defaultdict(set)
+    through_model = models.DistributionBundle.distributions.through
+    for bundle_id, distribution_id in through_model.objects.values_list(
+            'distributionbundle_id', 'distribution_id'):
+        bundles_by_distribution[distribution_id].add(bundle_id)
+
+    languages = {
+        language: set(models.Locale.get_matching_codes(language))
+        for language in (key.lower() for key in product_details.languages.keys())
+    }
+
+    jobs = models.Job.objects.filter(status=models.Job.PUBLISHED)
+    if job_ids is not None:
+        jobs = jobs.filter(id__in=job_ids)
+
+    files = {}
+    for job_id, distribution_id, codes in jobs.values_list(
+            'id', 'distribution_id', 'snippet__locale__codes'):
+        codes = set(codes or [])
+        locales = {
+            language for language, matching_codes in languages.items()
+            if not codes.isdisjoint(matching_codes)
+        }
+        bundle_ids = bundles_by_distribution[distribution_id]
+        if locales and bundle_ids:
+            files[job_id] = (locales, set(bundle_ids))
+    return files
+
+
+class BundleChanges:
+    """The bundle files affected by changes since `timestamp`.
+
+    Jobs with a snippet or DistributionBundle modified since `timestamp`, Jobs
+    recorded in the JobBundleIndex of those DistributionBundles and deleted
+    Jobs are changed. The affected files are the files changed Jobs were part
+    of, according to the JobBundleIndex, and the files they are part of now.
+
+    """
+    def __init__(self, timestamp):
+        modified_bundles = list(
+            models.DistributionBundle.objects
+            .filter(modified__gte=timestamp)
+            .values_list('id', flat=True)
         )
+        job_ids = set(
+            models.Job.objects
+            .filter(Q(snippet__modified__gte=timestamp) |
+                    Q(distribution__distributionbundle__in=modified_bundles))
+            .values_list('id', flat=True)
+        )
+
+        previous_query = (Q(job_id__in=job_ids) |
+                          ~Q(job_id__in=models.Job.objects.values('id')))
+        if modified_bundles:
+            previous_query |= Q(distribution_bundles__overlap=modified_bundles)
+        self.previous = {
+            entry.job_id: (set(entry.locales), set(entry.distribution_bundles))
+            for entry in models.JobBundleIndex.objects.filter(previous_query)
+        }
+
+        self.job_ids = job_ids | set(self.previous)
+        self.current = job_bundle_files(self.job_ids)
+
+    def bundle_files(self):
+        """Returns a list of DistributionBundles and the locales of their
+        files to generate.
+
+        """
+        files = defaultdict(set)
+        for job_id in self.job_ids:
+            for job_files in [self.previous.get(job_id), self.current.get(job_id)]:
+                if not job_files:
+                    continue
+                locales, bundle_ids = job_files
+                for bundle_id in bundle_ids:
+                    files[bundle_id].update(locales)
+
+        distribution_bundles = (models.DistributionBundle.objects
+                                .filter(id__in=files)
+                                .order_by('id')
+                                .prefetch_related('distributions'))
+        return [
+            (distribution_bundle, sorted(files[distribution_bundle.id]))
+            for distribution_bundle in distribution_bundles
+        ]
+
+
+def update_bundle_index(changes=None):
+    """Record the bundle files of the Jobs in `changes`, or of all Jobs, in the
+    JobBundleIndex.
+
+    """
+    with transaction.atomic():
+        if changes is None:
+            files = job_bundle_files()
+            models.JobBundleIndex.objects.all().delete()
+        else:
+            files = changes.current
+            models.JobBundleIndex.objects.filter(job_id__in=changes.job_ids).delete()
+
+        models.JobBundleIndex.objects.bulk_create([
+            models.JobBundleIndex(
+                job_id=job_id,
+                locales=sorted(locales),
+                distribution_bundles=sorted(bundle_ids),
+            )
+            for job_id, (locales, bundle_ids) in files.items()
+        ], batch_size=1000)
+
+
+class BundleWriter:
+    """Writes and deletes bundle files in `default_storage`.
+
+    With `skip_unchanged` a SHA-256 digest of the `messages` of each bundle
+    is kept in a manifest stored next to MEDIA_BUNDLES_PREGEN_ROOT. Bundles
+    with the same digest as the one recorded in the manifest are not written
+    again, to avoid needless uploads and CDN cache invalidations. The
+    `generated_at` metadata is not part of the digest.
+
+    Without `skip_unchanged` every bundle gets written and the manifest is
+    removed when bundle files change, since it no longer describes them.
+
+    With more than one `workers` compression and storage operations run in a
+    thread pool. Results are logged in the order bundles were handed to the
+    writer. Each storage operation is tried `retries` more times before it
+    is considered failed. The first failure is raised on `close()`, after all
+    other operations have finished and the manifest is stored.
+
+    """
+    RETRY_DELAY = 1  # In seconds, multiplied by the number of the attempt.
+
+    def __init__(self, skip_unchanged=False, workers=1, retries=0, stdout=StringIO()):
+        self.skip_unchanged = skip_unchanged
+        self.retries = retries
+        self.stdout = stdout
+        self.counts = {
+            'written': 0,
+            'skipped': 0,
+            'deleted': 0,
+        }
+        self._manifest = None
+        self._manifest_changed = False
+        self._executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+        self._pending = []
+        self._failures = []
+
+    @property
+    def manifest(self):
+        if self._manifest is None:
+            self._manifest = self._load_manifest()
+        return self._manifest
+
+    def _load_manifest(self):
+        filename = settings.MEDIA_BUNDLES_PREGEN_MANIFEST
+        if not default_storage.exists(filename):
+            return {}
+
+        with default_storage.open(filename) as manifest_file:
+            try:
+                return json.loads(manifest_file.read())['bundles']
+            except (ValueError, KeyError):
+                self.stdout.write('Ignoring invalid manifest {}'.format(filename))
+                return {}
+
+    def save(self, filename, data, locale, distribution_bundle):
+        digest = None
+        if self.skip_unchanged:
+            digest = bundle_digest(data, locale, distribution_bundle)
+            if self.manifest.get(filename) == digest:
+                self.counts['skipped'] += 1
+                return
+
+        self._submit('save', filename, digest, self._save,
+                     filename, data, locale, distribution_bundle)
+
+    def delete(self, filename):
+        self._submit('delete', filename, None, self._delete, filename)
+
+    def _submit(self, action, filename, digest, fn, *args):
+        if self._executor:
+            future = self._executor.submit(self._with_retries, fn, *args)
+        else:
+            future = Future()
+            try:
+                future.set_result(self._with_retries(fn, *args))
+            except Exception as exp:
+                future.set_exception(exp)
+
+        self._pending.append((action, filename, digest, future))
+        if not self._executor:
+            self._process_pending()
+
+    def _with_retries(self, fn, *args):
+        attempt = 0
+        while True:
+            try:
+                return fn(*args)
+            except Exception:
+                attempt += 1
+                if attempt > self.retries:
+                    raise
+                time.sleep(self.RETRY_DELAY * attempt)
+
+    def _save(self, filename, data, locale, distribution_bundle):
+        content_file = _bundle_content_file(data, locale, distribution_bundle)
+        default_storage.save(filename, content_file)
+        return True
+
+    def _delete(self, filename):
+        if default_storage.exists(filename):
+            default_storage.delete(filename)
+            return True
+        return False
+
+    def _process_pending(self):
+        """Log and account the results of pending operations in the order they
+        were submitted.
+
+        """
+        for action, filename, digest, future in self._pending:
+            try:
+                changed = future.result()
+            except Exception as exp:
+                self.stdout.write('Failed to {} bundle {}: {}'.format(action, filename, exp))
+                self._failures.append(exp)
+                # The file is in an unknown state, forget its digest.
+                changed = False
+                if self.skip_unchanged and self.manifest.pop(filename, None):
+                    self._manifest_changed = True
+
+            if action == 'save' and changed:
+                self.stdout.write('Writing bundle {}'.format(filename))
+                self.counts['written'] += 1
+                if self.skip_unchanged:
+                    self.manifest[filename] = digest
+                self._manifest_changed = True
+            elif action == 'delete':
+                if changed:
+                    self.stdout.write('Removing {}'.format(filename))
+                    self.counts['deleted'] += 1
+                    self._manifest_changed = True
+                if self.skip_unchanged and self.manifest.pop(filename, None):
+                    self._manifest_changed = True
+
+        self._pending = []
+
+    def close(self):
+        """Wait for pending operations and store the manifest if bundles got
+        written or deleted.
+
+        """
+        if self._executor:
+            self._executor.shutdown(wait=True)
+        self._process_pending()
+
+        if self._manifest_changed:
+            filename = settings.MEDIA_BUNDLES_PREGEN_MANIFEST
+            if self.skip_unchanged:
+                manifest = json.dumps({'bundles': self.manifest}, sort_keys=True, indent=2)
+                default_storage.save(filename, ContentFile(manifest.encode('utf-8')))
+            elif default_storage.exists(filename):
+                default_storage.delete(filename)
+            self._manifest_changed = False
+
+        if self._failures:
+            raise self._failures[0]
+
+
+def bundle_digest(data, locale, distribution_bundle):
+    """Returns a hex SHA-256 digest of a bundle as `_bundle_content_file` writes it.
+
+    Everything that shapes the file besides `generated_at` goes in, so
+    toggling `BUNDLE_BROTLI_COMPRESS` rewrites bundles in the new encoding.
+    """
+    content = json.dumps({
+        'messages': data,
+        'locale': locale,
+        'distribution_bundle': distribution_bundle,
+        'brotli_compress': settings.BUNDLE_BROTLI_COMPRESS,
+    }, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(content).hexdigest()
+
+
+def _job_render_related_fields():
+    """Returns the `select_related` lookups needed to render a Job without
+    further queries, including the Template subclass of the Job's snippet and
+    its Icons.
+
+    """
+    fields = [
+        'campaign',
+        'snippet__locale',
+        'snippet__template_relation',
+    ]
+    for relation in models.Template._meta.fields_map.values():
+        if not issubclass(relation.related_model, models.Template):
+            continue
+        template_lookup = 'snippet__template_relation__{}'.format(relation.name)
+        fields.append(template_lookup)
+        for field in relation.related_model._meta.fields:
+            if field.is_relation and field.related_model is models.Icon:
+                fields.append('{}__{}'.format(template_lookup, field.name))
+    return fields
+
+
+def _bundle_content_file(data, locale, distribution_bundle):
+    bundle_content = json.dumps({
+        'messages': data,
+        'metadata': {
+            'generated_at': datetime.utcnow().isoformat(),
+            'number_of_snippets': len(data),
+            'locale': locale,
+            'distribution_bundle': distribution_bundle,
+        }
+    })
+
+    # Convert str to bytes.
+    if isinstance(bundle_content, str):
+        bundle_content = bundle_content.encode('utf-8')
+
+    if settings.BUNDLE_BROTLI_COMPRESS:
+        content_file = ContentFile(brotli.compress(bundle_content))
+        content_file.content_encoding = 'br'
+    else:
+        content_file = ContentFile(bundle_content)
+
+    return content_file
+
+
+def _empty_bundle_content_file(locale, distribution_bundle):
+    return ContentFile(
+        json.dumps({
+            'messages': [],
+            'metadata': {
+                'generated_at': datetime.utcnow().isoformat(),
+                'number_of_snippets': 0,
+                'locale': locale,
+                'distribution_bundle': distribution_bundle,
+            }
+        })
+    )
@@ -0,0 +1,165 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Max
+
+
+class RenderCache:
+    """Memoizes ASRSnippet renders in a Django cache.
+
+    The cached value is the snippet's `PlaceholderTemplate`, which gets
+    shared by all Jobs of the snippet.
+
+    Renders are keyed on the snippet's primary key and `modified` date. The
+    `update_asrsnippet_modified_date` signal updates `modified` whenever the
+    snippet's template, icons, campaigns or targets change, so a changed
+    snippet never matches an older entry and entries never need to be
+    invalidated. Old entries get evicted by the cache backend, e.g. in least
+    recently used order with LocMemCache. GIT_SHA is part of the key so that
+    renders of previous code versions are not reused after a deployment.
+
+    Set SNIPPET_RENDER_CACHE to an empty string to disable.
+
+    """
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(settings.SNIPPET_RENDER_CACHE)
+
+    def get_key(self, snippet):
+        return 'asrsnippet-render:{}:{}:{}'.format(
+            settings.GIT_SHA, snippet.pk, snippet.modified.isoformat())
+
+    def get_or_render(self, snippet, render):
+        """Returns the cached render of `snippet` or calls `render()` and
+        caches the result.
+
+        Values are pickled by Django's cache backends so callers can modify
+        the returned data.
+
+        """
+        if not self.enabled or not (snippet.pk and snippet.modified):
+            return render()
+
+        cache = caches[settings.SNIPPET_RENDER_CACHE]
+        key = self.get_key(snippet)
+        rendered = cache.get(key)
+        if rendered is not None:
+            self._count(hit=True)
+            return rendered
+
+        self._count(hit=False)
+        rendered = render()
+        cache.set(key, rendered, timeout=None)
+        return rendered
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @property
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+class BundleCache:
+    """Caches the bundles generated on request in INSTANT_BUNDLE_GENERATION
+    mode.
+
+    Bundles are kept per process, in least recently used order, keyed on
+    locale and distribution bundle. Each entry records the watermark of the
+    data it was generated from, i.e. the latest `modified` date and the
+    number of ASRSnippets and DistributionBundles. Saving Jobs, Templates,
+    Targets, Campaigns, Icons and Locales, and deleting Jobs, updates their
+    ASRSnippets' `modified` date, so a different watermark means that
+    bundles need to be generated again. Bundles are cached as the
+    bytes returned to clients, compressed if BUNDLE_BROTLI_COMPRESS is set.
+
+    Set INSTANT_BUNDLE_CACHE to a cache alias to also share bundles between
+    processes.
+
+    """
+    def __init__(self):
+        self._bundles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_watermark(self):
+        # Imported here since models use `render_cache`.
+        from snippets.base.models import ASRSnippet, DistributionBundle
+
+        # Counts change when objects that aren't the most recently modified
+        # get deleted.
+        snippets = ASRSnippet.objects.aggregate(modified=Max('modified'), count=Count('id'))
+        distribution_bundles = DistributionBundle.objects.aggregate(
+            modified=Max('modified'), count=Count('id'))
+        return '{}:{}:{}:{}'.format(
+            snippets['modified'], snippets['count'],
+            distribution_bundles['modified'], distribution_bundles['count'],
+        )
+
+    def get_or_generate(self, locale, distribution, generate):
+        """Returns a `(content, content_encoding)` tuple for the bundle.
+
+        Calls `generate()` to get the bundle's ContentFile if there's no
+        bundle for the current watermark.
+
+        """
+        key = 'bundle:{}:{}:{}'.format(settings.GIT_SHA, locale, distribution)
+        watermark = self.get_watermark()
+
+        with self._lock:
+            bundle = self._bundles.get(key)
+            if bundle:
+                self._bundles.move_to_end(key)
+        if bundle and bundle['watermark'] == watermark:
+            return bundle['content'], bundle['content_encoding']
+
+        bundle = None
+        if settings.INSTANT_BUNDLE_CACHE:
+            bundle = caches[settings.INSTANT_BUNDLE_CACHE].get(key)
+
+        if not bundle or bundle['watermark'] != watermark:
+            content_file = generate()
+            content = content_file.read()
+            if isinstance(content, str):
+                content = content.encode('utf-8')
+            bundle = {
+                'watermark': watermark,
+                'content': content,
+                'content_encoding': getattr(content_file, 'content_encoding', None),
+            }
+            if settings.INSTANT_BUNDLE_CACHE:
+                caches[settings.INSTANT_BUNDLE_CACHE].set(key, bundle, timeout=None)
+
+        with self._lock:
+            self._bundles[key] = bundle
+            self._bundles.move_to_end(key)
+            while len(self._bundles) > settings.INSTANT_BUNDLE_CACHE_MAX_ENTRIES:
+                self._bundles.popitem(last=False)
+
+        return bundle['content'], bundle['content_encoding']
+
+    def clear(self):
+        with self._lock:
+            self._bundles.clear()
+
+
+render_cache = RenderCache()
+bundle_cache = BundleCache()
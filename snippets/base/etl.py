@@ -1,13 +1,16 @@
 import collections
+import itertools
 import json
 from datetime import timedelta
 
 from django.conf import settings
+from django.db import connection
 from django.db.models import Sum, Q
 from django.db.transaction import atomic
 from redash_dynamic_query import RedashDynamicQuery
 
-from snippets.base.models import CHANNELS, DailyImpressions, JobDailyPerformance, Job
+from snippets.base.models import (CHANNELS, DailyImpressions, JobDailyPerformance,
+                                  JobDailyPerformanceDetail, Job, JobMetricsRollup)
 
 
 REDASH_QUERY_IDS = {
@@ -20,6 +23,23 @@ REDASH_QUERY_IDS = {
     'redshift-impressions': 68345,
 }
 
+# Key of the Postgres advisory lock serializing JobMetricsRollup updates,
+# since fetch_daily_metrics imports dates concurrently.
+ROLLUP_LOCK_ID = 5_163_001
+
+# Telemetry event names and their normalized names.
+NORMALIZED_EVENTS = {
+    'CLICK_BUTTON': 'click',
+    'CLICK': 'click',
+    'IMPRESSION': 'impression',
+    'BLOCK': 'block',
+    'DISMISS': 'dismiss',
+    'scene1-button-learn-more': 'go_to_scene2',
+    'subscribe-success': 'subscribe_success',
+    'subscribe-error': 'subscribe_error',
+    'conversion-subscribe-activation': 'conversion_subscribe_activation',
+}
+
 redash = RedashDynamicQuery(
     endpoint=settings.REDASH_ENDPOINT,
     apikey=settings.REDASH_API_KEY,
@@ -27,6 +47,15 @@ redash = RedashDynamicQuery(
 
 
 def redash_rows(query_name, **params):
+    """Returns the list of rows of Redash query `query_name`.
+
+    The rows are not streamed: `RedashDynamicQuery` decodes the whole
+    query result at once, so peak memory still grows with the number of
+    rows of a day. Parsing incrementally needs the result fetched with
+    `requests` directly and an incremental JSON parser, which is not a
+    dependency yet.
+
+    """
     query_id = REDASH_QUERY_IDS[query_name]
     for k, v in params.items():
         params[k] = str(v)
@@ -43,16 +72,25 @@ def process_rows(rows, date, key='message_id'):
         # Or completed during the last 7 days from date
         Q(completed_on__gte=date - timedelta(days=7))
     )
-    job_ids = [str(x) for x in jobs.values_list('id', flat=True)]
-    new_rows = []
-    for row in sorted(rows, key=lambda x: x[key]):
+    job_ids = {str(x) for x in jobs.values_list('id', flat=True)}
+    return aggregate_rows(rows, job_ids, key=key)
+
+
+def normalize_rows(rows, job_ids):
+    """Yield normalized copies of the Redash `rows` of Jobs in `job_ids`.
+
+    Rows can be any iterable, they are processed one at a time.
+
+    """
+    for row in rows:
         # Remove rows with invalid Job IDs
         if row['message_id'] not in job_ids:
             continue
 
+        event_context = row['event_context']
         # Redash uses {} instead of null
-        if row['event_context'] == '{}':
-            row['event_context'] = ''
+        if event_context == '{}':
+            event_context = ''
 
         # Sometimes data in Telemetry populate `event_context`, some
         # other times it uses `additional_properties['value']` to
@@ -61,36 +99,21 @@ def process_rows(rows, date, key='message_id'):
         properties = json.loads(row.get('additional_properties', '{}'))
 
         # Fundraising metrics need special treatment.
-        if row['event_context'] == 'EOYSnippetForm' and row['event'] == 'CLICK_BUTTON':
+        if event_context == 'EOYSnippetForm' and row['event'] == 'CLICK_BUTTON':
             event = 'CLICK'
         else:
-            event = row['event_context'] or properties.get('value', '') or row['event']
-
-        if event in ['CLICK_BUTTON', 'CLICK']:
-            event = 'click'
-        elif event == 'IMPRESSION':
-            event = 'impression'
-        elif event == 'BLOCK':
-            event = 'block'
-        elif event == 'DISMISS':
-            event = 'dismiss'
-        elif event == 'scene1-button-learn-more':
-            event = 'go_to_scene2'
-        elif event in ['subscribe-success',
-                       'subscribe-error',
-                       'conversion-subscribe-activation']:
-            event = event.replace('-', '_')
-        else:
+            event = event_context or properties.get('value', '') or row['event']
+
+        event = NORMALIZED_EVENTS.get(event)
+        if not event:
             # Ignore invalid event
             continue
 
-        row['event'] = event
-
         # Normalize channel name, based on what kind of snippets they get.
         channel = row['channel']
         if not channel:
             channel = 'release'
-        row['channel'] = next(
+        channel = next(
             (item for item in CHANNELS if
              channel.startswith(item)), 'release'
         )
@@ -98,47 +121,56 @@ def process_rows(rows, date, key='message_id'):
         # Normalize country
         country_code = row['country_code']
         if country_code in ['ERROR', None]:
-            row['country_code'] = 'XX'
+            country_code = 'XX'
+
+        normalized_row = {
+            k: v for k, v in row.items() if k not in ['event_context', 'additional_properties']
+        }
+        normalized_row.update({
+            'event': event,
+            'channel': channel,
+            'country_code': country_code,
+        })
+        yield normalized_row
 
-        # Not needed anymore
-        row.pop('event_context', None)
-        row.pop('additional_properties', None)
 
-        new_rows.append(row)
+def aggregate_rows(rows, job_ids, key='message_id'):
+    """Aggregate the counts of Redash `rows` per `key`, i.e. per Job.
 
-    # Aggregate counts of same events for the global count.
+    Details are aggregated per event, channel and country. Rows are
+    normalized one at a time by `normalize_rows` and merged using dict
+    lookups, without copying or sorting the list of rows. The Redash
+    results themselves are still loaded in full by `redash_rows`.
+
+    """
     processed = collections.defaultdict(dict)
-    for row in new_rows:
+    details = {}
+    for row in normalize_rows(rows, job_ids):
         event = row['event']
-        processed[row[key]][event] = processed[row[key]].get(event, 0) + row['counts']
+        metrics = processed[row[key]]
+        metrics[event] = metrics.get(event, 0) + row['counts']
         if event == 'impression':
-            processed[row[key]]['impression_no_clients_total'] = (
-                processed[row[key]].get('impression_no_clients_total', 0) +
+            metrics['impression_no_clients_total'] = (
+                metrics.get('impression_no_clients_total', 0) +
                 row['no_clients_total']
             )
 
-        detail = [{
-            'event': row['event'],
-            'channel': row['channel'],
-            'country': row['country_code'],
-            'counts': row['counts'],
-            'no_clients': row['no_clients'],
-            'no_clients_total': row['no_clients_total'],
-        }]
-
-        if not processed[row[key]].get('details'):
-            processed[row[key]]['details'] = detail
+        detail_key = (row[key], event, row['channel'], row['country_code'])
+        detail = details.get(detail_key)
+        if detail:
+            detail['counts'] += row['counts']
+            detail['no_clients'] += row['no_clients']
+            detail['no_clients_total'] += row['no_clients_total']
         else:
-            for drow in processed[row[key]]['details']:
-                if ((drow['event'] == row['event'] and
-                     drow['channel'] == row['channel'] and
-                     drow['country'] == row['country_code'])):
-                    drow['counts'] += row['counts']
-                    drow['no_clients'] += row['no_clients']
-                    drow['no_clients_total'] += row['no_clients_total']
-                    break
-            else:
-                processed[row[key]]['details'] += detail
+            detail = details[detail_key] = {
+                'event': event,
+                'channel': row['channel'],
+                'country': row['country_code'],
+                'counts': row['counts'],
+                'no_clients': row['no_clients'],
+                'no_clients_total': row['no_clients_total'],
+            }
+            metrics.setdefault('details', []).append(detail)
 
     # Last pass for multi-scene snippets: Click events here refer to
     #  clicks of secondary links listed on the template that go to
@@ -163,7 +195,7 @@ def process_rows(rows, date, key='message_id'):
 
 def update_job_metrics(date):
     tomorrow = date + timedelta(days=1)
-    rows = redash_rows('bq-job', date=date)
+    rows = [redash_rows('bq-job', date=date)]
     # Find all finished Jobs with Impressions but no total clients
     # that completed on `date`
     query = (Job.objects
@@ -182,24 +214,88 @@ def update_job_metrics(date):
         if (job.completed_on - job.publish_start).days > 30:
             continue
 
-        rows += redash_rows(
+        rows.append(redash_rows(
             'bq-total-clients',
             message_id=job.id,
             start_date=job.publish_start,
-            end_date=job.completed_on)
+            end_date=job.completed_on))
 
-    processed = process_rows(rows, date, key='message_id')
-    with atomic():
-        JobDailyPerformance.objects.filter(date=date).delete()
-        for job, data in processed.items():
-            JobDailyPerformance.objects.create(
-                date=date,
-                job=Job.objects.get(id=job),
-                **data
-            )
+    processed = process_rows(itertools.chain.from_iterable(rows), date, key='message_id')
+    save_job_metrics(date, processed)
     return len(processed) > 0
 
 
+def save_job_metrics(date, processed):
+    """Replace the JobDailyPerformance objects of `date`, and their
+    JobDailyPerformanceDetail rows, with `processed` metrics, keyed on Job
+    ID.
+
+    Objects get inserted in bulk with the same adjusted values `save()`
+    would set, calculating the adjusted percentages once for `date`.
+
+    """
+    adj_percentages = JobDailyPerformance.get_adj_percentages(date)
+    metrics = []
+    for job_id, data in processed.items():
+        metric = JobDailyPerformance(date=date, job_id=int(job_id), **data)
+        metric.set_adj_percentages(adj_percentages)
+        metric.set_adj_impression()
+        metrics.append(metric)
+
+    with atomic():
+        replaced = JobDailyPerformance.objects.filter(date=date)
+        job_ids = set(replaced.values_list('job_id', flat=True))
+        job_ids.update(metric.job_id for metric in metrics)
+        # Deletes their JobDailyPerformanceDetail rows too.
+        replaced.delete()
+        JobDailyPerformance.objects.bulk_create(metrics, batch_size=1000)
+        JobDailyPerformanceDetail.objects.bulk_create(
+            itertools.chain.from_iterable(metric.get_detail_rows() for metric in metrics),
+            batch_size=1000)
+        update_job_metrics_rollups(job_ids)
+
+
+def update_job_metrics_rollups(job_ids=None):
+    """Recalculate the JobMetricsRollup totals and details of Jobs in
+    `job_ids`, or of all Jobs if `job_ids` is None.
+
+    Returns the number of rollups stored.
+
+    """
+    metrics = JobDailyPerformance.objects.order_by()
+    rollups = JobMetricsRollup.objects.all()
+    if job_ids is not None:
+        if not job_ids:
+            return 0
+        metrics = metrics.filter(job_id__in=job_ids)
+        rollups = rollups.filter(job_id__in=job_ids)
+
+    totals = (metrics
+              .values('job_id')
+              .annotate(total_impression=Sum('impression'),
+                        total_adj_impression=Sum('adj_impression'),
+                        total_click=Sum('click'),
+                        total_block=Sum('block')))
+
+    with atomic():
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [ROLLUP_LOCK_ID])
+        details = JobMetricsRollup.aggregate_details(job_ids)
+        new_rollups = [
+            JobMetricsRollup(job_id=total['job_id'],
+                             impression=total['total_impression'],
+                             adj_impression=total['total_adj_impression'],
+                             click=total['total_click'],
+                             block=total['total_block'],
+                             details=details.get(total['job_id'], []))
+            for total in totals
+        ]
+        rollups.delete()
+        JobMetricsRollup.objects.bulk_create(new_rollups, batch_size=1000)
+
+    return len(new_rollups)
+
+
 def update_impressions(date):
     """Fetch number of Impressions per channel and per duration.
 
@@ -18,6 +18,10 @@ class JobFilter(django_filters.FilterSet):
         queryset=models.Locale.objects.all(),
         field_name='snippet__locale',
     )
+    locale_code = django_filters.CharFilter(
+        label='Locale Code',
+        method='filter_locale_code',
+    )
     only_scheduled = django_filters.ChoiceFilter(
         label='Include',
         method='filter_scheduled',
@@ -55,6 +59,16 @@ class JobFilter(django_filters.FilterSet):
                 Q(id=value)
             )
 
+    def filter_locale_code(self, queryset, name, value):
+        # Filter Jobs targeting the locale code, e.g. `es-mx` matches Jobs
+        # with `es` or `es-mx` Locales.
+        if not value:
+            return queryset
+
+        return queryset.filter(
+            snippet__locale__codes__overlap=models.Locale.get_matching_codes(value)
+        )
+
     def filter_scheduled(self, queryset, name, value):
         if value == 'all':
             return queryset
@@ -1,13 +1,33 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime, timedelta
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+import sentry_sdk
 
 from snippets.base import etl, models
 
 METRICS_START_DATE = date(2019, 10, 1)
 
 
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def _in_thread(fn, *args):
+    try:
+        return fn(*args)
+    except Exception as exp:
+        # Capture the exception and let other dates get fetched.
+        sentry_sdk.capture_exception(exp)
+        return False
+    finally:
+        # Each thread uses its own database connection, close it when done.
+        connection.close()
+
+
 class Command(BaseCommand):
     args = "(no args)"
     help = "Fetch daily Job metrics"
@@ -17,48 +37,93 @@ class Command(BaseCommand):
             '--date',
             help='Fetch data for date. Defaults to yesterday. In YYYY-MM-DD format.',
         )
+        parser.add_argument(
+            '--from',
+            dest='from_date',
+            help=('Fetch missing data from date. Defaults to the date metrics start. '
+                  'In YYYY-MM-DD format.'),
+        )
+        parser.add_argument(
+            '--to',
+            dest='to_date',
+            help='Fetch missing data up to date, included. Defaults to yesterday. '
+                 'In YYYY-MM-DD format.',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.REDASH_FETCH_WORKERS,
+            help='Number of dates to fetch concurrently.',
+        )
 
     def handle(self, *args, **options):
         if not settings.REDASH_API_KEY:
             raise CommandError('Enviroment variable REDASH_API_KEY is required.')
 
-        dates = []
-
         if options['date']:
-            dates.append(datetime.strptime(options['date'], '%Y-%m-%d').date())
+            dates = [parse_date(options['date'])]
         else:
-            today = date.today()
-            try:
-                fetched_dates = (models.JobDailyPerformance.objects
-                                 .values_list('date', flat=True)
-                                 .distinct())
-            except models.JobDailyPerformance.DoesNotExist:
-                fetched_dates = []
-
-            check_date = METRICS_START_DATE
-            while check_date < today:
-                if check_date not in fetched_dates:
-                    dates.append(check_date)
-                check_date += timedelta(days=1)
-
-        for d in dates:
-            successful_jobs = 0
-            # Fetch Daily Impression data from last Monday relative to `d` date
-            # to calculate Adjusted Impressions / Clicks / Blocks.
-            last_monday = d - timedelta(days=d.weekday())
-            if not models.DailyImpressions.objects.filter(date=last_monday).exists():
-                self.stdout.write(f'Fetching impression data for {last_monday}.')
-                if etl.update_impressions(last_monday):
-                    successful_jobs += 1
-            else:
-                successful_jobs += 1
-
-            self.stdout.write(f'Fetching data for {d}.')
-            if etl.update_job_metrics(d):
-                successful_jobs += 1
-
-            if successful_jobs != 2:
-                # We didn't manage to fetch all data, something is wrong.
-                raise CommandError('Cannot fetch data from Telemetry.')
+            from_date = METRICS_START_DATE
+            if options['from_date']:
+                from_date = parse_date(options['from_date'])
+            to_date = date.today() - timedelta(days=1)
+            if options['to_date']:
+                to_date = parse_date(options['to_date'])
+            dates = self.get_missing_dates(from_date, to_date)
+
+        # Adjusted Impressions / Clicks / Blocks are calculated using Daily
+        # Impression data from last Monday relative to each date. Fetch
+        # them first, once for each Monday.
+        mondays = sorted({d - timedelta(days=d.weekday()) for d in dates})
+        fetched_mondays = set(
+            models.DailyImpressions.objects
+            .filter(date__in=mondays)
+            .values_list('date', flat=True)
+        )
+        mondays = [monday for monday in mondays if monday not in fetched_mondays]
+        for monday in mondays:
+            self.stdout.write(f'Fetching impression data for {monday}.')
+
+        failed_dates = []
+        with ThreadPoolExecutor(max_workers=max(options['workers'], 1)) as executor:
+            results = executor.map(lambda d: _in_thread(etl.update_impressions, d), mondays)
+            for monday, result in zip(mondays, results):
+                if not result:
+                    failed_dates.append(monday)
+
+            # Skip dates of Mondays without impression data.
+            dates = [d for d in dates if d - timedelta(days=d.weekday()) not in failed_dates]
+            for d in dates:
+                self.stdout.write(f'Fetching data for {d}.')
+
+            # Each date's metrics are stored in a single transaction, so
+            # successfully fetched dates are not fetched again when the
+            # command runs again.
+            results = executor.map(lambda d: _in_thread(etl.update_job_metrics, d), dates)
+            for d, result in zip(dates, results):
+                if not result:
+                    failed_dates.append(d)
+
+        if failed_dates:
+            # We didn't manage to fetch all data, something is wrong.
+            raise CommandError('Cannot fetch data from Telemetry for {}.'.format(
+                ', '.join(str(d) for d in sorted(failed_dates))))
 
         self.stdout.write(self.style.SUCCESS('Done'))
+
+    def get_missing_dates(self, from_date, to_date):
+        """Return the dates from `from_date` to `to_date`, included, without
+        JobDailyPerformance data."""
+        fetched_dates = set(
+            models.JobDailyPerformance.objects
+            .filter(date__gte=from_date, date__lte=to_date)
+            .values_list('date', flat=True)
+            .distinct()
+        )
+        dates = []
+        check_date = from_date
+        while check_date <= to_date:
+            if check_date not in fetched_dates:
+                dates.append(check_date)
+            check_date += timedelta(days=1)
+        return dates
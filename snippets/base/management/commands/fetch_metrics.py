@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 from django.conf import settings
@@ -9,6 +10,21 @@ from redash_dynamic_query import RedashDynamicQuery
 from snippets.base.models import Job
 
 
+def count_events(rows):
+    """Returns a tuple of impressions, blocks and clicks in `rows`."""
+    impressions = 0
+    clicks = 0
+    blocks = 0
+    for row in rows:
+        if row['event'] == 'IMPRESSION':
+            impressions += row['counts']
+        elif row['event'] == 'BLOCK':
+            blocks += row['counts']
+        elif row['event'] in ['CLICK', 'CLICK_BUTTON']:
+            clicks += row['counts']
+    return impressions, blocks, clicks
+
+
 class Command(BaseCommand):
     args = "(no args)"
     help = "Fetch metrics"
@@ -19,6 +35,23 @@ class Command(BaseCommand):
             action='store_true',
             help='Ignore last update timestamp and update all Jobs.',
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.REDASH_FETCH_WORKERS,
+            help='Number of Redash queries to run concurrently.',
+        )
+        parser.add_argument(
+            '--timeout',
+            type=int,
+            default=settings.REDASH_MAX_WAIT,
+            help='Seconds to wait for the results of each Redash query.',
+        )
+        parser.add_argument(
+            '--per-job',
+            action='store_true',
+            help='Query each Job separately even if REDASH_JOB_BATCH_QUERY_ID is set.',
+        )
 
     def handle(self, *args, **options):
         now = datetime.utcnow()
@@ -29,72 +62,115 @@ class Command(BaseCommand):
         redash = RedashDynamicQuery(
             endpoint=settings.REDASH_ENDPOINT,
             apikey=settings.REDASH_API_KEY,
-            max_wait=settings.REDASH_MAX_WAIT,
+            max_wait=options['timeout'],
         )
 
-        jobs = Job.objects.filter(status=Job.PUBLISHED).exclude(
+        jobs = list(Job.objects.filter(status=Job.PUBLISHED).exclude(
             limit_impressions=0,
             limit_clicks=0,
             limit_blocks=0,
-        ).order_by('id')
-
-        self.stdout.write(f'Fetching Updates for {jobs.count()} Jobs.')
-
-        data_fetched_global = False
-        for job in jobs:
-            impressions = 0
-            clicks = 0
-            blocks = 0
-            bind_data = {
-                'start_date': job.publish_start.strftime('%Y-%m-%d'),
-                'end_date': now.strftime('%Y-%m-%d'),
-                'message_id': job.id,
-            }
+        ).order_by('id'))
 
-            data_fetched = False
-            try:
-                result = redash.query(settings.REDASH_JOB_QUERY_BIGQUERY_ID, bind_data)
-            except Exception as exp:
-                # Capture the exception but don't quit
-                sentry_sdk.capture_exception(exp)
-                continue
+        self.stdout.write(f'Fetching Updates for {len(jobs)} Jobs.')
 
-            try:
-                for row in result['query_result']['data']['rows']:
-                    if row['event'] == 'IMPRESSION':
-                        impressions += row['counts']
-                    elif row['event'] == 'BLOCK':
-                        blocks += row['counts']
-                    elif row['event'] in ['CLICK', 'CLICK_BUTTON']:
-                        clicks += row['counts']
-            except KeyError as exp:
-                # Capture the exception but don't quit
-                sentry_sdk.capture_exception(exp)
-                continue
-            else:
-                data_fetched = True
+        metrics = None
+        if jobs and settings.REDASH_JOB_BATCH_QUERY_ID and not options['per_job']:
+            metrics = self.fetch_batched(redash, jobs, now)
+        if metrics is None:
+            metrics = self.fetch_per_job(redash, jobs, now, options['workers'])
 
-            # We didn't fetch data from both data sources for this job, don't
-            # save it.
-            if not data_fetched:
+        updated_jobs = []
+        for job in jobs:
+            if job.id not in metrics:
                 continue
+            job.metric_impressions, job.metric_blocks, job.metric_clicks = metrics[job.id]
+            job.metric_last_update = now
+            updated_jobs.append(job)
+
+        # Use bulk_update to avoid triggering Django signals and updating
+        # Job's and ASRSnippet's modified date.
+        Job.objects.bulk_update(
+            updated_jobs,
+            ['metric_impressions', 'metric_blocks', 'metric_clicks', 'metric_last_update'],
+        )
 
-            # We fetched data for job, mark the ETL job `working` to update
-            # DeadMansSnitch.
-            data_fetched_global = True
-
-            # Use update to avoid triggering Django signals and updating Job's
-            # and ASRSnippet's modified date.
-            Job.objects.filter(id=job.id).update(
-                metric_impressions=impressions,
-                metric_blocks=blocks,
-                metric_clicks=clicks,
-                metric_last_update=now,
-            )
-
-        if jobs and not data_fetched_global:
+        if jobs and not updated_jobs:
             # We didn't manage to fetch data for any of the jobs. Something is
             # wrong.
             raise CommandError('Cannot fetch data from Telemetry.')
 
         self.stdout.write(self.style.SUCCESS('Done'))
+
+    def fetch_batched(self, redash, jobs, now):
+        """Query the metrics of all `jobs` at once.
+
+        The batch query gets the earliest start date of the Jobs and a comma
+        separated list of their IDs and returns `message_id`, `date`, `event`
+        and `counts` rows. Rows dated before a Job's own start date are
+        ignored, to count the same events as the per Job query.
+
+        Returns a dict of Job IDs to metrics, or None if the query failed.
+
+        """
+        bind_data = {
+            'start_date': min(job.publish_start for job in jobs).strftime('%Y-%m-%d'),
+            'end_date': now.strftime('%Y-%m-%d'),
+            'message_ids': ','.join(str(job.id) for job in jobs),
+        }
+        try:
+            result = redash.query(settings.REDASH_JOB_BATCH_QUERY_ID, bind_data)
+            rows = result['query_result']['data']['rows']
+            start_dates = {
+                str(job.id): job.publish_start.strftime('%Y-%m-%d') for job in jobs
+            }
+            job_rows = {job.id: [] for job in jobs}
+            for row in rows:
+                message_id = str(row['message_id'])
+                if message_id in start_dates and row['date'] >= start_dates[message_id]:
+                    job_rows[int(message_id)].append(row)
+            metrics = {job_id: count_events(rows) for job_id, rows in job_rows.items()}
+        except Exception as exp:
+            # Capture the exception and fall back to querying each Job.
+            sentry_sdk.capture_exception(exp)
+            self.stdout.write('Batch query failed, querying each Job.')
+            return None
+
+        return metrics
+
+    def fetch_per_job(self, redash, jobs, now, workers):
+        """Query the metrics of each Job separately.
+
+        Returns a dict of Job IDs to metrics for the Jobs whose query
+        succeeded.
+
+        """
+        def query(job):
+            bind_data = {
+                'start_date': job.publish_start.strftime('%Y-%m-%d'),
+                'end_date': now.strftime('%Y-%m-%d'),
+                'message_id': job.id,
+            }
+            return redash.query(settings.REDASH_JOB_QUERY_BIGQUERY_ID, bind_data)
+
+        metrics = {}
+        # Queries mostly wait for Redash, run them in threads and process
+        # the results in the main thread, in Job order.
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            futures = [executor.submit(query, job) for job in jobs]
+
+            for job, future in zip(jobs, futures):
+                try:
+                    result = future.result()
+                except Exception as exp:
+                    # Capture the exception but don't quit
+                    sentry_sdk.capture_exception(exp)
+                    continue
+
+                try:
+                    metrics[job.id] = count_events(result['query_result']['data']['rows'])
+                except KeyError as exp:
+                    # Capture the exception but don't quit
+                    sentry_sdk.capture_exception(exp)
+                    continue
+
+        return metrics
@@ -1,6 +1,11 @@
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
 
 from snippets.base import bundles
+from snippets.base.models import BundleWatermark
+
+WATERMARK = 'bundles'
 
 
 class Command(BaseCommand):
@@ -13,9 +18,68 @@ class Command(BaseCommand):
             '--timestamp',
             help='Parse Jobs last modified after <timestamp>',
         )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help=('Parse Jobs modified since the last successful generation. Generate '
+                  'all bundles if there was none or it ran a different code version.'),
+        )
+        parser.add_argument(
+            '--single-pass',
+            action='store_true',
+            help='Fetch and render all Published Jobs once instead of once per bundle file.',
+        )
+        parser.add_argument(
+            '--write-all',
+            action='store_true',
+            help='Write all bundles, even those with unchanged content.',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.BUNDLE_GENERATION_WORKERS,
+            help='Number of threads compressing and uploading bundles.',
+        )
+        parser.add_argument(
+            '--retries',
+            type=int,
+            default=settings.BUNDLE_GENERATION_RETRIES,
+            help='Number of times to retry writing or deleting a bundle file.',
+        )
 
     def handle(self, *args, **options):
-        bundles.generate_bundles(
-            timestamp=options.get('timestamp', None),
+        timestamp = options.get('timestamp', None)
+        if options['incremental']:
+            if timestamp:
+                raise CommandError('--timestamp and --incremental cannot be combined.')
+            timestamp = BundleWatermark.get_timestamp(WATERMARK)
+            if not timestamp:
+                self.stdout.write('No watermark for this code version.')
+
+        # Jobs modified while bundles get generated are processed again in
+        # the next run.
+        started = timezone.now()
+
+        if options['single_pass']:
+            generate_bundles = bundles.generate_bundles_single_pass
+        else:
+            generate_bundles = bundles.generate_bundles
+
+        counts = generate_bundles(
+            timestamp=timestamp,
+            skip_unchanged=not options['write_all'],
+            workers=options['workers'],
+            retries=options['retries'],
             stdout=self.stdout,
         )
+
+        # Runs with a custom --timestamp may not cover all the changes since
+        # the watermark.
+        if options['incremental'] or not timestamp:
+            BundleWatermark.advance(WATERMARK, started)
+
+        self.stdout.write(
+            f'Bundles written: {counts["written"]}\n'
+            f'Bundles skipped: {counts["skipped"]}\n'
+            f'Bundles deleted: {counts["deleted"]}\n'
+        )
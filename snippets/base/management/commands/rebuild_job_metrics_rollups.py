@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from snippets.base import etl
+
+
+class Command(BaseCommand):
+    args = '(no args)'
+    help = 'Rebuild the Job metric totals from the daily Job metrics'
+
+    def handle(self, *args, **options):
+        count = etl.update_job_metrics_rollups()
+        self.stdout.write(f'Job metric rollups rebuilt: {count}\n')
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from snippets.base import slack
+
+
+class Command(BaseCommand):
+    args = '(no args)'
+    help = 'Send the Slack messages waiting in the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.SLACK_OUTBOX_BATCH_SIZE,
+            help='Number of messages to fetch from the outbox at once.',
+        )
+        parser.add_argument(
+            '--no-digest',
+            action='store_true',
+            help='Send each message separately instead of merging them into digests.',
+        )
+
+    def handle(self, *args, **options):
+        sent, failed = slack.send_outbox(
+            batch_size=options['batch_size'],
+            digest=not options['no_digest'],
+        )
+        self.stdout.write(
+            f'Slack messages sent: {sent}\n'
+            f'Slack messages failed: {failed}\n'
+        )
@@ -19,67 +19,66 @@ class Command(BaseCommand):
         user = get_user_model().objects.get_or_create(username='snippets_bot')[0]
         count_total_completed = 0
 
+        # Each step only selects Jobs still in the status it expects, so a
+        # Job changed by an earlier step is not counted twice. Snippets are
+        # needed to render the Slack notifications.
+        jobs = Job.objects.select_related('snippet')
+
         # Publish Scheduled Jobs with `publish_start` before now or without
         # publish_start.
-        jobs = Job.objects.filter(status=Job.SCHEDULED).filter(
-            Q(publish_start__lte=now - timedelta(minutes=settings.SNIPPETS_PUBLICATION_OFFSET)) |
-            Q(publish_start=None)
+        published = Job.bulk_change_status(
+            jobs.filter(status=Job.SCHEDULED).filter(
+                Q(publish_start__lte=now - timedelta(
+                    minutes=settings.SNIPPETS_PUBLICATION_OFFSET)) |
+                Q(publish_start=None)
+            ),
+            status=Job.PUBLISHED,
+            user=user,
+            reason='Published start date reached.',
         )
-
-        count_published = jobs.count()
-        for job in jobs:
-            job.change_status(
-                status=Job.PUBLISHED,
-                user=user,
-                reason='Published start date reached.',
-            )
+        count_published = len(published)
 
         # Disable Published Jobs with `publish_end` before now.
-        jobs = Job.objects.filter(status=Job.PUBLISHED, publish_end__lte=now)
-        count_publication_end = jobs.count()
+        completed = Job.bulk_change_status(
+            jobs.filter(status=Job.PUBLISHED, publish_end__lte=now),
+            status=Job.COMPLETED,
+            user=user,
+            reason='Publication end date reached.',
+        )
+        count_publication_end = len(completed)
         count_total_completed += count_publication_end
 
-        for job in jobs:
-            job.change_status(
-                status=Job.COMPLETED,
-                user=user,
-                reason='Publication end date reached.',
-            )
-
         # Disable Jobs that reached Impression, Click or Block limits.
         count_limit = {}
         for limit in ['impressions', 'clicks', 'blocks']:
-            jobs = (Job.objects
-                    .filter(status=Job.PUBLISHED)
-                    .exclude(**{f'limit_{limit}': 0})
-                    .filter(**{f'limit_{limit}__lte': F(f'metric_{limit}')}))
-            for job in jobs:
-                job.change_status(
-                    status=Job.COMPLETED,
-                    user=user,
-                    reason=f'Limit reached: {limit}.',
-                )
-
-            count_limit[limit] = jobs.count()
+            completed = Job.bulk_change_status(
+                (jobs
+                 .filter(status=Job.PUBLISHED)
+                 .exclude(**{f'limit_{limit}': 0})
+                 .filter(**{f'limit_{limit}__lte': F(f'metric_{limit}')})),
+                status=Job.COMPLETED,
+                user=user,
+                reason=f'Limit reached: {limit}.',
+            )
+            count_limit[limit] = len(completed)
             count_total_completed += count_limit[limit]
 
         # Disable Jobs that have Impression, Click or Block limits but don't
         # have metrics data for at least 24h. This is to handle cases where the
         # Metrics Pipeline is broken.
         yesterday = datetime.utcnow() - timedelta(days=1)
-        jobs = (Job.objects
-                .filter(status=Job.PUBLISHED)
-                .exclude(limit_impressions=0, limit_clicks=0, limit_blocks=0)
-                # Exclude Jobs with limits which haven't been updated once yet.
-                .exclude(metric_last_update='1970-01-01')
-                .filter(metric_last_update__lt=yesterday))
-        for job in jobs:
-            job.change_status(
-                status=Job.COMPLETED,
-                user=user,
-                reason='Premature termination due to missing metrics.',
-            )
-        count_premature_termination = jobs.count()
+        completed = Job.bulk_change_status(
+            (jobs
+             .filter(status=Job.PUBLISHED)
+             .exclude(limit_impressions=0, limit_clicks=0, limit_blocks=0)
+             # Exclude Jobs with limits which haven't been updated once yet.
+             .exclude(metric_last_update='1970-01-01')
+             .filter(metric_last_update__lt=yesterday)),
+            status=Job.COMPLETED,
+            user=user,
+            reason='Premature termination due to missing metrics.',
+        )
+        count_premature_termination = len(completed)
         count_total_completed += count_premature_termination
 
         count_running = Job.objects.filter(status=Job.PUBLISHED).count()
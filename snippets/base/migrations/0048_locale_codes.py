@@ -0,0 +1,32 @@
+# Generated by Django 2.2.28 on 2026-10-18 20:03
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+def forwards(apps, schema_editor):
+    Locale = apps.get_model('base', 'Locale')
+    for locale in Locale.objects.all():
+        locale.codes = [code for code in locale.code.split(',') if code]
+        locale.save(update_fields=['codes'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0047_auto_20201112_0655'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='locale',
+            name='codes',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=255), default=list, editable=False, size=None),
+        ),
+        migrations.AddIndex(
+            model_name='locale',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['codes'], name='base_locale_codes_56d31b_gin'),
+        ),
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.28 on 2026-10-18 20:21
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0048_locale_codes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlackMessage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('kind', models.CharField(blank=True, max_length=100)),
+                ('data', models.TextField()),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ('id',),
+            },
+        ),
+    ]
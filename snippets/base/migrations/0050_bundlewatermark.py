@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-18 20:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0049_slackmessage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BundleWatermark',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('timestamp', models.DateTimeField()),
+                ('code_version', models.CharField(max_length=100)),
+                ('modified', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
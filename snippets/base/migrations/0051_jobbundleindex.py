@@ -0,0 +1,27 @@
+# Generated by Django 2.2.28 on 2026-10-18 20:25
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0050_bundlewatermark'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobBundleIndex',
+            fields=[
+                ('job_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('locales', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=255), default=list, size=None)),
+                ('distribution_bundles', django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), default=list, size=None)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='jobbundleindex',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['distribution_bundles'], name='base_jobbun_distrib_96a1c3_gin'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 2.2.28 on 2026-10-18 20:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def forwards(apps, schema_editor):
+    JobDailyPerformance = apps.get_model('base', 'JobDailyPerformance')
+    JobMetricsRollup = apps.get_model('base', 'JobMetricsRollup')
+    totals = (JobDailyPerformance.objects
+              .order_by()
+              .values('job_id')
+              .annotate(total_impression=models.Sum('impression'),
+                        total_adj_impression=models.Sum('adj_impression'),
+                        total_click=models.Sum('click'),
+                        total_block=models.Sum('block')))
+    JobMetricsRollup.objects.bulk_create([
+        JobMetricsRollup(job_id=total['job_id'],
+                         impression=total['total_impression'],
+                         adj_impression=total['total_adj_impression'],
+                         click=total['total_click'],
+                         block=total['total_block'])
+        for total in totals
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0051_jobbundleindex'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobMetricsRollup',
+            fields=[
+                ('job', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='metrics_rollup', serialize=False, to='base.Job')),
+                ('impression', models.BigIntegerField(default=0)),
+                ('adj_impression', models.BigIntegerField(default=0)),
+                ('click', models.BigIntegerField(default=0)),
+                ('block', models.BigIntegerField(default=0)),
+                ('modified', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 2.2.28 on 2026-10-18 20:41
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations
+
+
+# Same aggregation as JobMetricsRollup.aggregate_details, stored for all Jobs.
+BACKFILL_SQL = """
+UPDATE base_jobmetricsrollup
+SET details = aggregated.details
+FROM (
+  SELECT
+    job_id,
+    jsonb_agg(jsonb_build_array(event, channel, counts, no_clients_total,
+                                adj_impression_percentage, adj_client_percentage)
+              ORDER BY event, channel) AS details
+  FROM (
+    SELECT
+      job_id,
+      x.event,
+      x.channel,
+      SUM(x.counts) AS counts,
+      SUM(x.no_clients_total) AS no_clients_total,
+      AVG(adj_impression_percentage) AS adj_impression_percentage,
+      AVG(adj_client_percentage) AS adj_client_percentage
+    FROM base_jobdailyperformance
+    CROSS JOIN jsonb_to_recordset(
+                 CASE WHEN jsonb_typeof(details) = 'array' THEN details ELSE '[]' END)
+               as x(event text,
+                    counts int,
+                    channel text,
+                    no_clients_total int)
+    GROUP BY job_id, x.event, x.channel
+  ) AS per_channel
+  GROUP BY job_id
+) AS aggregated
+WHERE base_jobmetricsrollup.job_id = aggregated.job_id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0052_jobmetricsrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='jobmetricsrollup',
+            name='details',
+            field=django.contrib.postgres.fields.jsonb.JSONField(default=list),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,103 @@
+# Generated by Django 2.2.28 on 2026-10-18 20:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Copy the rows of the existing JobDailyPerformance details, like
+# JobDailyPerformance.get_detail_rows.
+BACKFILL_SQL = """
+INSERT INTO base_jobdailyperformancedetail
+  (performance_id, job_id, date, event, channel, country,
+   counts, no_clients, no_clients_total)
+SELECT
+  base_jobdailyperformance.id,
+  base_jobdailyperformance.job_id,
+  base_jobdailyperformance.date,
+  x.event,
+  x.channel,
+  x.country,
+  COALESCE(x.counts, 0),
+  COALESCE(x.no_clients, 0),
+  COALESCE(x.no_clients_total, 0)
+FROM base_jobdailyperformance
+CROSS JOIN jsonb_to_recordset(
+             CASE WHEN jsonb_typeof(details) = 'array' THEN details ELSE '[]' END)
+           as x(event text,
+                channel text,
+                country text,
+                counts bigint,
+                no_clients bigint,
+                no_clients_total bigint)
+WHERE x.event IS NOT NULL
+"""
+
+# Recompute the JobMetricsRollup details from the new rows, like
+# JobMetricsRollup.aggregate_details, so that both sources agree.
+ROLLUP_DETAILS_SQL = """
+UPDATE base_jobmetricsrollup
+SET details = COALESCE(aggregated.details, '[]')
+FROM base_jobmetricsrollup AS rollup
+LEFT JOIN (
+  SELECT
+    job_id,
+    jsonb_agg(jsonb_build_array(event, channel, counts, no_clients_total,
+                                adj_impression_percentage, adj_client_percentage)
+              ORDER BY event, channel) AS details
+  FROM (
+    SELECT
+      detail.job_id,
+      detail.event,
+      detail.channel,
+      SUM(detail.counts) AS counts,
+      SUM(detail.no_clients_total) AS no_clients_total,
+      AVG(performance.adj_impression_percentage) AS adj_impression_percentage,
+      AVG(performance.adj_client_percentage) AS adj_client_percentage
+    FROM base_jobdailyperformancedetail AS detail
+    INNER JOIN base_jobdailyperformance AS performance
+            ON performance.id = detail.performance_id
+    GROUP BY detail.job_id, detail.event, detail.channel
+  ) AS per_channel
+  GROUP BY job_id
+) AS aggregated ON aggregated.job_id = rollup.job_id
+WHERE base_jobmetricsrollup.job_id = rollup.job_id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0053_jobmetricsrollup_details'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobDailyPerformanceDetail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(editable=False)),
+                ('event', models.CharField(max_length=64)),
+                ('channel', models.CharField(max_length=32, null=True)),
+                ('country', models.CharField(max_length=16, null=True)),
+                ('counts', models.BigIntegerField(default=0)),
+                ('no_clients', models.BigIntegerField(default=0)),
+                ('no_clients_total', models.BigIntegerField(default=0)),
+                ('job', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='metric_details', to='base.Job')),
+                ('performance', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='detail_rows', to='base.JobDailyPerformance')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='jobdailyperformancedetail',
+            index=models.Index(fields=['job', 'event', 'channel'], name='base_jobdai_job_id_eab2ff_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='jobdailyperformancedetail',
+            index=models.Index(fields=['job', 'country'], name='base_jobdai_job_id_4e9b49_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='jobdailyperformancedetail',
+            index=models.Index(fields=['date', 'event', 'channel'], name='base_jobdai_date_17d422_idx'),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+        migrations.RunSQL(ROLLUP_DETAILS_SQL, migrations.RunSQL.noop),
+    ]
@@ -11,14 +11,15 @@ from urllib.parse import urljoin, urlparse
 from django.conf import settings
 from django.contrib.admin.models import CHANGE, LogEntry
 from django.contrib.admin.options import get_content_type_for_model
-from django.contrib.postgres.fields import JSONField
+from django.contrib.postgres.fields import ArrayField, JSONField
+from django.contrib.postgres.indexes import GinIndex
 from django.core import validators as django_validators
 from django.core.exceptions import ValidationError
 from django.core.files.uploadedfile import InMemoryUploadedFile
 from django.urls import reverse
-from django.db import connection, models
+from django.db import models
 from django.db.models.manager import Manager
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.template import engines
 from django.template.loader import render_to_string
@@ -31,6 +32,7 @@ from taggit_selectize.managers import TaggableManager
 
 import snippets.base.fields as snippet_fields
 from snippets.base import slack, util, validators
+from snippets.base.cache import render_cache
 
 
 JINJA_ENV = engines['backend']
@@ -225,22 +227,90 @@ class Icon(models.Model):
 
         return full_url
 
+    @classmethod
+    def _get_template_fields(cls):
+        """Returns (Template subclass, Icon field) tuples for the Icon fields
+        of each Template subclass.
+
+        """
+        return [
+            (relation.related_model, relation.field)
+            for relation in cls._meta.fields_map.values()
+            if issubclass(relation.related_model, Template)
+        ]
+
+    @classmethod
+    def get_template_lookups(cls):
+        """Returns the lookups from Template to Icon through the Icon fields
+        of each Template subclass, e.g. `simpletemplate__icon`.
+
+        """
+        return [
+            f'{model._meta.model_name}__{field.name}'
+            for model, field in cls._get_template_fields()
+        ]
+
+    @classmethod
+    def get_used_icon_ids(cls, **template_filters):
+        """Returns a UNION query of the IDs of Icons used by Templates matching
+        `template_filters`, for use with `id__in`.
+
+        """
+        querysets = [
+            (model.objects
+             .filter(**template_filters)
+             # Exclude NULLs, they would make `NOT IN` never match.
+             .filter(**{f'{field.attname}__isnull': False})
+             .values_list(field.attname, flat=True))
+            for model, field in cls._get_template_fields()
+        ]
+        return querysets[0].union(*querysets[1:])
+
+    @classmethod
+    def get_snippet_ids(cls, icons):
+        """Returns a UNION query of the IDs of ASRSnippets with Templates using
+        any of `icons`, for use with `pk__in`.
+
+        """
+        querysets = [
+            model.objects.filter(**{f'{field.attname}__in': icons}).values_list(
+                'snippet_id', flat=True)
+            for model, field in cls._get_template_fields()
+        ]
+        return querysets[0].union(*querysets[1:])
+
     @property
     def snippets(self):
-        """Returns a Queryset of ASRSnippets using this icon. Needs this fancy code
-        b/c icons have multiple relations with multiple Templates.
+        """Returns a Queryset of ASRSnippets using this icon through any of the
+        Icon fields of the Template subclasses.
 
         """
-        all_snippets = []
-        for relation_name, relation in self._meta.fields_map.items():
-            if issubclass(relation.related_model, Template):
-                related_snippets = (getattr(self, relation_name)
-                                    .values_list('snippet__id', flat=True))
+        return ASRSnippet.objects.filter(pk__in=Icon.get_snippet_ids([self.pk]))
 
-                if related_snippets:
-                    all_snippets.extend(related_snippets)
+    @staticmethod
+    def check_if_icon_can_be_deleted(collector, field, sub_objs, using):
+        """Checks if Icon is related to Templates that are in Draft, Scheduled or
+        Published state and prevents deletion.
 
-        return ASRSnippet.objects.filter(pk__in=all_snippets).distinct()
+        """
+        # Called for each Template Icon field referencing the deleted Icons.
+        # Each call checks all Template Icon fields for its Icons with a
+        # single query.
+        icon_ids = {getattr(obj, field.attname) for obj in sub_objs}
+        asrsnippets = ASRSnippet.objects.filter(
+            pk__in=Icon.get_snippet_ids(icon_ids), jobs__status__lte=Job.PUBLISHED
+        )
+        if asrsnippets.exists():
+            # Icon activelly used.
+            raise models.ProtectedError(
+                'Icon is in use by ASRSnippets with Draft, Scheduled or Published Jobs.',
+                asrsnippets
+            )
+
+        # Icon can be deleted, set ForeignKeys referencing it to NULL.
+        # ASRSnippets that referenced this Icon will be required to set a
+        # new Icon before they can be saved through the UI.
+        collector.add_field_update(field, None, sub_objs)
 
     def clean(self):
         super().clean()
@@ -282,27 +352,6 @@ class Icon(models.Model):
                     settings.IMAGE_MAX_SIZE / 1024, self.image.size / 1024)
             })
 
-    @staticmethod
-    def check_if_icon_can_be_deleted(collector, field, sub_objs, using):
-        """Checks if Icon is related to Templates that are in Draft, Scheduled or
-        Published state and prevents deletion.
-
-        """
-        asrsnippets = ASRSnippet.objects.filter(
-            template_relation__in=sub_objs, jobs__status__lte=Job.PUBLISHED
-        )
-        if asrsnippets.exists():
-            # Icon activelly used.
-            raise models.ProtectedError(
-                'Icon is in use by ASRSnippets with Draft, Scheduled or Published Jobs.',
-                asrsnippets
-            )
-        else:
-            # Icon can be deleted, set ForeignKeys referencing it to NULL.
-            # ASRSnippets that referenced this Icon will be required to set a
-            # new Icon before they can be saved through the UI.
-            collector.add_field_update(field, None, sub_objs)
-
 
 class Template(models.Model):
     TARGETING = ''
@@ -1571,6 +1620,10 @@ class Locale(models.Model):
         default=False,
         help_text='Is Right-To-Left language?'
     )
+    # The individual locales of `code`, kept in sync on save. Indexed to
+    # efficiently find the Locales targeting a locale, see
+    # `get_matching_codes`.
+    codes = ArrayField(models.CharField(max_length=255), default=list, editable=False)
 
     def save(self, *args, **kwargs):
         # Make sure that code always starts and ends with `,` and it's always
@@ -1580,10 +1633,26 @@ class Locale(models.Model):
             self.code = ',' + self.code
         if self.code[-1] != ',':
             self.code = self.code + ','
+        self.codes = [code for code in self.code.split(',') if code]
         super().save(*args, **kwargs)
 
+    @staticmethod
+    def get_matching_codes(locale_code):
+        """Returns the codes of Locales that target `locale_code`: the code
+        itself and the code without territory information.
+
+        Use with `codes__overlap` to filter Locales, e.g. Locales with codes
+        `es` or `es-mx` target `es-mx`.
+
+        """
+        locale_code = locale_code.lower()
+        return sorted({locale_code, locale_code.split('-', 1)[0]})
+
     class Meta:
         ordering = ('name', 'code')
+        indexes = [
+            GinIndex(fields=['codes']),
+        ]
 
     def __str__(self):
         return self.name
@@ -1709,24 +1778,8 @@ class Job(models.Model):
         but we don't want them to actually show. See #1308
 
         """
-        rendered_snippet = self.snippet.render()
-
-        rendered_snippet['id'] = str(self.id)
-
-        # Add weight info
-        rendered_snippet['weight'] = self.weight
-
         # Add campaign info
         campaign_slug = self.campaign.slug if self.campaign else ''
-        rendered_snippet = util.deep_search_and_replace(
-            rendered_snippet, '[[campaign_slug]]', campaign_slug)
-        # Add job id info
-        rendered_snippet = util.deep_search_and_replace(
-            rendered_snippet, '[[job_id]]', str(self.id))
-
-        # Include campaign key when needed
-        if campaign_slug:
-            rendered_snippet['campaign'] = campaign_slug
 
         # Add Channels
         CHANNELS_MAP = {
@@ -1740,15 +1793,30 @@ class Job(models.Model):
             # Iterate CHANNELS_MAP instead of self.channels to ensure order
             CHANNELS_MAP[channel] for channel in CHANNELS_MAP if channel in self.channels
         ])
-        rendered_snippet = util.deep_search_and_replace(rendered_snippet, '[[channels]]', channels)
+
+        rendered_snippet = self.snippet.render(variables={
+            'campaign_slug': campaign_slug,
+            'job_id': str(self.id),
+            'channels': channels,
+        })
+
+        rendered_snippet['id'] = str(self.id)
+
+        # Add weight info
+        rendered_snippet['weight'] = self.weight
+
+        # Include campaign key when needed
+        if campaign_slug:
+            rendered_snippet['campaign'] = campaign_slug
 
         # Add Targets
         targeting = []
         if rendered_snippet.get('targeting'):
             targeting.append(rendered_snippet['targeting'])
 
+        # Sort in Python to make use of prefetched Targets.
         targeting.extend([target.jexl_expr for
-                          target in self.targets.all().order_by('id') if
+                          target in sorted(self.targets.all(), key=lambda target: target.id) if
                           target.jexl_expr])
 
         # Make targeting always fail. Used for Nightly debuging.
@@ -1826,7 +1894,63 @@ class Job(models.Model):
         if send_slack:
             template = 'slack/job_{}.jinja.json'.format(self.get_status_display().lower())
             data = render_to_string(template, context={'job': self, 'reason': reason})
-            slack._send_slack(data)
+            slack.queue_slack(data, kind=f'job_{self.get_status_display().lower()}')
+
+    @classmethod
+    def bulk_change_status(cls, jobs, status, user=None, send_slack=True, reason=''):
+        """Change the status of `jobs` with a fixed number of queries.
+
+        Works like `change_status` for each Job, but updates the Jobs and
+        their ASRSnippets' modified date with one query each and creates
+        all LogEntries and Slack messages at once.
+
+        Returns the list of Jobs whose status changed.
+
+        """
+        jobs = [job for job in jobs if job.status != status]
+        if not jobs:
+            return jobs
+
+        now = timezone.now()
+        values = {'status': status, 'modified': now}
+        if status in [cls.CANCELED, cls.COMPLETED]:
+            values['completed_on'] = datetime.utcnow()
+
+        # update() does not send post_save signals, bump the modified date
+        # of the ASRSnippets like `update_asrsnippet_modified_date` does.
+        cls.objects.filter(id__in=[job.id for job in jobs]).update(**values)
+        ASRSnippet.objects.filter(pk__in={job.snippet_id for job in jobs}).update(modified=now)
+        for job in jobs:
+            for field, value in values.items():
+                setattr(job, field, value)
+
+        message = f'Changed status to {jobs[0].get_status_display()}.'
+        if reason:
+            message += f' {reason}'
+
+        if user:
+            content_type_id = get_content_type_for_model(cls).pk
+            LogEntry.objects.bulk_create([
+                LogEntry(
+                    action_time=now,
+                    user_id=user.pk,
+                    content_type_id=content_type_id,
+                    object_id=str(job.id),
+                    object_repr=str(job)[:200],
+                    action_flag=CHANGE,
+                    change_message=message,
+                )
+                for job in jobs
+            ])
+
+        if send_slack:
+            kind = f'job_{jobs[0].get_status_display().lower()}'
+            slack.queue_slack([
+                render_to_string(f'slack/{kind}.jinja.json', context={'job': job, 'reason': reason})
+                for job in jobs
+            ], kind=kind)
+
+        return jobs
 
     def get_admin_url(self, full=True):
         # Not using reverse() because the `admin:` namespace is not registered
@@ -1866,38 +1990,34 @@ class Job(models.Model):
         return job_copy
 
     def get_aggregated_metrics(self, adjusted=False):
-        with connection.cursor() as cursor:
-            cursor.execute("""
-            SELECT
-              x.event,
-              x.channel,
-              SUM(x.counts),
-              SUM(x.no_clients_total),
-              AVG(adj_impression_percentage),
-              AVG(adj_client_percentage)
-            FROM base_jobdailyperformance
-            CROSS JOIN jsonb_to_recordset(base_jobdailyperformance.details)
-                       as x(event text,
-                            counts int,
-                            channel text,
-                            no_clients_total int)
-            WHERE job_id={job_id}
-            GROUP BY event, channel
-            """.format(job_id=self.id))
-            result_list = []
-            for row in cursor.fetchall():
-                metrics = {
-                    'event': row[0],
-                    'channel': row[1],
-                    'counts': row[2],
-                    'no_clients_total': row[3] if row[3] is not None else 0,
-                }
-                if adjusted:
-                    metrics['no_clients_total'] = int(row[5] * metrics['no_clients_total'] + 0.5)
-                    if row[0] == 'impression':
-                        metrics['counts'] = int(row[4] * row[2] + 0.5)
-
-                result_list.append(metrics)
+        """Returns the metrics of the Job aggregated per event and channel.
+
+        Reads the aggregation stored in the Job's JobMetricsRollup by the
+        ETL and only queries the JobDailyPerformanceDetail rows if the Job
+        has no rollup yet.
+
+        """
+        try:
+            rows = self.metrics_rollup.details
+        except JobMetricsRollup.DoesNotExist:
+            rows = JobMetricsRollup.aggregate_details([self.id]).get(self.id, [])
+
+        result_list = []
+        for (event, channel, counts, no_clients_total,
+             adj_impression_percentage, adj_client_percentage) in rows:
+            metrics = {
+                'event': event,
+                'channel': channel,
+                'counts': counts,
+                'no_clients_total': no_clients_total if no_clients_total is not None else 0,
+            }
+            if adjusted:
+                metrics['no_clients_total'] = int(
+                    adj_client_percentage * metrics['no_clients_total'] + 0.5)
+                if event == 'impression':
+                    metrics['counts'] = int(adj_impression_percentage * counts + 0.5)
+
+            result_list.append(metrics)
         return result_list
 
     def parse_aggregated_metrics(self, metrics):
@@ -1914,6 +2034,16 @@ class Job(models.Model):
                   'Total', 'CTR (%)', "Total Clients", '|']
                  ]
 
+        # Build an (event, channel) matrix of counts and total clients in a
+        # single pass. Channel None holds the totals of all channels.
+        matrix = {}
+        for row in metrics:
+            for channel in {row['channel'], None}:
+                cell = matrix.setdefault((row['event'], channel), [0, 0])
+                # Handle DB storing None instead of 0
+                cell[0] += row['counts'] or 0
+                cell[1] += row.get('no_clients_total') or 0
+
         for event in ['impression', 'click', 'block', 'go_to_scene2', 'dismiss',
                       'subscribe_success', 'subscribe_error']:
             event_name = event.replace('-', ' ').replace('_', ' ')
@@ -1921,18 +2051,17 @@ class Job(models.Model):
                 event_name,
             ]
             for channel in ['release', 'esr', 'beta', 'aurora', 'nightly', None]:
+                counts, no_clients_total = matrix.get((event, channel), (0, 0))
                 # Number
-                line.append(util.sumdict(metrics, event=event, channel=channel))
+                line.append(counts)
 
                 # CTR
                 if event == 'impression':
                     line.append('-')
                 else:
-                    impressions = util.sumdict(metrics, event='impression', channel=channel)
+                    impressions = matrix.get(('impression', channel), (0, 0))[0]
                     if impressions:
-                        line.append(format(
-                            util.sumdict(metrics, event=event, channel=channel) / impressions, ".4%"
-                        ))
+                        line.append(format(counts / impressions, ".4%"))
                     else:
                         line.append('-')
 
@@ -1942,9 +2071,7 @@ class Job(models.Model):
                         "N/A"
                     )
                 else:
-                    line.append(
-                        util.sumdict(metrics, event=event, channel=channel, key='no_clients_total')
-                    )
+                    line.append(no_clients_total)
 
                 line.append('|')
             lines.append(line)
@@ -1985,31 +2112,40 @@ class ASRSnippet(models.Model):
     def template_ng(self):
         return self.template_relation.subtemplate
 
-    def render(self, preview=False):
-        template_code_name = self.template_ng.code_name
-        template_version = self.template_ng.version
-        data = self.template_ng.render()
+    def render(self, preview=False, variables=None):
+        """Render the snippet and substitute the `[[variable]]` placeholders.
 
-        rendered_snippet = {
-            'template': template_code_name,
-            'template_version': template_version,
-            'content': data,
-            'targeting': self.template_ng.targeting,
-        }
+        Previews replace all job related variables with empty strings.
+        Otherwise `snippet_id` gets substituted along with the given
+        `variables`, e.g. the Job's `campaign_slug`, `job_id` and `channels`.
 
-        if preview:
-            for variable in ['campaign_slug', 'channels', 'snippet_id', 'job_id']:
-                rendered_snippet = util.deep_search_and_replace(
-                    rendered_snippet, f'[[{variable}]]', '')
+        """
+        template = render_cache.get_or_render(self, self.get_render_template)
 
+        if preview:
+            rendered_snippet = template.substitute({
+                variable: '' for variable in ['campaign_slug', 'channels', 'snippet_id', 'job_id']
+            })
             rendered_snippet['id'] = 'preview-{}'.format(self.id)
             # Always set do_not_autoblock when previewing.
             rendered_snippet['content']['do_not_autoblock'] = True
         else:
-            data = util.deep_search_and_replace(data, '[[snippet_id]]', str(self.id))
+            rendered_snippet = template.substitute(dict(variables or {}, snippet_id=str(self.id)))
 
         return rendered_snippet
 
+    def get_render_template(self):
+        template_code_name = self.template_ng.code_name
+        template_version = self.template_ng.version
+        data = self.template_ng.render()
+
+        return util.PlaceholderTemplate({
+            'template': template_code_name,
+            'template_version': template_version,
+            'content': data,
+            'targeting': self.template_ng.targeting,
+        })
+
     def get_preview_url(self, dark=False):
         theme = 'light'
         if dark:
@@ -2095,10 +2231,20 @@ def update_asrsnippet_modified_date(sender, instance, **kwargs):
     elif isinstance(instance, DistributionBundle):
         snippets = {id for id in instance.distributions.values_list('jobs__snippet_id', flat=True)}
 
+    elif isinstance(instance, Locale):
+        snippets = {id for id in instance.asrsnippet_set.values_list('pk', flat=True)}
+
     if snippets:
         ASRSnippet.objects.filter(pk__in=snippets).update(modified=now)
 
 
+@receiver(post_delete, sender='base.Job', dispatch_uid='update_asrsnippet_modified_on_job_delete')
+def update_asrsnippet_modified_date_on_job_delete(sender, instance, **kwargs):
+    # The ASRSnippet of a deleted Job is in fewer bundles now. Update its
+    # modified date so that bundles get generated again.
+    ASRSnippet.objects.filter(pk=instance.snippet_id).update(modified=timezone.now())
+
+
 class Addon(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True)
@@ -2176,19 +2322,30 @@ class JobDailyPerformance(models.Model):
 
     def save(self, *args, **kwargs):
         self.set_adj_percentages()
-        self.adj_impression = int(
-            (self.impression * self.adj_impression_percentage) + 0.5)
+        self.set_adj_impression()
         return super().save(*args, **kwargs)
 
-    def set_adj_percentages(self):
+    @classmethod
+    def get_adj_percentages(cls, date):
+        """Returns a tuple of the adjusted impression and client percentages
+        for `date`."""
         # Find the most recent DailyImpressions object to `date`.
-        di = DailyImpressions.objects.filter(date__lte=self.date).order_by("-date").first()
+        di = DailyImpressions.objects.filter(date__lte=date).order_by("-date").first()
         if not di:
-            self.adj_impression_percentage = self.DEFAULT_IMPRESSION_PERCENTAGE
-            self.adj_client_percentage = self.DEFAULT_CLIENT_PERCENTAGE
-        else:
-            self.adj_impression_percentage = di.percentage_impressions
-            self.adj_client_percentage = di.percentage_clients
+            return cls.DEFAULT_IMPRESSION_PERCENTAGE, cls.DEFAULT_CLIENT_PERCENTAGE
+        return di.percentage_impressions, di.percentage_clients
+
+    def set_adj_percentages(self, adj_percentages=None):
+        """Set the adjusted percentages for `date`. Pass the result of
+        `get_adj_percentages` to avoid querying again for each object of the
+        same date."""
+        if adj_percentages is None:
+            adj_percentages = self.get_adj_percentages(self.date)
+        self.adj_impression_percentage, self.adj_client_percentage = adj_percentages
+
+    def set_adj_impression(self):
+        self.adj_impression = int(
+            (self.impression * self.adj_impression_percentage) + 0.5)
 
     @property
     def adj_block_rate(self):
@@ -2208,6 +2365,61 @@ class JobDailyPerformance(models.Model):
             return 'N/A'
         return float(f'{(self.click / self.impression) * 100:.4f}')
 
+    def get_detail_rows(self):
+        """Returns unsaved JobDailyPerformanceDetail objects for the rows in
+        `details`."""
+        if not isinstance(self.details, list):
+            return []
+        return [
+            JobDailyPerformanceDetail(
+                performance=self,
+                job_id=self.job_id,
+                date=self.date,
+                event=detail['event'],
+                # Not all data have `channel`, `country` or client keys. Keep
+                # missing channels and countries as they are, so that they
+                # only count in totals like in the JSON details.
+                channel=detail.get('channel'),
+                country=detail.get('country'),
+                counts=detail.get('counts') or 0,
+                no_clients=detail.get('no_clients') or 0,
+                no_clients_total=detail.get('no_clients_total') or 0,
+            )
+            for detail in self.details
+        ]
+
+
+class JobDailyPerformanceDetail(models.Model):
+    """The counts of an event of a Job for a date, channel and country.
+
+    Normalized copy of the JobDailyPerformance `details`, stored by the ETL,
+    so that reports group by event, channel or country using indexes
+    instead of unpacking the JSON of every row.
+
+    """
+    performance = models.ForeignKey(JobDailyPerformance, on_delete=models.CASCADE,
+                                    related_name='detail_rows')
+    # Indexed by the composite indexes below.
+    job = models.ForeignKey(Job, on_delete=models.PROTECT, related_name='metric_details',
+                            db_index=False)
+    date = models.DateField(editable=False)
+    event = models.CharField(max_length=64)
+    channel = models.CharField(max_length=32, null=True)
+    country = models.CharField(max_length=16, null=True)
+    counts = models.BigIntegerField(default=0)
+    no_clients = models.BigIntegerField(default=0)
+    no_clients_total = models.BigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['job', 'event', 'channel']),
+            models.Index(fields=['job', 'country']),
+            models.Index(fields=['date', 'event', 'channel']),
+        ]
+
+    def __str__(self):
+        return f'Job #{self.job_id} {self.date} {self.event}'
+
 
 class DailyImpressions(models.Model):
     data_fetched_on = models.DateTimeField(auto_now_add=True)
@@ -2250,3 +2462,132 @@ class DailyImpressions(models.Model):
             percentage_clients = valid_clients / total_clients
 
         return percentage_clients
+
+
+class SlackMessage(models.Model):
+    """Outbox of Slack notifications.
+
+    Messages are stored in the same transaction as the change they notify
+    about and are sent by the `send_slack_messages` command.
+
+    """
+    created = models.DateTimeField(auto_now_add=True)
+    kind = models.CharField(max_length=100, blank=True)
+    data = models.TextField()
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        ordering = ('id',)
+
+    def __str__(self):
+        return f'{self.kind or "message"} #{self.id}'
+
+
+class BundleWatermark(models.Model):
+    """Records up to when pregenerated bundles reflect the database.
+
+    `timestamp` is the time the last successful bundle generation started,
+    so the next one only needs to process Jobs modified since then.
+    `code_version` is the GIT_SHA of the code that generated them, bundles
+    are regenerated when it changes.
+
+    """
+    name = models.CharField(max_length=100, unique=True)
+    timestamp = models.DateTimeField()
+    code_version = models.CharField(max_length=100)
+    modified = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.name}: {self.timestamp} ({self.code_version})'
+
+    @classmethod
+    def get_timestamp(cls, name):
+        """Returns the watermark `name` if it was recorded by the running code
+        version, else None.
+
+        """
+        watermark = cls.objects.filter(name=name).first()
+        if not watermark or watermark.code_version != settings.GIT_SHA:
+            return None
+        return watermark.timestamp
+
+    @classmethod
+    def advance(cls, name, timestamp):
+        cls.objects.update_or_create(
+            name=name,
+            defaults={'timestamp': timestamp, 'code_version': settings.GIT_SHA},
+        )
+
+
+class JobBundleIndex(models.Model):
+    """The bundle files a Job was part of when bundles were last generated.
+
+    A Job is part of the bundle file of each locale in `locales` for each
+    DistributionBundle in `distribution_bundles`. Incremental bundle
+    generation uses it to find the files a changed, completed or deleted Job
+    must be removed from. `job_id` is not a ForeignKey so that the entries of
+    deleted Jobs are kept until the next generation.
+
+    """
+    job_id = models.IntegerField(primary_key=True)
+    locales = ArrayField(models.CharField(max_length=255), default=list)
+    distribution_bundles = ArrayField(models.IntegerField(), default=list)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['distribution_bundles']),
+        ]
+
+    def __str__(self):
+        return f'Job #{self.job_id}'
+
+
+class JobMetricsRollup(models.Model):
+    """Totals of the JobDailyPerformance metrics of a Job.
+
+    Maintained by the ETL when daily metrics are imported, so that listing
+    Jobs with their metrics doesn't aggregate all JobDailyPerformance rows.
+    Rebuild with the `rebuild_job_metrics_rollups` command.
+
+    """
+    job = models.OneToOneField(Job, primary_key=True, on_delete=models.CASCADE,
+                               related_name='metrics_rollup')
+    impression = models.BigIntegerField(default=0)
+    adj_impression = models.BigIntegerField(default=0)
+    click = models.BigIntegerField(default=0)
+    block = models.BigIntegerField(default=0)
+    # The `details` of the Job aggregated per event and channel, as a list of
+    # [event, channel, counts, no_clients_total, adj_impression_percentage,
+    # adj_client_percentage] rows. See `aggregate_details`.
+    details = JSONField(default=list)
+    modified = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Job #{self.job_id}'
+
+    @classmethod
+    def aggregate_details(cls, job_ids=None):
+        """Aggregates the JobDailyPerformanceDetail rows of Jobs in `job_ids`,
+        or of all Jobs if `job_ids` is None, per event and channel.
+
+        Returns a dict of Job IDs to lists of rows in the format of
+        `details`. The adjusted percentages are averaged over the detail
+        rows of each event and channel.
+
+        """
+        rows = JobDailyPerformanceDetail.objects.all()
+        if job_ids is not None:
+            rows = rows.filter(job_id__in=job_ids)
+        rows = (rows
+                .values_list('job_id', 'event', 'channel')
+                .order_by('job_id', 'event', 'channel')
+                .annotate(models.Sum('counts'),
+                          models.Sum('no_clients_total'),
+                          models.Avg('performance__adj_impression_percentage'),
+                          models.Avg('performance__adj_client_percentage')))
+
+        aggregated = {}
+        for row in rows:
+            aggregated.setdefault(row[0], []).append(list(row[1:]))
+        return aggregated
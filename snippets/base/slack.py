@@ -1,29 +1,182 @@
+import json
 import logging
+from datetime import timedelta
 
 from django.conf import settings
+from django.db import transaction
 from django.template.loader import render_to_string
+from django.utils import timezone
 
 import requests
 import sentry_sdk
 
 logger = logging.getLogger(__name__)
 
+# Kinds of messages merged into a single digest message when more than
+# one is waiting in the outbox.
+DIGEST_TITLES = {
+    'job_canceled': '{count} Jobs canceled.',
+    'job_completed': '{count} Jobs completed.',
+    'job_published': '{count} Jobs published.',
+}
+
+# Seconds to wait for Slack to respond to each message.
+POST_TIMEOUT = 4
+
+_session = None
+
+
+def get_session():
+    """Returns a requests Session, to reuse connections to Slack."""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        _session.headers['Content-Type'] = 'application/json'
+    return _session
+
 
 def send_slack(template_name, snippet):
     data = render_to_string('slack/{}.jinja.json'.format(template_name),
                             context={'snippet': snippet})
-    _send_slack(data)
+    queue_slack(data, kind=template_name)
+
 
+def queue_slack(data, kind=''):
+    """Add messages to the outbox.
 
-def _send_slack(data):
+    `data` is a rendered message or a list of them. Messages are stored in
+    the current transaction, so they are not sent if it rolls back.
+
+    """
     if not (settings.SLACK_ENABLE and settings.SLACK_WEBHOOK):
         logger.info('Slack is not enabled.')
         return
 
-    try:
-        response = requests.post(settings.SLACK_WEBHOOK, data=data.encode('utf-8'),
-                                 headers={'Content-Type': 'application/json'},
-                                 timeout=4)
-        response.raise_for_status()
-    except requests.exceptions.RequestException as exp:
-        sentry_sdk.capture_exception(exp)
+    # Imported here because models use this module.
+    from snippets.base.models import SlackMessage
+
+    if isinstance(data, str):
+        data = [data]
+    SlackMessage.objects.bulk_create([SlackMessage(kind=kind, data=item) for item in data])
+
+
+def build_payloads(messages, digest=True):
+    """Returns a list of (data, messages) tuples to send for `messages`.
+
+    With `digest`, messages of the kinds in DIGEST_TITLES are merged, up to
+    SLACK_DIGEST_MAX_ATTACHMENTS attachments each, into one message.
+
+    """
+    payloads = []
+    groups = {}
+    for message in messages:
+        if digest and message.kind in DIGEST_TITLES:
+            groups.setdefault(message.kind, []).append(message)
+        else:
+            payloads.append((message.data, [message]))
+
+    size = max(settings.SLACK_DIGEST_MAX_ATTACHMENTS, 1)
+    for kind, group in groups.items():
+        for idx in range(0, len(group), size):
+            chunk = group[idx:idx + size]
+            if len(chunk) == 1:
+                payloads.append((chunk[0].data, chunk))
+                continue
+            attachments = []
+            for message in chunk:
+                attachments.extend(json.loads(message.data).get('attachments', []))
+            data = json.dumps({
+                'text': DIGEST_TITLES[kind].format(count=len(chunk)),
+                'attachments': attachments,
+            })
+            payloads.append((data, chunk))
+
+    return payloads
+
+
+def discard_messages(messages):
+    """Delete `messages` that failed to send too many times, logging and
+    reporting each of them to Sentry."""
+    from snippets.base.models import SlackMessage
+
+    ids = []
+    for message in messages:
+        error = (f'Discarding Slack message #{message.id} ({message.kind or "no kind"}) '
+                 f'after {message.attempts} attempts.')
+        logger.error(error)
+        sentry_sdk.capture_message(error)
+        ids.append(message.id)
+    if ids:
+        SlackMessage.objects.filter(id__in=ids).delete()
+
+
+def send_outbox(batch_size=None, digest=None):
+    """Send the messages waiting in the outbox.
+
+    Each batch of up to `batch_size` messages is claimed in a short
+    transaction, by counting the attempt and scheduling the next one after
+    the time needed to send the batch plus an exponential backoff. Messages
+    are then sent over a single HTTP session outside of the transaction and
+    deleted as soon as they are sent, so a failure later in the batch
+    doesn't send them again. Messages that fail to send are retried when
+    their next attempt is due, until they reach SLACK_MAX_ATTEMPTS and get
+    discarded.
+
+    Returns a tuple of the number of sent and failed messages.
+
+    """
+    from snippets.base.models import SlackMessage
+
+    if not (settings.SLACK_ENABLE and settings.SLACK_WEBHOOK):
+        logger.info('Slack is not enabled.')
+        return 0, 0
+
+    batch_size = batch_size or settings.SLACK_OUTBOX_BATCH_SIZE
+    if digest is None:
+        digest = settings.SLACK_DIGEST
+
+    # Messages whose last attempt was interrupted, or left over with more
+    # attempts, e.g. after lowering SLACK_MAX_ATTEMPTS.
+    discard_messages(
+        SlackMessage.objects.filter(attempts__gte=settings.SLACK_MAX_ATTEMPTS,
+                                    next_attempt__lte=timezone.now()))
+
+    sent = failed = 0
+    while True:
+        with transaction.atomic():
+            # Skip messages locked by another drainer.
+            messages = list(
+                SlackMessage.objects
+                .select_for_update(skip_locked=True)
+                .filter(next_attempt__lte=timezone.now(),
+                        attempts__lt=settings.SLACK_MAX_ATTEMPTS)[:batch_size]
+            )
+            if not messages:
+                break
+
+            claimed_for = timedelta(seconds=len(messages) * POST_TIMEOUT)
+            for message in messages:
+                message.attempts += 1
+                message.next_attempt = timezone.now() + claimed_for + timedelta(
+                    seconds=settings.SLACK_RETRY_BACKOFF * 2 ** (message.attempts - 1))
+            SlackMessage.objects.bulk_update(messages, ['attempts', 'next_attempt'])
+
+        for data, payload_messages in build_payloads(messages, digest):
+            ids = [message.id for message in payload_messages]
+            try:
+                response = get_session().post(
+                    settings.SLACK_WEBHOOK, data=data.encode('utf-8'), timeout=POST_TIMEOUT)
+                response.raise_for_status()
+            except requests.exceptions.RequestException as exp:
+                sentry_sdk.capture_exception(exp)
+                failed += len(ids)
+                # Already scheduled for retry when claimed.
+                discard_messages([
+                    message for message in payload_messages
+                    if message.attempts >= settings.SLACK_MAX_ATTEMPTS
+                ])
+            else:
+                sent += len(ids)
+                SlackMessage.objects.filter(id__in=ids).delete()
+
+    return sent, failed
@@ -1,6 +1,10 @@
+import atexit
 import random
+import shutil
 import string
+import tempfile
 
+from django.core.cache import caches
 from django.test import TransactionTestCase
 from django.test.utils import override_settings
 
@@ -9,9 +13,18 @@ import factory
 from snippets.base import models
 
 
-@override_settings(SECURE_SSL_REDIRECT=False)
+# Files uploaded by tests, e.g. Icon images, go to a temporary directory
+# instead of the project's media directory.
+MEDIA_ROOT = tempfile.mkdtemp(prefix='snippets-test-media-')
+atexit.register(shutil.rmtree, MEDIA_ROOT, ignore_errors=True)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, MEDIA_ROOT=MEDIA_ROOT)
 class TestCase(TransactionTestCase):
-    pass
+    def _pre_setup(self):
+        super()._pre_setup()
+        # Don't reuse ASRSnippet renders cached by other tests.
+        caches['snippet-renders'].clear()
 
 
 class UserFactory(factory.django.DjangoModelFactory):
@@ -1,12 +1,24 @@
+import csv
+import gzip
+import io
+import json
+from datetime import date
+
 from django.contrib.admin.sites import AdminSite
+from django.db.models import F
 from django.test.client import RequestFactory
+from django.test.utils import override_settings
 
 from unittest.mock import DEFAULT as DEFAULT_MOCK, Mock, patch
 
-from snippets.base.admin.adminmodels import ASRSnippetAdmin, JobAdmin
-from snippets.base.models import STATUS_CHOICES, ASRSnippet, Job
-from snippets.base.tests import (ASRSnippetFactory, JobFactory,
-                                 TestCase, UserFactory)
+from snippets.base.admin import actions
+from snippets.base.admin.adminmodels import (ASRSnippetAdmin, CampaignAdmin, CategoryAdmin,
+                                             IconAdmin, JobAdmin, JobDailyPerformanceAdmin,
+                                             ProductAdmin, TargetAdmin)
+from snippets.base.models import (STATUS_CHOICES, ASRSnippet, Campaign, Category, Icon, Job,
+                                  JobDailyPerformance, JobMetricsRollup, Product, Target)
+from snippets.base.tests import (ASRSnippetFactory, CampaignFactory, IconFactory, JobFactory,
+                                 TargetFactory, TestCase, UserFactory)
 
 
 class ASRSnippetAdminTests(TestCase):
@@ -148,3 +160,148 @@ class JobAdminTests(TestCase):
         )
         self.assertTrue(message_mocks['warning'].called)
         self.assertTrue(message_mocks['success'].called)
+
+    def test_get_queryset_metrics(self):
+        job, job_without_metrics = JobFactory.create_batch(2)
+        JobMetricsRollup.objects.create(job=job, impression=20, adj_impression=10,
+                                        click=2, block=1)
+        request = RequestFactory().get('/')
+        request.user = UserFactory()
+        model_admin = JobAdmin(Job, AdminSite())
+
+        with self.assertNumQueries(1):
+            jobs = {job.id: job for job in model_admin.get_queryset(request)}
+
+        self.assertEqual(model_admin.impressions_humanized(jobs[job.id]), '20')
+        self.assertEqual(model_admin.adj_impressions_humanized(jobs[job.id]), '10')
+        self.assertEqual(model_admin.clicks_ctr(jobs[job.id]), '<span class="">20.0000%</span>')
+        self.assertEqual(model_admin.blocks_ctr(jobs[job.id]), '<span class="">10.0000%</span>')
+        self.assertEqual(model_admin.clicks_humanized(jobs[job_without_metrics.id]), '0')
+        self.assertEqual(model_admin.clicks_ctr(jobs[job_without_metrics.id]), 'N/A')
+
+    def test_get_queryset_order_by_ctr(self):
+        jobs = JobFactory.create_batch(3)
+        JobMetricsRollup.objects.create(job=jobs[0], adj_impression=100, click=1)
+        JobMetricsRollup.objects.create(job=jobs[1], adj_impression=10, click=5)
+        JobMetricsRollup.objects.create(job=jobs[2], adj_impression=0, click=5)
+        request = RequestFactory().get('/')
+        request.user = UserFactory()
+        model_admin = JobAdmin(Job, AdminSite())
+
+        queryset = (model_admin.get_queryset(request)
+                    .order_by(F('clicks_ratio').desc(nulls_last=True)))
+        self.assertEqual(list(queryset), [jobs[1], jobs[0], jobs[2]])
+
+
+class ExportActionsTests(TestCase):
+    def setUp(self):
+        self.model_admin = JobDailyPerformanceAdmin(JobDailyPerformance, None)
+        job = JobFactory()
+        for day in [1, 2]:
+            JobDailyPerformance.objects.create(
+                job=job, date=date(2020, 1, day), impression=100 * day,
+                details=[{'event': 'IMPRESSION', 'counts': 100 * day}])
+        self.queryset = JobDailyPerformance.objects.order_by('date')
+
+    def _rows(self, lines):
+        return list(csv.reader(io.StringIO(lines)))
+
+    @override_settings(CSV_EXPORT_CHUNK_SIZE=1)
+    def test_export_as_csv(self):
+        response = actions.export_as_csv(self.model_admin, None, self.queryset)
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertRegex(response['Content-Disposition'],
+                         r'attachment; filename=base.jobdailyperformance-.*\.csv$')
+        rows = self._rows(b''.join(response.streaming_content).decode('utf-8'))
+        field_names = [field.name for field in JobDailyPerformance._meta.fields]
+        self.assertEqual(rows[0], field_names)
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1][field_names.index('date')], '2020-01-01')
+        self.assertEqual(rows[2][field_names.index('impression')], '200')
+
+    def test_export_as_csv_gzip(self):
+        response = actions.export_as_csv_gzip(self.model_admin, None, self.queryset)
+
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertRegex(response['Content-Disposition'], r'\.csv\.gz$')
+        content = gzip.decompress(b''.join(response.streaming_content)).decode('utf-8')
+        self.assertEqual(len(self._rows(content)), 3)
+
+    def test_export_as_ndjson(self):
+        response = actions.export_as_ndjson(self.model_admin, None, self.queryset)
+
+        self.assertRegex(response['Content-Disposition'], r'\.ndjson\.gz$')
+        content = gzip.decompress(b''.join(response.streaming_content)).decode('utf-8')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1]['date'], '2020-01-02')
+        self.assertEqual(rows[1]['details'], [{'event': 'IMPRESSION', 'counts': 200}])
+
+
+class RelatedCountsTests(TestCase):
+    def setUp(self):
+        self.request = RequestFactory().get('/')
+        self.request.user = UserFactory()
+
+    def _related_counts(self, model_admin, fields):
+        """Returns a dict of object IDs to the values of `fields` for every
+        object of the `model_admin`'s queryset, in a single query.
+
+        """
+        with self.assertNumQueries(1):
+            return {
+                obj.id: [getattr(model_admin, field)(obj) for field in fields]
+                for obj in model_admin.get_queryset(self.request)
+            }
+
+    def test_related_jobs(self):
+        campaign, other_campaign = CampaignFactory.create_batch(2)
+        target = TargetFactory()
+        JobFactory.create_batch(2, campaign=campaign, targets=[target])
+        JobFactory.create(campaign=campaign, status=Job.DRAFT, targets=[target])
+        JobFactory.create(campaign=other_campaign, status=Job.COMPLETED, targets=[target])
+
+        fields = ['related_published_jobs', 'related_total_jobs']
+        counts = self._related_counts(CampaignAdmin(Campaign, AdminSite()), fields)
+        self.assertEqual(counts[campaign.id], [2, 3])
+        self.assertEqual(counts[other_campaign.id], [0, 1])
+
+        counts = self._related_counts(TargetAdmin(Target, AdminSite()), fields)
+        self.assertEqual(counts[target.id], [2, 4])
+
+    def test_related_snippets(self):
+        snippet = ASRSnippetFactory()
+        other_snippet = ASRSnippetFactory(category=snippet.category, product=snippet.product)
+        ASRSnippetFactory(category=snippet.category)
+        JobFactory.create_batch(2, snippet=snippet)
+        JobFactory.create(snippet=other_snippet)
+        JobFactory.create(snippet=other_snippet, status=Job.CANCELED)
+
+        fields = ['related_published_jobs', 'related_total_snippets']
+        counts = self._related_counts(CategoryAdmin(Category, AdminSite()), fields)
+        self.assertEqual(counts[snippet.category.id], [3, 3])
+
+        counts = self._related_counts(ProductAdmin(Product, AdminSite()), fields)
+        self.assertEqual(counts[snippet.product.id], [3, 2])
+
+    def test_icons(self):
+        snippet = ASRSnippetFactory()
+        icon = snippet.template_ng.icon
+        # Same Icon used twice by the same ASRSnippet.
+        snippet.template_ng.title_icon = icon
+        snippet.template_ng.save()
+        other_snippet = ASRSnippetFactory()
+        other_snippet.template_ng.title_icon = icon
+        other_snippet.template_ng.save()
+        JobFactory.create(snippet=snippet)
+        JobFactory.create(snippet=snippet, status=Job.DRAFT)
+        JobFactory.create(snippet=other_snippet)
+        unused_icon = IconFactory()
+
+        counts = self._related_counts(IconAdmin(Icon, AdminSite()),
+                                      ['related_published_jobs', 'related_total_snippets'])
+        self.assertEqual(counts[icon.id], [2, 2])
+        self.assertEqual(counts[unused_icon.id], [0, 0])
+        self.assertEqual(counts[other_snippet.template_ng.icon.id], [1, 1])
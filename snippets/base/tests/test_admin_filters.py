@@ -1,7 +1,11 @@
-from snippets.base.admin.adminmodels import JobAdmin
-from snippets.base.admin.filters import ChannelFilter
-from snippets.base.models import Job
-from snippets.base.tests import JobFactory, TargetFactory, TestCase
+from snippets.base.admin.adminmodels import (ASRSnippetAdmin, CampaignAdmin, CategoryAdmin,
+                                             IconAdmin, JobAdmin)
+from snippets.base.admin.filters import (ASRSnippetLocaleCodeFilter, ChannelFilter,
+                                         IconRelatedPublishedASRSnippetFilter,
+                                         LocaleCodeFilter, RelatedJobsChannelFilter,
+                                         RelatedSnippetsPublishedASRSnippetFilter)
+from snippets.base.models import ASRSnippet, Campaign, Category, Icon, Job
+from snippets.base.tests import IconFactory, JobFactory, TargetFactory, TestCase
 
 
 class ChannelFilterTests(TestCase):
@@ -15,3 +19,73 @@ class ChannelFilterTests(TestCase):
 
         self.assertTrue(result.count(), 2)
         self.assertEqual(set(result.all()), set(nightly_snippets))
+
+    def test_related_jobs(self):
+        nightly_job = JobFactory.create(targets=[TargetFactory(channels='nightly')])
+        JobFactory.create(targets=[TargetFactory(channels='beta')])
+
+        filtr = RelatedJobsChannelFilter(None, {'channel': 'nightly'}, Campaign, CampaignAdmin)
+        result = filtr.queryset(None, Campaign.objects.all())
+
+        self.assertEqual(list(result), [nightly_job.campaign])
+
+
+class LocaleCodeFilterTests(TestCase):
+    def test_job(self):
+        es_job = JobFactory.create(snippet__locale=',es,')
+        es_mx_job = JobFactory.create(snippet__locale=',es-mx,es-ar,')
+        JobFactory.create(snippet__locale=',es-es,')
+
+        filtr = LocaleCodeFilter(None, {'locale_code': 'es-mx'}, Job, JobAdmin)
+        self.assertIn(('es-mx', 'es-mx'), filtr.lookup_choices)
+        result = filtr.queryset(None, Job.objects.all())
+        self.assertEqual(set(result.all()), set([es_job, es_mx_job]))
+
+    def test_asrsnippet(self):
+        es_job = JobFactory.create(snippet__locale=',es,')
+        JobFactory.create(snippet__locale=',es-es,')
+
+        filtr = ASRSnippetLocaleCodeFilter(None, {'locale_code': 'es-mx'}, ASRSnippet,
+                                           ASRSnippetAdmin)
+        result = filtr.queryset(None, ASRSnippet.objects.all())
+        self.assertEqual(list(result), [es_job.snippet])
+
+
+class RelatedSnippetsPublishedASRSnippetFilterTests(TestCase):
+    def test_base(self):
+        published_job = JobFactory.create(status=Job.PUBLISHED)
+        draft_job = JobFactory.create(status=Job.DRAFT)
+
+        filtr = RelatedSnippetsPublishedASRSnippetFilter(
+            None, {'is_currently_published': 'yes'}, Category, CategoryAdmin)
+        self.assertEqual(list(filtr.queryset(None, Category.objects.all())),
+                         [published_job.snippet.category])
+
+        filtr = RelatedSnippetsPublishedASRSnippetFilter(
+            None, {'is_currently_published': 'no'}, Category, CategoryAdmin)
+        self.assertEqual(list(filtr.queryset(None, Category.objects.all())),
+                         [draft_job.snippet.category])
+
+
+class IconRelatedPublishedASRSnippetFilterTests(TestCase):
+    def test_base(self):
+        published_job = JobFactory.create(status=Job.PUBLISHED)
+        published_icon = published_job.snippet.template_ng.icon
+        # Icon used in another field of the Template of a Published Job.
+        title_icon = IconFactory.create()
+        published_job.snippet.template_ng.title_icon = title_icon
+        published_job.snippet.template_ng.save()
+        draft_icon = JobFactory.create(status=Job.DRAFT).snippet.template_ng.icon
+        unused_icon = IconFactory.create()
+
+        filtr = IconRelatedPublishedASRSnippetFilter(
+            None, {'is_currently_published': 'yes'}, Icon, IconAdmin)
+        with self.assertNumQueries(1):
+            self.assertEqual(set(filtr.queryset(None, Icon.objects.all())),
+                             {published_icon, title_icon})
+
+        filtr = IconRelatedPublishedASRSnippetFilter(
+            None, {'is_currently_published': 'no'}, Icon, IconAdmin)
+        with self.assertNumQueries(1):
+            self.assertEqual(set(filtr.queryset(None, Icon.objects.all())),
+                             {draft_icon, unused_icon})
@@ -1,13 +1,25 @@
 import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+from io import StringIO
 from unittest.mock import ANY, DEFAULT, Mock, call, patch
 
+import brotli
+from django.core.files.base import ContentFile
+from django.db import connection
 from django.db.models import Q
-from django.test.utils import override_settings
+from django.test.utils import CaptureQueriesContext, override_settings
 
-from snippets.base.bundles import generate_bundles
-from snippets.base.models import Distribution, DistributionBundle, Job
-from snippets.base.tests import (DistributionBundleFactory, DistributionFactory,
-                                 JobFactory, TargetFactory, TestCase)
+from snippets.base.bundles import (BundleWriter, bundle_digest, generate_bundles,
+                                   generate_bundles_single_pass)
+from snippets.base.models import (Distribution, DistributionBundle, Job, JobBundleIndex,
+                                  Locale)
+from snippets.base.storage import OverwriteStorage
+from snippets.base.tests import (CampaignFactory, DistributionBundleFactory,
+                                 DistributionFactory, JobFactory, TargetFactory, TestCase)
 
 
 class GenerateBundlesTests(TestCase):
@@ -20,14 +32,16 @@ class GenerateBundlesTests(TestCase):
     def test_generate_all(self):
         with patch('snippets.base.bundles.models.Job') as job_mock:
             job_mock.objects.all.return_value = Job.objects.none()
+            job_mock.objects.filter.return_value = Job.objects.none()
             generate_bundles(stdout=Mock())
         job_mock.objects.all.assert_called()
-        job_mock.objects.filter.assert_not_called()
+        # Only the Published Jobs get filtered to update the JobBundleIndex.
+        job_mock.objects.filter.assert_called_once_with(status=job_mock.PUBLISHED)
 
     def test_generate_after_timestamp(self):
         with patch('snippets.base.bundles.models.Job') as job_mock:
             job_mock.objects.filter.return_value = Job.objects.none()
-            generate_bundles(timestamp='2019-01-01', stdout=Mock())
+            generate_bundles(timestamp='2019-01-01', save_to_disk=False, stdout=Mock())
         job_mock.objects.all.assert_not_called()
         job_mock.objects.filter.assert_called_with(
             Q(snippet__modified__gte='2019-01-01') |
@@ -206,3 +220,399 @@ class GenerateBundlesTests(TestCase):
         self.assertEqual(result['metadata']['number_of_snippets'], 0)
         self.assertEqual(result['metadata']['locale'], 'el')
         self.assertEqual(result['metadata']['distribution_bundle'], 'default')
+
+
+class GenerateBundlesSinglePassTests(TestCase):
+    def setUp(self):
+        self.distribution = DistributionFactory.create(name='Default')
+        self.distribution_bundle = DistributionBundleFactory.create(name='Default',
+                                                                    code_name='default')
+        self.distribution_bundle.distributions.add(self.distribution)
+
+    def _generate(self, generator):
+        with patch('snippets.base.bundles.default_storage') as ds_mock:
+            ds_mock.exists.return_value = True
+            generator(stdout=Mock())
+
+        bundles = {}
+        for filename, content_file in [c[0] for c in ds_mock.save.call_args_list]:
+            content = json.loads(content_file.read())
+            content['metadata'].pop('generated_at')
+            bundles[filename] = content
+        deleted = sorted(c[0][0] for c in ds_mock.delete.call_args_list)
+        return bundles, deleted
+
+    def _create_jobs(self):
+        release = TargetFactory(channels='release;beta', jexl_expr='foo == 1')
+        nightly = TargetFactory(channels='nightly', jexl_expr='bar == 2')
+        campaign = CampaignFactory(slug='a-campaign')
+        other_bundle = DistributionBundleFactory(code_name='other')
+        other_bundle.distributions.add(DistributionFactory(name='other'))
+        disabled_bundle = DistributionBundleFactory(code_name='disabled', enabled=False)
+        disabled_bundle.distributions.add(DistributionFactory(name='disabled'))
+
+        JobFactory(status=Job.PUBLISHED, snippet__locale=',en,', targets=[release, nightly])
+        JobFactory(status=Job.PUBLISHED, snippet__locale=',en-us,', campaign=campaign,
+                   client_limit_per_day=2)
+        JobFactory(status=Job.PUBLISHED, snippet__locale=',es-mx,es-ar,', targets=[nightly])
+        JobFactory(status=Job.PUBLISHED, snippet__locale=',fr,', distribution__name='other')
+        JobFactory(status=Job.PUBLISHED, snippet__locale=',el,', distribution__name='disabled')
+        JobFactory(status=Job.COMPLETED, snippet__locale=',de,')
+        JobFactory(status=Job.DRAFT, snippet__locale=',en,', distribution__name='other')
+
+    @override_settings(MEDIA_BUNDLES_PREGEN_ROOT='pregen')
+    def test_same_output_as_generate_bundles(self):
+        self._create_jobs()
+
+        expected_bundles, expected_deleted = self._generate(generate_bundles)
+        bundles, deleted = self._generate(generate_bundles_single_pass)
+
+        self.assertIn('pregen/Firefox/en-us/default.json', bundles)
+        self.assertIn('pregen/Firefox/es-mx/default.json', bundles)
+        self.assertIn('pregen/Firefox/fr/other.json', bundles)
+        self.assertIn('pregen/Firefox/de/default.json', deleted)
+        self.assertIn('pregen/Firefox/el/disabled.json', deleted)
+        self.assertEqual(bundles, expected_bundles)
+        self.assertEqual(deleted, expected_deleted)
+
+    def test_bounded_number_of_queries(self):
+        target = TargetFactory(channels='release')
+        JobFactory(status=Job.PUBLISHED, snippet__locale=',el,', targets=[target])
+
+        with patch('snippets.base.bundles.default_storage'):
+            with CaptureQueriesContext(connection) as queries:
+                generate_bundles_single_pass(stdout=Mock())
+        number_of_queries = len(queries)
+
+        for locale in [',el,', ',fr,', ',en,', ',de,']:
+            JobFactory(status=Job.PUBLISHED, snippet__locale=locale, targets=[target],
+                       campaign=CampaignFactory())
+
+        with patch('snippets.base.bundles.default_storage'):
+            with CaptureQueriesContext(connection) as queries:
+                generate_bundles_single_pass(stdout=Mock())
+        self.assertEqual(len(queries), number_of_queries)
+
+    def test_render_each_job_once(self):
+        JobFactory(status=Job.PUBLISHED, snippet__locale=',en,')
+
+        with patch('snippets.base.bundles.default_storage'):
+            with patch.object(Job, 'render', autospec=True, return_value={}) as render_mock:
+                generate_bundles_single_pass(stdout=Mock())
+
+        self.assertEqual(render_mock.call_count, 1)
+
+    def test_limit_to_locale_dist(self):
+        job = JobFactory(
+            status=Job.PUBLISHED,
+            snippet__locale=',el,',
+        )
+
+        result = json.loads(
+            generate_bundles_single_pass(
+                limit_to_locale='el',
+                limit_to_distribution_bundle='default',
+                save_to_disk=False
+            ).read()
+        )
+
+        self.assertEqual(result['messages'][0]['id'], str(job.id))
+        self.assertEqual(result['metadata']['number_of_snippets'], 1)
+        self.assertEqual(result['metadata']['locale'], 'el')
+        self.assertEqual(result['metadata']['distribution_bundle'], 'default')
+
+    def test_limit_to_locale_dist_no_snippets(self):
+        result = json.loads(
+            generate_bundles_single_pass(
+                limit_to_locale='el',
+                limit_to_distribution_bundle='default',
+                save_to_disk=False
+            ).read()
+        )
+
+        self.assertEqual(len(result['messages']), 0)
+        self.assertEqual(result['metadata']['number_of_snippets'], 0)
+
+
+@override_settings(MEDIA_BUNDLES_PREGEN_ROOT='pregen')
+class IncrementalBundlesTests(TestCase):
+    def setUp(self):
+        self.distribution = DistributionFactory.create(name='Default')
+        self.distribution_bundle = DistributionBundleFactory.create(name='Default',
+                                                                    code_name='default')
+        self.distribution_bundle.distributions.add(self.distribution)
+        self.other_bundle = DistributionBundleFactory.create(name='Other', code_name='other')
+        self.other_bundle.distributions.add(DistributionFactory.create(name='other'))
+
+        self.job_fr = JobFactory.create(status=Job.PUBLISHED, snippet__locale=',fr,')
+        self.job_de = JobFactory.create(status=Job.PUBLISHED, snippet__locale=',de,')
+        self.job_other = JobFactory.create(status=Job.PUBLISHED, snippet__locale=',fr,',
+                                           distribution__name='other')
+
+    def _generate(self, generator=generate_bundles, timestamp=None):
+        with patch.multiple('snippets.base.bundles',
+                            product_details=DEFAULT,
+                            default_storage=DEFAULT) as mock:
+            mock['product_details'].languages.keys.return_value = ['fr', 'de', 'el']
+            mock['default_storage'].exists.return_value = True
+            generator(timestamp=timestamp, stdout=Mock())
+        # Ignore the manifest, removed when bundles change.
+        saved = sorted(c[0][0] for c in mock['default_storage'].save.call_args_list
+                       if c[0][0].startswith('pregen/'))
+        deleted = sorted(c[0][0] for c in mock['default_storage'].delete.call_args_list
+                         if c[0][0].startswith('pregen/'))
+        return saved, deleted
+
+    def _timestamp(self):
+        # Generate all bundles to build the index and return a timestamp
+        # after the generation.
+        self._generate()
+        time.sleep(0.01)
+        return datetime.now()
+
+    def test_index(self):
+        self._generate()
+        self.assertEqual(
+            {entry.job_id: (entry.locales, entry.distribution_bundles)
+             for entry in JobBundleIndex.objects.all()},
+            {
+                self.job_fr.id: (['fr'], [self.distribution_bundle.id]),
+                self.job_de.id: (['de'], [self.distribution_bundle.id]),
+                self.job_other.id: (['fr'], [self.other_bundle.id]),
+            })
+
+    def test_snippet_changed(self):
+        timestamp = self._timestamp()
+        self.job_fr.snippet.save()
+
+        saved, deleted = self._generate(timestamp=timestamp)
+        # Neither pregen/Firefox/de/default.json nor pregen/Firefox/fr/other.json
+        self.assertEqual(saved, ['pregen/Firefox/fr/default.json'])
+        self.assertEqual(deleted, [])
+
+    def test_job_completed(self):
+        timestamp = self._timestamp()
+        self.job_de.change_status(Job.COMPLETED, send_slack=False)
+
+        saved, deleted = self._generate(timestamp=timestamp)
+        self.assertEqual(saved, [])
+        self.assertEqual(deleted, ['pregen/Firefox/de/default.json'])
+        self.assertFalse(JobBundleIndex.objects.filter(job_id=self.job_de.id).exists())
+
+    def test_job_deleted(self):
+        timestamp = self._timestamp()
+        self.job_other.delete()
+
+        saved, deleted = self._generate(timestamp=timestamp)
+        self.assertEqual(saved, [])
+        self.assertEqual(deleted, ['pregen/Firefox/fr/other.json'])
+        self.assertFalse(JobBundleIndex.objects.filter(job_id=self.job_other.id).exists())
+
+    def test_locale_changed(self):
+        timestamp = self._timestamp()
+        snippet = self.job_de.snippet
+        snippet.locale = Locale.objects.create(code=',el,', name='el')
+        snippet.save()
+
+        saved, deleted = self._generate(timestamp=timestamp)
+        self.assertEqual(saved, ['pregen/Firefox/el/default.json'])
+        self.assertEqual(deleted, ['pregen/Firefox/de/default.json'])
+
+    def test_distribution_removed_from_bundle(self):
+        timestamp = self._timestamp()
+        other_distribution = self.job_other.distribution
+        self.other_bundle.distributions.remove(other_distribution)
+        self.distribution_bundle.distributions.add(other_distribution)
+        # Changing the distributions of a DistributionBundle doesn't update
+        # its modified date, saving in the admin does.
+        self.other_bundle.save()
+        self.distribution_bundle.save()
+
+        saved, deleted = self._generate(timestamp=timestamp)
+        self.assertEqual(saved, ['pregen/Firefox/de/default.json',
+                                 'pregen/Firefox/fr/default.json'])
+        self.assertEqual(deleted, ['pregen/Firefox/fr/other.json'])
+
+    def test_single_pass(self):
+        self._generate(generator=generate_bundles_single_pass)
+        self.assertEqual(JobBundleIndex.objects.count(), 3)
+        time.sleep(0.01)
+        timestamp = datetime.now()
+        self.job_de.change_status(Job.COMPLETED, send_slack=False)
+        self.job_fr.snippet.save()
+
+        saved, deleted = self._generate(generator=generate_bundles_single_pass,
+                                        timestamp=timestamp)
+        self.assertEqual(saved, ['pregen/Firefox/fr/default.json'])
+        self.assertEqual(deleted, ['pregen/Firefox/de/default.json'])
+
+    def test_index_not_updated_on_failure(self):
+        timestamp = self._timestamp()
+        self.job_de.change_status(Job.COMPLETED, send_slack=False)
+
+        with patch('snippets.base.bundles.BundleWriter.close', side_effect=Exception()):
+            self.assertRaises(Exception, self._generate, timestamp=timestamp)
+        self.assertTrue(JobBundleIndex.objects.filter(job_id=self.job_de.id).exists())
+
+
+@override_settings(MEDIA_BUNDLES_PREGEN_ROOT='pregen',
+                   MEDIA_BUNDLES_PREGEN_MANIFEST='pregen.manifest.json')
+class BundleWriterTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.storage = OverwriteStorage(location=self.tmpdir.name)
+        patcher = patch('snippets.base.bundles.default_storage', self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def _manifest(self):
+        with self.storage.open('pregen.manifest.json') as manifest_file:
+            return json.loads(manifest_file.read())['bundles']
+
+    def test_skip_unchanged(self):
+        data = [{'id': '1'}]
+        writer = BundleWriter(skip_unchanged=True)
+        writer.save('pregen/Firefox/en-us/default.json', data, 'en-us', 'default')
+        writer.close()
+        self.assertEqual(writer.counts, {'written': 1, 'skipped': 0, 'deleted': 0})
+        self.assertEqual(
+            self._manifest(),
+            {'pregen/Firefox/en-us/default.json': bundle_digest(data, 'en-us', 'default')})
+
+        with patch.object(self.storage, 'save', wraps=self.storage.save) as save_mock:
+            writer = BundleWriter(skip_unchanged=True)
+            writer.save('pregen/Firefox/en-us/default.json', [{'id': '1'}], 'en-us', 'default')
+            writer.close()
+        save_mock.assert_not_called()
+        self.assertEqual(writer.counts, {'written': 0, 'skipped': 1, 'deleted': 0})
+
+        writer = BundleWriter(skip_unchanged=True)
+        writer.save('pregen/Firefox/en-us/default.json', [{'id': '2'}], 'en-us', 'default')
+        writer.close()
+        self.assertEqual(writer.counts, {'written': 1, 'skipped': 0, 'deleted': 0})
+        self.assertEqual(
+            self._manifest(),
+            {'pregen/Firefox/en-us/default.json': bundle_digest([{'id': '2'}], 'en-us',
+                                                                'default')})
+
+    def test_rewrite_on_compression_change(self):
+        writer = BundleWriter(skip_unchanged=True)
+        writer.save('pregen/Firefox/en-us/default.json', [{'id': '1'}], 'en-us', 'default')
+        writer.close()
+
+        with override_settings(BUNDLE_BROTLI_COMPRESS=True):
+            writer = BundleWriter(skip_unchanged=True)
+            writer.save('pregen/Firefox/en-us/default.json', [{'id': '1'}], 'en-us', 'default')
+            writer.close()
+        self.assertEqual(writer.counts, {'written': 1, 'skipped': 0, 'deleted': 0})
+        with self.storage.open('pregen/Firefox/en-us/default.json') as bundle_file:
+            content = json.loads(brotli.decompress(bundle_file.read()))
+        self.assertEqual(content['messages'], [{'id': '1'}])
+
+    def test_delete(self):
+        writer = BundleWriter(skip_unchanged=True)
+        writer.save('pregen/Firefox/en-us/default.json', [{'id': '1'}], 'en-us', 'default')
+        writer.close()
+
+        writer = BundleWriter(skip_unchanged=True)
+        writer.delete('pregen/Firefox/en-us/default.json')
+        writer.delete('pregen/Firefox/fr/default.json')
+        writer.close()
+
+        self.assertEqual(writer.counts, {'written': 0, 'skipped': 0, 'deleted': 1})
+        self.assertFalse(self.storage.exists('pregen/Firefox/en-us/default.json'))
+        self.assertEqual(self._manifest(), {})
+
+    def test_write_all_removes_manifest(self):
+        writer = BundleWriter(skip_unchanged=True)
+        writer.save('pregen/Firefox/en-us/default.json', [{'id': '1'}], 'en-us', 'default')
+        writer.close()
+
+        writer = BundleWriter()
+        writer.save('pregen/Firefox/en-us/default.json', [{'id': '1'}], 'en-us', 'default')
+        writer.close()
+
+        self.assertEqual(writer.counts, {'written': 1, 'skipped': 0, 'deleted': 0})
+        self.assertFalse(self.storage.exists('pregen.manifest.json'))
+
+    def test_invalid_manifest(self):
+        self.storage.save('pregen.manifest.json', ContentFile(b'foo'))
+
+        writer = BundleWriter(skip_unchanged=True, stdout=Mock())
+        writer.save('pregen/Firefox/en-us/default.json', [{'id': '1'}], 'en-us', 'default')
+        writer.close()
+
+        self.assertEqual(writer.counts['written'], 1)
+        self.assertIn('pregen/Firefox/en-us/default.json', self._manifest())
+
+    def test_workers_log_order(self):
+        real_save = self.storage.save
+
+        def slow_save(name, content):
+            time.sleep(random.random() / 50)
+            return real_save(name, content)
+
+        filenames = ['pregen/Firefox/{}/default.json'.format(n) for n in range(20)]
+        stdout = StringIO()
+        with patch.object(self.storage, 'save', side_effect=slow_save):
+            writer = BundleWriter(skip_unchanged=True, workers=4, stdout=stdout)
+            for filename in filenames:
+                writer.save(filename, [{'id': filename}], 'en-us', 'default')
+            writer.close()
+
+        self.assertEqual(
+            stdout.getvalue(),
+            ''.join('Writing bundle {}'.format(filename) for filename in filenames)
+        )
+        self.assertEqual(writer.counts, {'written': 20, 'skipped': 0, 'deleted': 0})
+        self.assertEqual(set(self._manifest()), set(filenames))
+
+    @patch('snippets.base.bundles.time.sleep')
+    def test_retries(self, sleep_mock):
+        real_save = self.storage.save
+        with patch.object(self.storage, 'save',
+                          side_effect=[IOError('timeout'), IOError('timeout'), DEFAULT],
+                          wraps=real_save):
+            writer = BundleWriter(retries=2)
+            writer.save('pregen/Firefox/en-us/default.json', [{'id': '1'}], 'en-us', 'default')
+            writer.close()
+
+        self.assertEqual(writer.counts['written'], 1)
+        self.assertEqual(sleep_mock.call_count, 2)
+
+    @patch('snippets.base.bundles.time.sleep')
+    def test_failure_raised_after_other_bundles(self, sleep_mock):
+        real_save = self.storage.save
+
+        def failing_save(name, content):
+            if name == 'pregen/Firefox/fr/default.json':
+                raise IOError('Cannot write')
+            return real_save(name, content)
+
+        with patch.object(self.storage, 'save', side_effect=failing_save):
+            writer = BundleWriter(skip_unchanged=True, workers=2, retries=1, stdout=Mock())
+            for locale in ['en-us', 'fr', 'el']:
+                writer.save(f'pregen/Firefox/{locale}/default.json', [{'id': '1'}],
+                            locale, 'default')
+            with self.assertRaises(IOError):
+                writer.close()
+
+        self.assertEqual(writer.counts['written'], 2)
+        self.assertEqual(set(self._manifest()),
+                         {'pregen/Firefox/en-us/default.json', 'pregen/Firefox/el/default.json'})
+
+    def test_generate_bundles(self):
+        DistributionBundleFactory.create(
+            name='Default', code_name='default'
+        ).distributions.add(DistributionFactory.create(name='Default'))
+        JobFactory(status=Job.PUBLISHED, snippet__locale=',el,')
+
+        for generator in [generate_bundles, generate_bundles_single_pass]:
+            with self.subTest(generator=generator.__name__):
+                counts = generator(skip_unchanged=True, stdout=Mock())
+                self.assertTrue(os.path.exists(
+                    os.path.join(self.tmpdir.name, 'pregen/Firefox/el/default.json')))
+
+                counts = generator(skip_unchanged=True, stdout=Mock())
+                self.assertEqual(counts, {'written': 0, 'skipped': 1, 'deleted': 0})
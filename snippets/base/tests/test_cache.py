@@ -0,0 +1,138 @@
+from unittest.mock import Mock, patch
+
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.test.utils import override_settings
+
+from snippets.base.cache import BundleCache, render_cache
+from snippets.base.tests import (ASRSnippetFactory, DistributionBundleFactory, JobFactory,
+                                 TestCase)
+
+
+@override_settings(SNIPPET_RENDER_CACHE='snippet-renders')
+class RenderCacheTests(TestCase):
+    def setUp(self):
+        caches['snippet-renders'].clear()
+        render_cache.reset_stats()
+
+    def test_hit(self):
+        snippet = ASRSnippetFactory.create()
+        with patch.object(snippet, 'get_render_template',
+                          wraps=snippet.get_render_template) as render_mock:
+            first = snippet.render()
+            second = snippet.render()
+        self.assertEqual(render_mock.call_count, 1)
+        self.assertEqual(first, second)
+        self.assertEqual(render_cache.stats, {'hits': 1, 'misses': 1})
+
+    def test_modified_snippet_rendered_again(self):
+        snippet = ASRSnippetFactory.create()
+        snippet.render()
+        snippet.name = 'Changed'
+        snippet.save()
+
+        with patch.object(snippet, 'get_render_template',
+                          wraps=snippet.get_render_template) as render_mock:
+            snippet.render()
+        self.assertEqual(render_mock.call_count, 1)
+        self.assertEqual(render_cache.stats, {'hits': 0, 'misses': 2})
+
+    def test_preview_does_not_modify_cached_render(self):
+        snippet = ASRSnippetFactory.create()
+        snippet.render(preview=True)
+        rendered = snippet.render()
+        self.assertNotIn('id', rendered)
+        self.assertFalse(rendered['content'].get('do_not_autoblock', False))
+
+    @override_settings(SNIPPET_RENDER_CACHE='')
+    def test_disabled(self):
+        snippet = ASRSnippetFactory.create()
+        snippet.render()
+        snippet.render()
+        self.assertEqual(render_cache.stats, {'hits': 0, 'misses': 0})
+
+
+@override_settings(INSTANT_BUNDLE_CACHE='', INSTANT_BUNDLE_CACHE_MAX_ENTRIES=2)
+class BundleCacheTests(TestCase):
+    def setUp(self):
+        self.bundle_cache = BundleCache()
+        self.generate = Mock()
+        self.generate.side_effect = lambda: ContentFile('{"messages": []}')
+
+    def test_hit(self):
+        ASRSnippetFactory.create()
+        for _ in range(2):
+            content, content_encoding = self.bundle_cache.get_or_generate(
+                'en-us', 'default', self.generate)
+            self.assertEqual(content, b'{"messages": []}')
+            self.assertIsNone(content_encoding)
+        self.assertEqual(self.generate.call_count, 1)
+
+    def test_content_encoding(self):
+        content_file = ContentFile(b'compressed')
+        content_file.content_encoding = 'br'
+        self.assertEqual(
+            self.bundle_cache.get_or_generate('en-us', 'default', lambda: content_file),
+            (b'compressed', 'br'))
+
+    def test_invalidated_by_modified_snippet(self):
+        snippet = ASRSnippetFactory.create()
+        self.bundle_cache.get_or_generate('en-us', 'default', self.generate)
+        snippet.save()
+        self.bundle_cache.get_or_generate('en-us', 'default', self.generate)
+        self.assertEqual(self.generate.call_count, 2)
+
+    def test_invalidated_by_modified_distribution_bundle(self):
+        distribution_bundle = DistributionBundleFactory.create()
+        self.bundle_cache.get_or_generate('en-us', 'default', self.generate)
+        distribution_bundle.save()
+        self.bundle_cache.get_or_generate('en-us', 'default', self.generate)
+        self.assertEqual(self.generate.call_count, 2)
+
+    def test_invalidated_by_deleted_snippet(self):
+        snippet = ASRSnippetFactory.create()
+        # Newer than the deleted snippet.
+        ASRSnippetFactory.create()
+        self.bundle_cache.get_or_generate('en-us', 'default', self.generate)
+        snippet.template_relation.delete()
+        snippet.delete()
+        self.bundle_cache.get_or_generate('en-us', 'default', self.generate)
+        self.assertEqual(self.generate.call_count, 2)
+
+    def test_invalidated_by_deleted_job(self):
+        job = JobFactory.create()
+        # Newer than the snippet of the deleted Job.
+        ASRSnippetFactory.create()
+        self.bundle_cache.get_or_generate('en-us', 'default', self.generate)
+        job.delete()
+        self.bundle_cache.get_or_generate('en-us', 'default', self.generate)
+        self.assertEqual(self.generate.call_count, 2)
+
+    def test_invalidated_by_modified_locale(self):
+        snippet = ASRSnippetFactory.create()
+        ASRSnippetFactory.create(locale='el')
+        self.bundle_cache.get_or_generate('en-us', 'default', self.generate)
+        snippet.locale.code = ',en-us,en-gb,'
+        snippet.locale.save()
+        self.bundle_cache.get_or_generate('en-us', 'default', self.generate)
+        self.assertEqual(self.generate.call_count, 2)
+
+    def test_evict_least_recently_used(self):
+        self.bundle_cache.get_or_generate('en-us', 'default', self.generate)
+        self.bundle_cache.get_or_generate('el', 'default', self.generate)
+        self.bundle_cache.get_or_generate('en-us', 'default', self.generate)
+        self.bundle_cache.get_or_generate('fr', 'default', self.generate)
+        self.assertEqual(self.generate.call_count, 3)
+
+        # `el` got evicted, `en-us` was used more recently.
+        self.bundle_cache.get_or_generate('en-us', 'default', self.generate)
+        self.assertEqual(self.generate.call_count, 3)
+        self.bundle_cache.get_or_generate('el', 'default', self.generate)
+        self.assertEqual(self.generate.call_count, 4)
+
+    @override_settings(INSTANT_BUNDLE_CACHE='default')
+    def test_shared_cache(self):
+        caches['default'].clear()
+        self.bundle_cache.get_or_generate('en-us', 'default', self.generate)
+        BundleCache().get_or_generate('en-us', 'default', self.generate)
+        self.assertEqual(self.generate.call_count, 1)
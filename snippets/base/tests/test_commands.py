@@ -1,4 +1,10 @@
+import json
+import re
+import threading
+import time
 from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
 
 from unittest.mock import ANY, Mock, call, patch
 
@@ -12,6 +18,96 @@ from snippets.base.management.commands import fetch_daily_metrics
 from snippets.base.tests import JobFactory, TestCase
 
 
+class FakeRedash:
+    """A local HTTP server implementing the parts of the Redash API that
+    RedashDynamicQuery uses.
+
+    Queries render to the JSON of their bind parameters and `get_rows` is
+    called with the parameters to return the rows of each query. Return
+    None to respond with an error instead.
+
+    """
+    def __init__(self, get_rows, delay=0):
+        self.get_rows = get_rows
+        self.delay = delay
+        self.results = {}
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.endpoint = 'http://127.0.0.1:{}'.format(self.server.server_port)
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _run_query(self, query):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(self.delay)
+        rows = self.get_rows(json.loads(query['query']))
+        with self.lock:
+            self.running -= 1
+            result_id = len(self.results) + 1
+            self.results[result_id] = rows
+        return result_id
+
+    def _handler(self):
+        fake_redash = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def respond(self, data, status=200):
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                path = self.path.split('?')[0]
+                match = re.match(r'^/api/queries/(\d+)/results/(\d+).json$', path)
+                if match:
+                    rows = fake_redash.results[int(match.group(2))]
+                    if rows is None:
+                        return self.respond({}, status=500)
+                    return self.respond({'query_result': {'data': {'rows': rows}}})
+
+                match = re.match(r'^/api/jobs/(\d+)$', path)
+                if match:
+                    return self.respond({'job': {
+                        'id': match.group(1), 'status': 3, 'error': '',
+                        'query_result_id': int(match.group(1)),
+                    }})
+
+                match = re.match(r'^/api/queries/(\d+)$', path)
+                if match:
+                    # Render the query to the JSON of the bind parameters.
+                    return self.respond({
+                        'query': ('{"query_id": "%s", "message_id": "{{message_id}}", '
+                                  '"message_ids": "{{message_ids}}", '
+                                  '"start_date": "{{start_date}}", "end_date": "{{end_date}}"}'
+                                  % match.group(1)),
+                        'data_source_id': 1,
+                    })
+                self.respond({}, status=404)
+
+            def do_POST(self):
+                length = int(self.headers['Content-Length'])
+                query = json.loads(self.rfile.read(length))
+                self.respond({'job': {'id': fake_redash._run_query(query)}})
+
+        return Handler
+
+
 @override_settings(REDASH_API_KEY='secret')
 class FetchMetricsTests(TestCase):
     def test_base(self):
@@ -110,6 +206,98 @@ class FetchMetricsTests(TestCase):
         self.assertEqual(job_running2.metric_blocks, 100)
         self.assertEqual(job_running2.metric_clicks, 35)
 
+    def test_concurrent_fake_redash(self):
+        jobs = JobFactory.create_batch(
+            4, status=models.Job.PUBLISHED, publish_start='2050-01-05 01:00',
+            limit_clicks=1000)
+
+        def get_rows(params):
+            if params['message_id'] == str(jobs[1].id):
+                return None
+            return [
+                {'event': 'IMPRESSION', 'counts': int(params['message_id'])},
+                {'event': 'CLICK', 'counts': 3},
+                {'event': 'BLOCK', 'counts': 1},
+            ]
+
+        with FakeRedash(get_rows, delay=0.2) as fake_redash:
+            with override_settings(REDASH_ENDPOINT=fake_redash.endpoint):
+                with patch('snippets.base.management.commands.fetch_metrics.sentry_sdk') as sentry:
+                    call_command('fetch_metrics', workers=4, timeout=5, stdout=Mock())
+
+        self.assertEqual(fake_redash.max_running, 4)
+        self.assertEqual(sentry.capture_exception.call_count, 1)
+        for job in jobs:
+            job.refresh_from_db()
+            if job == jobs[1]:
+                self.assertEqual(job.metric_impressions, 0)
+                self.assertEqual(job.metric_last_update, datetime(1970, 1, 1))
+                continue
+            self.assertEqual(job.metric_impressions, job.id)
+            self.assertEqual(job.metric_clicks, 3)
+            self.assertEqual(job.metric_blocks, 1)
+            self.assertGreater(job.metric_last_update, datetime(1970, 1, 1))
+
+    @override_settings(REDASH_JOB_BATCH_QUERY_ID=100)
+    def test_batched(self):
+        job = JobFactory(status=models.Job.PUBLISHED, publish_start='2050-01-05 01:00',
+                         limit_clicks=1000)
+        job2 = JobFactory(status=models.Job.PUBLISHED, publish_start='2050-01-03 01:00',
+                          limit_clicks=1000)
+        queries = []
+
+        def get_rows(params):
+            queries.append(params)
+            return [
+                {'message_id': job.id, 'date': '2050-01-04', 'event': 'IMPRESSION', 'counts': 1},
+                {'message_id': job.id, 'date': '2050-01-05', 'event': 'IMPRESSION', 'counts': 2},
+                {'message_id': job.id, 'date': '2050-01-06', 'event': 'CLICK', 'counts': 3},
+                {'message_id': job2.id, 'date': '2050-01-04', 'event': 'BLOCK', 'counts': 4},
+                {'message_id': job2.id, 'date': '2050-01-05', 'event': 'CLICK_BUTTON',
+                 'counts': 5},
+                {'message_id': 'unknown', 'date': '2050-01-05', 'event': 'CLICK', 'counts': 6},
+            ]
+
+        with FakeRedash(get_rows) as fake_redash:
+            with override_settings(REDASH_ENDPOINT=fake_redash.endpoint):
+                with patch('snippets.base.management.commands.fetch_metrics.datetime',
+                           wraps=datetime) as datetime_mock:
+                    datetime_mock.utcnow.return_value = datetime(2050, 1, 6)
+                    call_command('fetch_metrics', stdout=Mock())
+
+        self.assertEqual(queries, [{
+            'query_id': '100',
+            'message_id': '',
+            'message_ids': f'{job.id},{job2.id}',
+            'start_date': '2050-01-03',
+            'end_date': '2050-01-06',
+        }])
+        job.refresh_from_db()
+        self.assertEqual((job.metric_impressions, job.metric_blocks, job.metric_clicks),
+                         (2, 0, 3))
+        job2.refresh_from_db()
+        self.assertEqual((job2.metric_impressions, job2.metric_blocks, job2.metric_clicks),
+                         (0, 4, 5))
+
+    @override_settings(REDASH_JOB_BATCH_QUERY_ID=100)
+    def test_batched_fallback(self):
+        job = JobFactory(status=models.Job.PUBLISHED, publish_start='2050-01-05 01:00',
+                         limit_clicks=1000)
+
+        def get_rows(params):
+            if params['query_id'] == '100':
+                return None
+            return [{'event': 'CLICK', 'counts': 7}]
+
+        with FakeRedash(get_rows) as fake_redash:
+            with override_settings(REDASH_ENDPOINT=fake_redash.endpoint):
+                with patch('snippets.base.management.commands.fetch_metrics.sentry_sdk') as sentry:
+                    call_command('fetch_metrics', stdout=Mock())
+
+        self.assertEqual(sentry.capture_exception.call_count, 1)
+        job.refresh_from_db()
+        self.assertEqual(job.metric_clicks, 7)
+
     def test_no_data_fetched(self):
         JobFactory(
             status=models.Job.PUBLISHED,
@@ -263,15 +451,94 @@ class UpdateJobsTests(TestCase):
         self.assertEqual(job_block_limit_not_reached_just_created.status, models.Job.PUBLISHED)
 
 
+@override_settings(BUNDLE_GENERATION_WORKERS=1, BUNDLE_GENERATION_RETRIES=2)
 class GenerateBundlesTests(TestCase):
 
     def test_base(self):
         with patch('snippets.base.management.commands.generate_bundles.bundles') as bundles_mock:
             call_command('generate_bundles', timestamp='2020-12-31', stdout=Mock())
-            bundles_mock.generate_bundles.assert_called_with(timestamp='2020-12-31', stdout=ANY)
+            bundles_mock.generate_bundles.assert_called_with(
+                timestamp='2020-12-31', skip_unchanged=True, workers=1, retries=2, stdout=ANY)
 
             call_command('generate_bundles', stdout=Mock())
-            bundles_mock.generate_bundles.assert_called_with(timestamp=None, stdout=ANY)
+            bundles_mock.generate_bundles.assert_called_with(
+                timestamp=None, skip_unchanged=True, workers=1, retries=2, stdout=ANY)
+
+    def test_single_pass(self):
+        with patch('snippets.base.management.commands.generate_bundles.bundles') as bundles_mock:
+            call_command('generate_bundles', single_pass=True, stdout=Mock())
+        bundles_mock.generate_bundles_single_pass.assert_called_with(
+            timestamp=None, skip_unchanged=True, workers=1, retries=2, stdout=ANY)
+        bundles_mock.generate_bundles.assert_not_called()
+
+    def test_write_all(self):
+        with patch('snippets.base.management.commands.generate_bundles.bundles') as bundles_mock:
+            call_command('generate_bundles', write_all=True, stdout=Mock())
+        bundles_mock.generate_bundles.assert_called_with(
+            timestamp=None, skip_unchanged=False, workers=1, retries=2, stdout=ANY)
+
+    def test_workers(self):
+        with patch('snippets.base.management.commands.generate_bundles.bundles') as bundles_mock:
+            call_command('generate_bundles', workers=8, retries=0, stdout=Mock())
+        bundles_mock.generate_bundles.assert_called_with(
+            timestamp=None, skip_unchanged=True, workers=8, retries=0, stdout=ANY)
+
+    @override_settings(GIT_SHA='abc')
+    def test_incremental(self):
+        with patch('snippets.base.management.commands.generate_bundles.bundles') as bundles_mock:
+            # Without a watermark all bundles get generated.
+            call_command('generate_bundles', incremental=True, stdout=Mock())
+            self.assertEqual(bundles_mock.generate_bundles.call_args[1]['timestamp'], None)
+            watermark = models.BundleWatermark.objects.get(name='bundles')
+            self.assertEqual(watermark.code_version, 'abc')
+
+            # The next run processes changes since the previous run started.
+            call_command('generate_bundles', incremental=True, stdout=Mock())
+            self.assertEqual(bundles_mock.generate_bundles.call_args[1]['timestamp'],
+                             watermark.timestamp)
+            self.assertTrue(
+                models.BundleWatermark.objects.get(name='bundles').timestamp >=
+                watermark.timestamp)
+
+            # A new code version regenerates all bundles.
+            with override_settings(GIT_SHA='def'):
+                call_command('generate_bundles', incremental=True, stdout=Mock())
+            self.assertEqual(bundles_mock.generate_bundles.call_args[1]['timestamp'], None)
+            self.assertEqual(
+                models.BundleWatermark.objects.get(name='bundles').code_version, 'def')
+
+    def test_incremental_failure(self):
+        models.BundleWatermark.objects.create(
+            name='bundles', timestamp=datetime(2020, 1, 1), code_version=settings.GIT_SHA)
+        with patch('snippets.base.management.commands.generate_bundles.bundles') as bundles_mock:
+            bundles_mock.generate_bundles.side_effect = Exception('Storage error')
+            self.assertRaises(Exception, call_command, 'generate_bundles',
+                              incremental=True, stdout=Mock())
+            bundles_mock.generate_bundles.assert_called_with(
+                timestamp=datetime(2020, 1, 1), skip_unchanged=True, workers=1, retries=2,
+                stdout=ANY)
+
+        # The watermark does not advance.
+        self.assertEqual(models.BundleWatermark.objects.get().timestamp, datetime(2020, 1, 1))
+
+    def test_timestamp_does_not_advance_watermark(self):
+        with patch('snippets.base.management.commands.generate_bundles.bundles'):
+            call_command('generate_bundles', timestamp='2020-12-31', stdout=Mock())
+            self.assertFalse(models.BundleWatermark.objects.exists())
+            self.assertRaises(CommandError, call_command, 'generate_bundles',
+                              timestamp='2020-12-31', incremental=True, stdout=Mock())
+
+    def test_report_counts(self):
+        stdout = StringIO()
+        with patch('snippets.base.management.commands.generate_bundles.bundles') as bundles_mock:
+            bundles_mock.generate_bundles.return_value = {
+                'written': 3, 'skipped': 2, 'deleted': 1,
+            }
+            call_command('generate_bundles', stdout=stdout)
+        output = stdout.getvalue()
+        self.assertIn('Bundles written: 3', output)
+        self.assertIn('Bundles skipped: 2', output)
+        self.assertIn('Bundles deleted: 1', output)
 
 
 @override_settings(REDASH_API_KEY='secret')
@@ -313,12 +580,73 @@ class FetchDailyMetricsTests(TestCase):
                 etl_mock.update_job_metrics.return_value = True
                 call_command('fetch_daily_metrics', stdout=Mock())
 
-        self.assertEqual(len(etl_mock.update_impressions.mock_calls), 2)
+        # Impression data are fetched once for each Monday.
+        mondays = {d - timedelta(days=d.weekday()) for d in [two_days_ago, three_days_ago]}
+        self.assertEqual(len(etl_mock.update_impressions.mock_calls), len(mondays))
         self.assertEqual(len(etl_mock.update_job_metrics.mock_calls), 2)
 
-        etl_mock.update_impressions.has_calls(
-            [call(two_days_ago), call(three_days_ago)], any_order=True
+        etl_mock.update_impressions.assert_has_calls(
+            [call(monday) for monday in mondays], any_order=True
         )
-        etl_mock.update_job_metrics.has_calls(
+        etl_mock.update_job_metrics.assert_has_calls(
             [call(two_days_ago), call(three_days_ago)], any_order=True
         )
+
+    def test_date_range(self):
+        models.JobDailyPerformance.objects.create(job=JobFactory(), date=date(2050, 1, 5))
+        models.DailyImpressions.objects.create(date=date(2050, 1, 3))
+
+        with patch('snippets.base.management.commands.fetch_daily_metrics.etl') as etl_mock:
+            etl_mock.update_impressions.return_value = True
+            etl_mock.update_job_metrics.return_value = True
+            call_command('fetch_daily_metrics', from_date='2050-01-04', to_date='2050-01-10',
+                         workers=3, stdout=Mock())
+
+        etl_mock.update_impressions.assert_called_once_with(date(2050, 1, 10))
+        self.assertEqual(
+            sorted(c[1][0] for c in etl_mock.update_job_metrics.mock_calls),
+            [date(2050, 1, 4), date(2050, 1, 6), date(2050, 1, 7), date(2050, 1, 8),
+             date(2050, 1, 9), date(2050, 1, 10)])
+
+    def test_failed_dates_do_not_stop_other_dates(self):
+        def update_job_metrics(d):
+            if d == date(2050, 1, 4):
+                raise Exception('error')
+            return d != date(2050, 1, 5)
+
+        with patch('snippets.base.management.commands.fetch_daily_metrics.etl') as etl_mock:
+            with patch('snippets.base.management.commands.fetch_daily_metrics.sentry_sdk'):
+                etl_mock.update_impressions.return_value = True
+                etl_mock.update_job_metrics.side_effect = update_job_metrics
+                with self.assertRaisesMessage(
+                        CommandError,
+                        'Cannot fetch data from Telemetry for 2050-01-04, 2050-01-05.'):
+                    call_command('fetch_daily_metrics', from_date='2050-01-04',
+                                 to_date='2050-01-06', workers=2, stdout=Mock())
+
+        self.assertEqual(len(etl_mock.update_job_metrics.mock_calls), 3)
+
+
+class SendSlackMessagesTests(TestCase):
+    def test_base(self):
+        stdout = StringIO()
+        with patch('snippets.base.management.commands.send_slack_messages.slack') as slack_mock:
+            slack_mock.send_outbox.return_value = (3, 1)
+            call_command('send_slack_messages', batch_size=10, no_digest=True, stdout=stdout)
+
+        slack_mock.send_outbox.assert_called_with(batch_size=10, digest=False)
+        self.assertIn('Slack messages sent: 3', stdout.getvalue())
+        self.assertIn('Slack messages failed: 1', stdout.getvalue())
+
+
+class RebuildJobMetricsRollupsTests(TestCase):
+    def test_base(self):
+        job = JobFactory()
+        models.JobDailyPerformance(date=date(2020, 1, 9), impression=5, job=job).save()
+        models.JobDailyPerformance(date=date(2020, 1, 10), impression=7, job=job).save()
+        stdout = StringIO()
+
+        call_command('rebuild_job_metrics_rollups', stdout=stdout)
+
+        self.assertEqual(models.JobMetricsRollup.objects.get(job=job).impression, 12)
+        self.assertIn('Job metric rollups rebuilt: 1', stdout.getvalue())
@@ -1,13 +1,17 @@
+import copy
 from datetime import date
 from unittest.mock import patch
 
 from django.test import TestCase
+from django.test.utils import override_settings
 
 from snippets.base import etl
-from snippets.base.models import DailyImpressions, Job, JobDailyPerformance
-from snippets.base.tests import JobFactory
+from snippets.base.models import (DailyImpressions, Job, JobDailyPerformance,
+                                  JobDailyPerformanceDetail, JobMetricsRollup)
+from snippets.base.tests import MEDIA_ROOT, JobFactory
 
 
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
 class TestRedashRows(TestCase):
     @patch('snippets.base.etl.redash.query',
            return_value={'query_result': {'data': {'rows': ['mock rows']}}})
@@ -19,6 +23,7 @@ class TestRedashRows(TestCase):
         query.assert_called_with(query_id, bind_data)
 
 
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
 class TestUpdateJobMetrics(TestCase):
     def test_base(self):
         JobFactory.create(
@@ -281,6 +286,162 @@ class TestUpdateJobMetrics(TestCase):
             self.assertTrue(detail in jdp2.details)
 
 
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class TestAggregateRows(TestCase):
+    def test_base(self):
+        rows = [
+            {'message_id': '1', 'event_context': '{}', 'event': 'IMPRESSION',
+             'channel': 'release-cck', 'country_code': 'GR', 'counts': 10,
+             'no_clients': 2, 'no_clients_total': 5},
+            {'message_id': '1', 'event_context': '', 'event': 'IMPRESSION',
+             'channel': 'release', 'country_code': 'GR', 'counts': 5,
+             'no_clients': 1, 'no_clients_total': 1},
+            {'message_id': '1', 'event_context': '{}', 'event': 'BLOCK',
+             'channel': 'beta', 'country_code': None, 'counts': 3,
+             'no_clients': 1, 'no_clients_total': 0},
+            {'message_id': '2', 'event_context': '{}', 'event': 'IMPRESSION',
+             'channel': 'release', 'country_code': 'GR', 'counts': 7,
+             'no_clients': 7, 'no_clients_total': 0},
+            {'message_id': '3', 'event_context': '{}', 'event': 'IMPRESSION',
+             'channel': 'release', 'country_code': 'GR', 'counts': 1,
+             'no_clients': 1, 'no_clients_total': 0},
+        ]
+        original_rows = copy.deepcopy(rows)
+
+        processed = etl.aggregate_rows(iter(rows), {'1', '2'})
+
+        self.assertEqual(rows, original_rows)
+        self.assertEqual(processed, {
+            '1': {
+                'impression': 15,
+                'impression_no_clients_total': 6,
+                'block': 3,
+                'details': [
+                    {'event': 'impression', 'channel': 'release', 'country': 'GR',
+                     'counts': 15, 'no_clients': 3, 'no_clients_total': 6},
+                    {'event': 'block', 'channel': 'beta', 'country': 'XX',
+                     'counts': 3, 'no_clients': 1, 'no_clients_total': 0},
+                ],
+            },
+            '2': {
+                'impression': 7,
+                'impression_no_clients_total': 0,
+                'details': [
+                    {'event': 'impression', 'channel': 'release', 'country': 'GR',
+                     'counts': 7, 'no_clients': 7, 'no_clients_total': 0},
+                ],
+            },
+        })
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class TestSaveJobMetrics(TestCase):
+    def test_base(self):
+        jobs = JobFactory.create_batch(3)
+        DailyImpressions.objects.create(
+            date=date(2020, 1, 9),
+            details=[
+                {'channel': 'release', 'duration': '4', 'counts': 50_000, 'no_clients': 10},
+                {'channel': 'release', 'duration': '6', 'counts': 150_000, 'no_clients': 30},
+            ])
+        JobDailyPerformance(date=date(2020, 1, 10), impression=1, job=jobs[0]).save()
+        processed = {
+            str(job.id): {'impression': 11 * (idx + 1), 'click': idx}
+            for idx, job in enumerate(jobs)
+        }
+
+        # Including the JobDailyPerformanceDetail and JobMetricsRollup updates.
+        with self.assertNumQueries(15):
+            etl.save_job_metrics(date(2020, 1, 10), processed)
+
+        self.assertEqual(JobDailyPerformance.objects.count(), 3)
+        for idx, job in enumerate(jobs):
+            metric = JobDailyPerformance.objects.get(job=job)
+            self.assertEqual(metric.click, idx)
+            self.assertEqual(metric.adj_impression_percentage, 0.75)
+            # Same adjusted values as `save()` sets.
+            expected = JobDailyPerformance(date=date(2020, 1, 10), job=job,
+                                           impression=11 * (idx + 1))
+            expected.set_adj_percentages()
+            expected.set_adj_impression()
+            self.assertEqual(metric.adj_impression, expected.adj_impression)
+            self.assertEqual(metric.adj_client_percentage, expected.adj_client_percentage)
+
+    def test_detail_rows(self):
+        jobs = JobFactory.create_batch(2)
+        detail = {'event': 'click', 'channel': 'beta', 'country': 'GR',
+                  'counts': 10, 'no_clients': 2, 'no_clients_total': 3}
+        etl.save_job_metrics(date(2020, 1, 10), {
+            str(jobs[0].id): {'click': 10, 'details': [detail]},
+            str(jobs[1].id): {'click': 10, 'details': [detail]},
+        })
+
+        # Reimport replaces the rows of the date.
+        etl.save_job_metrics(date(2020, 1, 10), {
+            str(jobs[0].id): {'click': 5, 'details': [dict(detail, counts=5)]},
+        })
+
+        row = JobDailyPerformanceDetail.objects.get()
+        self.assertEqual(row.performance, JobDailyPerformance.objects.get())
+        self.assertEqual(row.job, jobs[0])
+        self.assertEqual(row.date, date(2020, 1, 10))
+        self.assertEqual((row.event, row.channel, row.country), ('click', 'beta', 'GR'))
+        self.assertEqual((row.counts, row.no_clients, row.no_clients_total), (5, 2, 3))
+
+    def test_update_rollups(self):
+        jobs = JobFactory.create_batch(3)
+        JobDailyPerformance(date=date(2020, 1, 9), impression=5, click=1, job=jobs[0]).save()
+        JobDailyPerformance(date=date(2020, 1, 10), impression=7, block=2, job=jobs[1]).save()
+        JobDailyPerformance(date=date(2020, 1, 10), impression=9, job=jobs[2]).save()
+        etl.update_job_metrics_rollups()
+
+        # Reimport 2020-01-10 without data for jobs[2].
+        etl.save_job_metrics(date(2020, 1, 10), {
+            str(jobs[0].id): {'impression': 10, 'click': 3},
+            str(jobs[1].id): {'impression': 20, 'block': 4},
+        })
+
+        rollups = {rollup.job_id: rollup for rollup in JobMetricsRollup.objects.all()}
+        self.assertEqual(set(rollups), {jobs[0].id, jobs[1].id})
+        self.assertEqual(rollups[jobs[0].id].impression, 15)
+        self.assertEqual(rollups[jobs[0].id].click, 4)
+        self.assertEqual(rollups[jobs[1].id].impression, 20)
+        self.assertEqual(rollups[jobs[1].id].block, 4)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class TestUpdateJobMetricsRollups(TestCase):
+    def test_base(self):
+        jobs = JobFactory.create_batch(2)
+        JobDailyPerformance(date=date(2020, 1, 9), impression=5, click=1, job=jobs[0]).save()
+        JobDailyPerformance(date=date(2020, 1, 10), impression=7, block=2, job=jobs[0]).save()
+
+        self.assertEqual(etl.update_job_metrics_rollups(), 1)
+
+        rollup = JobMetricsRollup.objects.get()
+        self.assertEqual(rollup.job, jobs[0])
+        self.assertEqual(rollup.impression, 12)
+        self.assertEqual(rollup.click, 1)
+        self.assertEqual(rollup.block, 2)
+
+    def test_job_ids(self):
+        jobs = JobFactory.create_batch(2)
+        for job in jobs:
+            JobDailyPerformance(date=date(2020, 1, 9), impression=5, job=job).save()
+        JobMetricsRollup.objects.create(job=jobs[1], impression=100)
+
+        self.assertEqual(etl.update_job_metrics_rollups([jobs[0].id]), 1)
+
+        self.assertEqual(JobMetricsRollup.objects.get(job=jobs[0]).impression, 5)
+        # Other Jobs are left alone.
+        self.assertEqual(JobMetricsRollup.objects.get(job=jobs[1]).impression, 100)
+
+    def test_no_job_ids(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(etl.update_job_metrics_rollups([]), 0)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
 class TestUpdateImpressions(TestCase):
     def test_base(self):
         with patch('snippets.base.etl.redash_rows') as rr_mock:
@@ -75,3 +75,11 @@ class JobFilterTests(TestCase):
         filtr = JobFilter(QueryDict(query_string=f'only_scheduled=all&locale={locale.id}'),
                           queryset=models.Job.objects.all())
         self.assertEqual(set([job]), set(filtr.qs))
+
+    def test_locale_code(self):
+        job = JobFactory.create(snippet__locale=',es,')
+        job2 = JobFactory.create(snippet__locale=',es-mx,es-ar,')
+        JobFactory.create(snippet__locale=',es-es,')
+        filtr = JobFilter(QueryDict(query_string='only_scheduled=all&locale_code=es-mx'),
+                          queryset=models.Job.objects.all())
+        self.assertEqual(set([job, job2]), set(filtr.qs))
@@ -1,26 +1,32 @@
 import copy
 import io
 import subprocess
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 
 from PIL import Image
-from unittest.mock import Mock, patch
+from unittest.mock import ANY, Mock, patch
 
 from django.conf import settings
+from django.contrib.admin.models import LogEntry
 from django.core.exceptions import ValidationError
 from django.core.files import File
 from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.db import transaction
 from django.db.models.deletion import ProtectedError
 from django.test.utils import override_settings
 from django.urls import reverse
 
+from snippets.base import etl
+from snippets.base.cache import render_cache
 from snippets.base.models import (STATUS_CHOICES,
                                   Icon,
                                   Locale,
                                   Job,
+                                  JobDailyPerformance,
                                   SimpleTemplate,
+                                  SlackMessage,
                                   _generate_filename)
-from snippets.base.util import fluent_link_extractor
+from snippets.base.util import PlaceholderTemplate, fluent_link_extractor
 from snippets.base.tests import (ASRSnippetFactory,
                                  DistributionBundleFactory,
                                  IconFactory,
@@ -238,6 +244,31 @@ class IconTests(TestCase):
 
         self.assertEqual(job.snippet.template_ng.icon, None)
 
+    def test_can_be_deleted_other_field(self):
+        job = JobFactory(status=Job.COMPLETED)
+        icon = job.snippet.template_ng.icon
+        # Also used as the title icon of a Snippet with a Published Job.
+        published_job = JobFactory(status=Job.PUBLISHED)
+        published_job.snippet.template_ng.title_icon = icon
+        published_job.snippet.template_ng.save()
+
+        self.assertRaises(ProtectedError, icon.delete)
+
+        published_job.change_status(status=Job.COMPLETED)
+        icon.delete()
+        published_job.snippet.template_ng.refresh_from_db()
+        self.assertEqual(published_job.snippet.template_ng.title_icon, None)
+
+    def test_snippets(self):
+        icon = IconFactory()
+        snippet = ASRSnippetFactory(template_relation__icon=icon,
+                                    template_relation__title_icon=icon)
+        other_snippet = ASRSnippetFactory(template_relation__section_title_icon=icon)
+        ASRSnippetFactory()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(set(icon.snippets), {snippet, other_snippet})
+
 
 class ASRSnippetTests(TestCase):
     def test_render(self):
@@ -269,6 +300,18 @@ class ASRSnippetTests(TestCase):
         }
         self.assertEqual(generated_result, expected_result)
 
+    def test_render_cached(self):
+        snippet = ASRSnippetFactory.create()
+        render_cache.reset_stats()
+        with patch.object(snippet, 'get_render_template',
+                          wraps=snippet.get_render_template) as render_mock:
+            first = snippet.render()
+            second = snippet.render()
+
+        self.assertEqual(first, second)
+        self.assertEqual(render_mock.call_count, 1)
+        self.assertEqual(render_cache.stats, {'hits': 1, 'misses': 1})
+
     def test_render_preview_only(self):
         snippet = ASRSnippetFactory.create(
             template_relation__text=('snippet id *[[snippet_id]]* '
@@ -445,6 +488,15 @@ class LocaleTests(TestCase):
         locale.save()
         self.assertEqual(locale.code, ',bar,')
 
+    def test_codes(self):
+        locale = Locale(name='foo', code='ES-MX,es-ar')
+        locale.save()
+        self.assertEqual(locale.codes, ['es-mx', 'es-ar'])
+
+    def test_get_matching_codes(self):
+        self.assertEqual(Locale.get_matching_codes('ES-mx'), ['es', 'es-mx'])
+        self.assertEqual(Locale.get_matching_codes('fr'), ['fr'])
+
 
 class JobTests(TestCase):
     def test_channels(self):
@@ -498,8 +550,13 @@ class JobTests(TestCase):
             }
         })
         job.snippet.render = Mock()
-        job.snippet.render.return_value = snippet_render
+        job.snippet.render.side_effect = PlaceholderTemplate(snippet_render).substitute
         generated_output = job.render()
+        job.snippet.render.assert_called_with(variables={
+            'campaign_slug': 'demo-campaign',
+            'job_id': str(job.id),
+            'channels': 'BETA_NIGHTLY',
+        })
 
         self.assertEqual(generated_output, expected_output)
 
@@ -589,7 +646,7 @@ class JobTests(TestCase):
 
         self.assertEqual(job.status, Job.SCHEDULED)
         log_entry_mock.objects.log_action.assert_called()
-        slack_mock._send_slack.assert_called()
+        slack_mock.queue_slack.assert_called_with(ANY, kind='job_scheduled')
 
     def test_change_status_to_completed(self):
         job = JobFactory.create(status=Job.DRAFT)
@@ -601,6 +658,57 @@ class JobTests(TestCase):
         self.assertEqual(job.status, Job.COMPLETED)
         self.assertEqual(job.completed_on, datetime(2019, 1, 1, 0, 0))
 
+    @override_settings(SLACK_ENABLE=True, SLACK_WEBHOOK='https://example.com')
+    def test_bulk_change_status(self):
+        user = UserFactory.create()
+        jobs = JobFactory.create_batch(3, status=Job.PUBLISHED)
+        job_completed = JobFactory.create(status=Job.COMPLETED)
+        snippet_modified = {job.id: job.snippet.modified for job in jobs}
+
+        with patch('snippets.base.models.datetime') as datetime_mock:
+            datetime_mock.utcnow.return_value = datetime(2019, 1, 1, 0, 0)
+            changed = Job.bulk_change_status(
+                Job.objects.all(), status=Job.COMPLETED, user=user, reason='Foo.')
+
+        self.assertEqual({job.id for job in changed}, {job.id for job in jobs})
+        self.assertEqual(
+            list(SlackMessage.objects.values_list('kind', flat=True)), ['job_completed'] * 3)
+
+        for job in jobs:
+            job.refresh_from_db()
+            self.assertEqual(job.status, Job.COMPLETED)
+            self.assertEqual(job.completed_on, datetime(2019, 1, 1, 0, 0))
+            self.assertTrue(job.snippet.modified > snippet_modified[job.id])
+
+        log_entries = LogEntry.objects.filter(user=user)
+        self.assertEqual({int(entry.object_id) for entry in log_entries},
+                         {job.id for job in jobs})
+        self.assertEqual({entry.change_message for entry in log_entries},
+                         {'Changed status to Completed. Foo.'})
+        self.assertFalse(LogEntry.objects.filter(object_id=str(job_completed.id)).exists())
+
+    def test_bulk_change_status_queries(self):
+        user = UserFactory.create()
+        JobFactory.create_batch(5, status=Job.SCHEDULED)
+
+        # Select Jobs, update Jobs, update ASRSnippets, get ContentType
+        # and create LogEntries.
+        with self.assertNumQueries(5):
+            Job.bulk_change_status(
+                Job.objects.all(), status=Job.PUBLISHED, user=user, send_slack=False)
+
+    @override_settings(SLACK_ENABLE=True, SLACK_WEBHOOK='https://example.com')
+    def test_bulk_change_status_rollback(self):
+        JobFactory.create_batch(2, status=Job.PUBLISHED)
+
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                Job.bulk_change_status(Job.objects.all(), status=Job.CANCELED)
+                raise ValueError()
+
+        self.assertEqual(Job.objects.filter(status=Job.PUBLISHED).count(), 2)
+        self.assertFalse(SlackMessage.objects.exists())
+
     @override_settings(SITE_URL='http://example.com')
     def test_get_admin_url(self):
         job = JobFactory.create()
@@ -628,6 +736,98 @@ class JobTests(TestCase):
         self.assertEqual(duplicate_job.metric_blocks, 0)
         self.assertEqual(duplicate_job.completed_on, None)
 
+    def _create_daily_metrics(self, job):
+        for day, counts in [(date(2020, 1, 9), 100), (date(2020, 1, 10), 300)]:
+            etl.save_job_metrics(day, {str(job.id): {'details': [
+                {'event': 'impression', 'channel': 'release', 'country': 'GR',
+                 'counts': counts, 'no_clients': 10, 'no_clients_total': 20},
+                {'event': 'impression', 'channel': 'beta', 'country': 'GR',
+                 'counts': counts // 2, 'no_clients': 0, 'no_clients_total': 0},
+                {'event': 'click', 'channel': 'release', 'country': 'GR',
+                 'counts': counts // 10, 'no_clients': 0, 'no_clients_total': 0},
+            ]}})
+
+    def test_get_aggregated_metrics(self):
+        job = JobFactory.create()
+        self._create_daily_metrics(job)
+        expected = [
+            {'event': 'click', 'channel': 'release', 'counts': 40, 'no_clients_total': 0},
+            {'event': 'impression', 'channel': 'beta', 'counts': 200, 'no_clients_total': 0},
+            {'event': 'impression', 'channel': 'release', 'counts': 400, 'no_clients_total': 40},
+        ]
+        job.metrics_rollup.delete()
+        job = Job.objects.get(id=job.id)
+        # Without a rollup the metrics get queried.
+        self.assertEqual(job.get_aggregated_metrics(), expected)
+
+        etl.update_job_metrics_rollups([job.id])
+        job = Job.objects.get(id=job.id)
+        with self.assertNumQueries(1):
+            self.assertEqual(job.get_aggregated_metrics(), expected)
+            adjusted = job.get_aggregated_metrics(adjusted=True)
+
+        self.assertEqual(adjusted[0]['counts'], 40)
+        self.assertEqual(adjusted[2]['counts'],
+                         int(400 * JobDailyPerformance.DEFAULT_IMPRESSION_PERCENTAGE + 0.5))
+        self.assertEqual(adjusted[2]['no_clients_total'],
+                         int(40 * JobDailyPerformance.DEFAULT_CLIENT_PERCENTAGE + 0.5))
+
+    def test_parse_aggregated_metrics(self):
+        job = JobFactory.create(status=Job.COMPLETED)
+        self._create_daily_metrics(job)
+
+        lines = job.parse_aggregated_metrics(job.get_aggregated_metrics())
+
+        self.assertEqual(len(lines), 8)
+        impression, click, block = lines[1:4]
+        self.assertEqual(impression[:4], ['impression', 400, '-', 40])
+        self.assertEqual(impression[9:12], [200, '-', 0])
+        self.assertEqual(impression[-4:], [600, '-', 40, '|'])
+        self.assertEqual(click[:4], ['click', 40, '10.0000%', 0])
+        self.assertEqual(click[-4:], [40, '6.6667%', 0, '|'])
+        self.assertEqual(block[1:4], [0, '0.0000%', 0])
+        self.assertEqual(block[-4:], [0, '0.0000%', 0, '|'])
+
+    def test_parse_aggregated_metrics_null_channel(self):
+        job = JobFactory.create(status=Job.COMPLETED)
+        metrics = [
+            {'event': 'impression', 'channel': 'release', 'counts': 100, 'no_clients_total': 10},
+            {'event': 'impression', 'channel': None, 'counts': 50, 'no_clients_total': 5},
+            {'event': 'click', 'channel': None, 'counts': 15, 'no_clients_total': 0},
+        ]
+
+        lines = job.parse_aggregated_metrics(metrics)
+
+        impression, click = lines[1:3]
+        self.assertEqual(impression[1], 100)
+        # Rows without channel count once, in the Total only.
+        self.assertEqual(impression[-4:], [150, '-', 15, '|'])
+        self.assertEqual(click[1:3], [0, '0.0000%'])
+        self.assertEqual(click[-4:], [15, '10.0000%', 0, '|'])
+
+
+class JobDailyPerformanceTests(TestCase):
+    def test_get_detail_rows(self):
+        job = JobFactory.create()
+        metric = JobDailyPerformance(job=job, date=date(2020, 1, 9), details=[
+            {'event': 'click', 'channel': 'beta', 'country': 'GR',
+             'counts': 10, 'no_clients': 2, 'no_clients_total': 3},
+            {'event': 'impression', 'channel': '', 'counts': 100},
+        ])
+        metric.save()
+
+        rows = metric.get_detail_rows()
+
+        self.assertEqual(
+            [(row.performance, row.job_id, row.date, row.event, row.channel, row.country,
+              row.counts, row.no_clients, row.no_clients_total) for row in rows],
+            [(metric, job.id, date(2020, 1, 9), 'click', 'beta', 'GR', 10, 2, 3),
+             (metric, job.id, date(2020, 1, 9), 'impression', '', None, 100, 0, 0)]
+        )
+
+    def test_get_detail_rows_no_details(self):
+        self.assertEqual(JobDailyPerformance(details={}).get_detail_rows(), [])
+
 
 class TargetTests(TestCase):
     def test_is_custom(self):
@@ -1,23 +1,146 @@
-from unittest.mock import patch
+import json
+from datetime import datetime, timedelta
+from unittest.mock import Mock, patch
 
+from django.db import connection
 from django.test.utils import override_settings
 
+import requests
+
 from snippets.base import slack
+from snippets.base.models import SlackMessage
 from snippets.base.tests import TestCase
 
 
-class SendSlackTests(TestCase):
+def job_message(job_id):
+    return json.dumps({'attachments': [{'title': f'Job #{job_id} completed.'}]})
+
+
+@override_settings(SLACK_ENABLE=True, SLACK_WEBHOOK='https://example.com',
+                   SLACK_MAX_ATTEMPTS=3, SLACK_RETRY_BACKOFF=60,
+                   SLACK_DIGEST_MAX_ATTACHMENTS=2)
+class OutboxTests(TestCase):
+    def test_queue_slack(self):
+        slack.queue_slack('foo', kind='bar')
+        slack.queue_slack(['one', 'two'])
+        self.assertEqual(
+            list(SlackMessage.objects.values_list('kind', 'data')),
+            [('bar', 'foo'), ('', 'one'), ('', 'two')])
+
     @override_settings(SLACK_ENABLE=False)
-    def test_slack_disalbed(self):
-        with patch('snippets.base.slack.requests') as requests_mock:
-            slack._send_slack('foo')
-        self.assertFalse(requests_mock.called)
-
-    @override_settings(SLACK_ENABLE=True, SLACK_WEBHOOK='https://example.com')
-    def test_slack_enabled(self):
-        with patch('snippets.base.slack.requests') as requests_mock:
-            slack._send_slack('foo')
-        self.assertTrue(requests_mock.post.called)
-        requests_mock.post.assert_called_with(
-            'https://example.com', data=b'foo', timeout=4,
-            headers={'Content-Type': 'application/json'})
+    def test_queue_slack_disabled(self):
+        slack.queue_slack('foo')
+        self.assertFalse(SlackMessage.objects.exists())
+
+    def test_build_payloads(self):
+        messages = [
+            SlackMessage(id=1, kind='job_completed', data=job_message(1)),
+            SlackMessage(id=2, kind='asr_ready_for_review', data='foo'),
+            SlackMessage(id=3, kind='job_completed', data=job_message(3)),
+            SlackMessage(id=4, kind='job_completed', data=job_message(4)),
+        ]
+        payloads = slack.build_payloads(messages)
+
+        self.assertEqual([[m.id for m in chunk] for data, chunk in payloads],
+                         [[2], [1, 3], [4]])
+        self.assertEqual(payloads[0][0], 'foo')
+        self.assertEqual(json.loads(payloads[1][0]), {
+            'text': '2 Jobs completed.',
+            'attachments': [{'title': 'Job #1 completed.'}, {'title': 'Job #3 completed.'}],
+        })
+        self.assertEqual(payloads[2][0], job_message(4))
+
+    def test_build_payloads_no_digest(self):
+        messages = [
+            SlackMessage(id=1, kind='job_completed', data=job_message(1)),
+            SlackMessage(id=2, kind='job_completed', data=job_message(2)),
+        ]
+        payloads = slack.build_payloads(messages, digest=False)
+        self.assertEqual([data for data, chunk in payloads], [job_message(1), job_message(2)])
+
+    def test_send_outbox(self):
+        slack.queue_slack([job_message(idx) for idx in range(3)], kind='job_completed')
+        slack.queue_slack('foo')
+
+        with patch('snippets.base.slack.get_session') as get_session_mock:
+            sent, failed = slack.send_outbox(batch_size=2)
+
+        self.assertEqual((sent, failed), (4, 0))
+        # Two batches: a digest of two messages, then one Job message and
+        # the other message.
+        self.assertEqual(get_session_mock.return_value.post.call_count, 3)
+        self.assertFalse(SlackMessage.objects.exists())
+
+    def test_send_outbox_posts_outside_transaction(self):
+        slack.queue_slack('foo')
+
+        def post(*args, **kwargs):
+            self.assertFalse(connection.in_atomic_block)
+            return Mock()
+
+        with patch('snippets.base.slack.get_session') as get_session_mock:
+            get_session_mock.return_value.post.side_effect = post
+            self.assertEqual(slack.send_outbox(), (1, 0))
+
+    def test_send_outbox_error_keeps_sent_messages_deleted(self):
+        slack.queue_slack(['foo', 'bar'])
+
+        with patch('snippets.base.slack.get_session') as get_session_mock:
+            get_session_mock.return_value.post.side_effect = [Mock(), Exception('error')]
+            with self.assertRaises(Exception):
+                slack.send_outbox()
+
+        # The sent message is not sent again, the other one is retried later.
+        message = SlackMessage.objects.get()
+        self.assertEqual(message.data, 'bar')
+        self.assertEqual(message.attempts, 1)
+        self.assertTrue(message.next_attempt > datetime.now())
+
+    def test_send_outbox_retry(self):
+        slack.queue_slack('foo')
+        session_mock = patch('snippets.base.slack.get_session').start()
+        self.addCleanup(patch.stopall)
+        session_mock.return_value.post.side_effect = requests.exceptions.ConnectionError()
+
+        with patch('snippets.base.slack.sentry_sdk') as sentry_sdk_mock:
+            self.assertEqual(slack.send_outbox(), (0, 1))
+        sentry_sdk_mock.capture_exception.assert_called()
+
+        message = SlackMessage.objects.get()
+        self.assertEqual(message.attempts, 1)
+        self.assertTrue(message.next_attempt > datetime.now() + timedelta(seconds=50))
+
+        # Not sent again before the backoff expires.
+        self.assertEqual(slack.send_outbox(), (0, 0))
+
+        session_mock.return_value.post.side_effect = None
+        SlackMessage.objects.update(next_attempt=datetime(2020, 1, 1))
+        self.assertEqual(slack.send_outbox(), (1, 0))
+        self.assertFalse(SlackMessage.objects.exists())
+
+    def test_send_outbox_max_attempts(self):
+        slack.queue_slack('foo')
+        SlackMessage.objects.update(attempts=3)
+        with patch('snippets.base.slack.get_session') as get_session_mock:
+            with patch('snippets.base.slack.sentry_sdk') as sentry_sdk_mock:
+                self.assertEqual(slack.send_outbox(), (0, 0))
+        get_session_mock.return_value.post.assert_not_called()
+        # Discarded and reported.
+        self.assertFalse(SlackMessage.objects.exists())
+        sentry_sdk_mock.capture_message.assert_called()
+
+    def test_send_outbox_discard_after_last_attempt(self):
+        slack.queue_slack(['foo', 'bar'])
+        SlackMessage.objects.filter(data='foo').update(attempts=2)
+        with patch('snippets.base.slack.get_session') as get_session_mock:
+            get_session_mock.return_value.post.side_effect = requests.exceptions.ConnectionError()
+            with patch('snippets.base.slack.sentry_sdk') as sentry_sdk_mock:
+                with self.assertLogs('snippets.base.slack', 'ERROR') as logs:
+                    self.assertEqual(slack.send_outbox(), (0, 2))
+
+        message = SlackMessage.objects.get()
+        self.assertEqual(message.data, 'bar')
+        self.assertEqual(message.attempts, 1)
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('after 3 attempts', logs.output[0])
+        sentry_sdk_mock.capture_message.assert_called_once()
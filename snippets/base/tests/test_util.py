@@ -1,8 +1,9 @@
 from django.http.request import QueryDict
 
 from snippets.base.tests import TestCase
-from snippets.base.util import (convert_special_link, deep_search_and_replace,
-                                sumdict, first, fluent_link_extractor, urlparams)
+from snippets.base.util import (PlaceholderTemplate, convert_special_link,
+                                deep_search_and_replace, sumdict, first,
+                                fluent_link_extractor, urlparams)
 
 
 class TestFirst(TestCase):
@@ -100,6 +101,16 @@ class TestFluentLinkExtractorTests(TestCase):
         self.assertEqual(final_data['nolinks'], generated_data['nolinks'])
         self.assertEqual(final_data['links'], generated_data['links'])
 
+    def test_links_not_shared_between_calls(self):
+        data = {
+            'text': '<a href="https://example.com" data-metric="">example</a>',
+        }
+        for _ in range(2):
+            generated_data = fluent_link_extractor(data, ['text'])
+            self.assertEqual(generated_data['text'], '<link0>example</link0>')
+            self.assertEqual(generated_data['links'], {'link0': {'url': 'https://example.com'}})
+        self.assertNotIn('links', data)
+
 
 class ConvertSpecialLinkTests(TestCase):
     def test_base(self):
@@ -162,6 +173,48 @@ class DeepSearchAndReplaceTests(TestCase):
         self.assertEqual(generated_data, expected_data)
 
 
+class PlaceholderTemplateTests(TestCase):
+    def test_base(self):
+        data = {
+            'text': '[[snippet_id]] [[job_id]] [[job_id]] [[unknown]] [[',
+            'list': [
+                'this includes [[channels]]',
+                'in a list',
+            ],
+            'links': {
+                'link0': {
+                    'url': 'http://example.com/?utm_term=[[job_id]]&utm_campaign=[[campaign_slug]]'
+                }
+            },
+            'tall': False,
+        }
+        template = PlaceholderTemplate(data)
+        generated_data = template.substitute({
+            'snippet_id': '1', 'job_id': '2', 'channels': 'REL', 'campaign_slug': 'foo',
+        })
+        expected_data = {
+            'text': '1 2 2 [[unknown]] [[',
+            'list': [
+                'this includes REL',
+                'in a list',
+            ],
+            'links': {
+                'link0': {
+                    'url': 'http://example.com/?utm_term=2&utm_campaign=foo'
+                }
+            },
+            'tall': False,
+        }
+        self.assertEqual(generated_data, expected_data)
+
+        # Substituting again starts from the original data.
+        generated_data['links']['link0']['url'] = 'changed'
+        self.assertEqual(template.substitute({'job_id': '3'})['text'],
+                         '[[snippet_id]] 3 3 [[unknown]] [[')
+        self.assertEqual(template.substitute()['links']['link0']['url'],
+                         'http://example.com/?utm_term=[[job_id]]&utm_campaign=[[campaign_slug]]')
+
+
 class URLParamsTests(TestCase):
     def test_base(self):
         url = 'https://www.example.com/?foo=foo&locale=el&a=5'
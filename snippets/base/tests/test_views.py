@@ -1,5 +1,6 @@
 from unittest.mock import DEFAULT, patch
 
+from django.core.files.base import ContentFile
 from django.http import Http404
 from django.test.client import RequestFactory
 from django.test.utils import override_settings
@@ -7,6 +8,7 @@ from django.urls import reverse
 
 import snippets.base.models
 from snippets.base import views
+from snippets.base.cache import bundle_cache
 from snippets.base.tests import ASRSnippetFactory, TestCase
 
 snippets.base.models.CHANNELS = ('release', 'beta', 'aurora', 'nightly')
@@ -73,8 +75,9 @@ class FetchSnippetPregenBundleTests(TestCase):
 
     @override_settings(INSTANT_BUNDLE_GENERATION=True)
     def test_instant_bundle_generation(self):
+        bundle_cache.clear()
         with patch('snippets.base.views.generate_bundles') as generate_bundles_mock:
-            generate_bundles_mock.return_value = 'foo=bar'
+            generate_bundles_mock.return_value = ContentFile('foo=bar')
             response = views.fetch_snippet_pregen_bundle(self.request, **self.asrclient_kwargs)
         generate_bundles_mock.assert_called_with(
             limit_to_locale='el-gr',
@@ -83,8 +86,20 @@ class FetchSnippetPregenBundleTests(TestCase):
         )
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertFalse(response.has_header('Content-Encoding'))
         self.assertEqual(response.content, b'foo=bar')
 
+    @override_settings(INSTANT_BUNDLE_GENERATION=True)
+    def test_instant_bundle_generation_compressed(self):
+        bundle_cache.clear()
+        content_file = ContentFile(b'compressed')
+        content_file.content_encoding = 'br'
+        with patch('snippets.base.views.generate_bundles') as generate_bundles_mock:
+            generate_bundles_mock.return_value = content_file
+            response = views.fetch_snippet_pregen_bundle(self.request, **self.asrclient_kwargs)
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(response.content, b'compressed')
+
 
 class PreviewASRSnippetTests(TestCase):
     def test_base(self):
@@ -1,4 +1,3 @@
-import copy
 import re
 from urllib.parse import ParseResult, urlencode, urlparse
 
@@ -100,64 +99,64 @@ def convert_special_link(url):
     return action, args, entrypoint_name, entrypoint_value
 
 
+LINK_RE = re.compile(r'(<a(?P<attrs> .*?)>)(?P<innerText>.+?)(</a>)')
+LINK_ATTRIBUTE_RE = re.compile(r'(?P<name>[\w-]+)="(?P<value>.*?)"')
+
+
+def _fluent_link(attrs):
+    """Returns the fluent link dict for the attributes of an <a> element."""
+    attributes = dict(LINK_ATTRIBUTE_RE.findall(attrs))
+    url = attributes.get('href', '')
+
+    action, args, entrypoint_name, entrypoint_value = convert_special_link(url)
+
+    if action:
+        link = {
+            'action': action,
+        }
+        if args:
+            link['args'] = args
+        if entrypoint_name:
+            link['entrypoint_name'] = entrypoint_name
+        if entrypoint_value:
+            link['entrypoint_value'] = entrypoint_value
+    else:
+        link = {
+            'url': url,
+        }
+
+    # Add the optional data-metric attrib
+    if attributes.get('data-metric'):
+        link['metric'] = attributes['data-metric']
+
+    return link
+
+
 def fluent_link_extractor(data, variables):
     """Replaces all <a> elements with fluent.js link elements sequentially
     numbered.
 
-    Returns a tuple with the new text and a dict of all the links with url and
-    custom metric where available.
+    Returns a copy of data with the new text and a dict of all the links
+    with url and custom metric where available. Only the `variables` fields
+    are replaced, all other values are shared with `data`.
 
     """
-    class Replacer:
-        link_counter = 0
-        links = {}
-
-        def __call__(self, matchobj):
-            keyname = 'link{0}'.format(self.link_counter)
-            replacement = '<{keyname}>{text}</{keyname}>'.format(
-                keyname=keyname,
-                text=matchobj.group('innerText'))
-            # Find the URL
-            url_match = re.search('href="(?P<url>.+?)"', matchobj.group('attrs'))
-            url = ''
-
-            if url_match:
-                url = url_match.group('url')
-
-            action, args, entrypoint_name, entrypoint_value = convert_special_link(url)
-
-            if action:
-                self.links[keyname] = {
-                    'action': action,
-                }
-                if args:
-                    self.links[keyname]['args'] = args
-                if entrypoint_name:
-                    self.links[keyname]['entrypoint_name'] = entrypoint_name
-                if entrypoint_value:
-                    self.links[keyname]['entrypoint_value'] = entrypoint_value
-            else:
-                self.links[keyname] = {
-                    'url': url,
-                }
-
-            # Find the optional data-metric attrib
-            metric_match = re.search('data-metric="(?P<metric>.+?)"', matchobj.group('attrs'))
-            if metric_match:
-                self.links[keyname]['metric'] = metric_match.group('metric')
-
-            self.link_counter += 1
-            return replacement
-
-    local_data = copy.deepcopy(data)
-    replacer = Replacer()
+    links = {}
+
+    def replace(matchobj):
+        keyname = 'link{0}'.format(len(links))
+        links[keyname] = _fluent_link(matchobj.group('attrs'))
+        return '<{keyname}>{text}</{keyname}>'.format(
+            keyname=keyname,
+            text=matchobj.group('innerText'))
+
+    local_data = dict(data)
     for variable in variables:
         if variable not in local_data:
             continue
-        local_data[variable] = re.sub('(<a(?P<attrs> .*?)>)(?P<innerText>.+?)(</a>)',
-                                      replacer, local_data[variable])
+        local_data[variable] = LINK_RE.sub(replace, local_data[variable])
 
-    local_data['links'] = replacer.links
+    local_data['links'] = links
     return local_data
 
 
@@ -175,6 +174,58 @@ def deep_search_and_replace(data, search_string, replace_string):
     return data
 
 
+PLACEHOLDER_RE = re.compile(r'(\[\[\w+\]\])')
+
+
+class PlaceholderTemplate:
+    """Substitutes `[[variable]]` placeholders in nested snippet data.
+
+    The data is scanned once on creation and every string containing
+    placeholders is split into literal and placeholder parts. `substitute`
+    then replaces all variables in a single walk, no matter how many
+    variables are given, and returns a new copy of the data each time, so
+    the same template can be rendered for multiple Jobs.
+
+    Placeholders without a value are left untouched, like
+    `deep_search_and_replace` does.
+
+    """
+    def __init__(self, data):
+        self.compiled = self._compile(data)
+
+    @classmethod
+    def _compile(cls, value):
+        if isinstance(value, dict):
+            return (dict, {key: cls._compile(item) for key, item in value.items()})
+        elif isinstance(value, list):
+            return (list, [cls._compile(item) for item in value])
+        elif isinstance(value, str) and '[[' in value:
+            parts = PLACEHOLDER_RE.split(value)
+            if len(parts) > 1:
+                return (PlaceholderTemplate, parts)
+        return (None, value)
+
+    def substitute(self, variables=None):
+        return self._substitute(self.compiled, {
+            f'[[{key}]]': value for key, value in (variables or {}).items()
+        })
+
+    @classmethod
+    def _substitute(cls, compiled, placeholders):
+        kind, value = compiled
+        if kind is dict:
+            return {key: cls._substitute(item, placeholders) for key, item in value.items()}
+        elif kind is list:
+            return [cls._substitute(item, placeholders) for item in value]
+        elif kind is PlaceholderTemplate:
+            # Odd indexes hold the placeholders captured by PLACEHOLDER_RE.
+            return ''.join([
+                placeholders.get(part, part) if idx % 2 else part
+                for idx, part in enumerate(value)
+            ])
+        return value
+
+
 def sumdict(dct, key='counts', channel=None, event=None):
     """Helper function to sum all `key`s from a `list` of `dicts` with optional
     `channel` and `event` filtering.
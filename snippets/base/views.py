@@ -20,6 +20,7 @@ from ratelimit.decorators import ratelimit
 
 from redirector.redirect import calculate_redirect
 from snippets.base.bundles import generate_bundles
+from snippets.base.cache import bundle_cache
 from snippets.base.filters import JobFilter
 from snippets.base.models import ASRSnippet
 
@@ -62,12 +63,18 @@ def fetch_snippet_pregen_bundle(request, **kwargs):
                                                         distribution=kwargs['distribution'])
 
     if settings.INSTANT_BUNDLE_GENERATION:
-        content = generate_bundles(
-            limit_to_locale=locale,
-            limit_to_distribution_bundle=distribution,
-            save_to_disk=False
+        content, content_encoding = bundle_cache.get_or_generate(
+            locale, distribution,
+            lambda: generate_bundles(
+                limit_to_locale=locale,
+                limit_to_distribution_bundle=distribution,
+                save_to_disk=False
+            )
         )
-        return HttpResponse(status=200, content=content, content_type='application/json')
+        response = HttpResponse(status=200, content=content, content_type='application/json')
+        if content_encoding:
+            response['Content-Encoding'] = content_encoding
+        return response
 
     return HttpResponseRedirect(full_url)
 
@@ -124,6 +124,10 @@ MEDIA_URL = config('MEDIA_URL', '/media/')
 MEDIA_ROOT = config('MEDIA_ROOT', default=os.path.join(BASE_DIR, 'media'))
 MEDIA_BUNDLES_ROOT = config('MEDIA_BUNDLES_ROOT', default='bundles/')
 MEDIA_BUNDLES_PREGEN_ROOT = config('MEDIA_BUNDLES_PREGEN_ROOT', default='bundles-pregen/')
+# Digests of the pregenerated bundles, used to skip writing unchanged bundles.
+MEDIA_BUNDLES_PREGEN_MANIFEST = config(
+    'MEDIA_BUNDLES_PREGEN_MANIFEST',
+    default='{}.manifest.json'.format(MEDIA_BUNDLES_PREGEN_ROOT.rstrip('/')))
 MEDIA_ICONS_ROOT = config('MEDIA_ICONS_ROOT', default='icons/')
 
 SESSION_COOKIE_SECURE = config('SESSION_COOKIE_SECURE', default=not DEBUG, cast=bool)
@@ -202,6 +206,10 @@ SNIPPET_BUNDLE_PREGEN_REDIRECT_TIMEOUT = config(
     'SNIPPET_BUNDLE_PREGEN_REDIRECT_TIMEOUT', default=60 * 60 * 24, cast=int)  # One day
 
 BUNDLE_BROTLI_COMPRESS = config('BUNDLE_BROTLI_COMPRESS', default=False, cast=bool)
+# Number of threads compressing and uploading bundles in parallel and number of
+# times to retry a failed upload.
+BUNDLE_GENERATION_WORKERS = config('BUNDLE_GENERATION_WORKERS', default=1, cast=int)
+BUNDLE_GENERATION_RETRIES = config('BUNDLE_GENERATION_RETRIES', default=2, cast=int)
 
 SITE_URL = config('SITE_URL', default='')
 SITE_HEADER = config('SITE_HEADER', default='Snippets Administration')
@@ -219,6 +227,19 @@ CACHES = {
     },
 }
 
+# Memoized ASRSnippet renders. Set to another cache alias, e.g. `default`, to
+# share renders between processes or to an empty string to disable.
+SNIPPET_RENDER_CACHE = config('SNIPPET_RENDER_CACHE', default='snippet-renders')
+CACHES['snippet-renders'] = {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'snippet-renders',
+    'OPTIONS': {
+        # LocMemCache evicts the least recently used entries.
+        'MAX_ENTRIES': config('SNIPPET_RENDER_CACHE_MAX_ENTRIES', default=2000, cast=int),
+        'CULL_FREQUENCY': 10,  # 1/10 entries deleted if max reached
+    }
+}
+
 PROD_DETAILS_CACHE_NAME = 'product-details'
 PROD_DETAILS_STORAGE = config('PROD_DETAILS_STORAGE',
                               default='product_details.storage.PDFileStorage')
@@ -249,6 +270,10 @@ DEAD_MANS_SNITCH_UPDATE_JOBS = config('DEAD_MANS_SNITCH_UPDATE_JOBS', default=No
 DEAD_MANS_SNITCH_FETCH_METRICS = config('DEAD_MANS_SNITCH_FETCH_METRICS', default=None)
 DEAD_MANS_SNITCH_FETCH_DAILY_METRICS = config('DEAD_MANS_SNITCH_FETCH_DAILY_METRICS', default=None)
 
+# Run the clock's management commands in a new process instead of in the
+# clock process, so a crashing or leaking command cannot take the clock down.
+CRON_SUBPROCESS = config('CRON_SUBPROCESS', default=False, cast=bool)
+
 ENGAGE_ROBOTS = config('ENGAGE_ROBOTS', default=False)
 
 ADMIN_REDIRECT_URL = config('ADMIN_REDIRECT_URL', default=None)
@@ -326,8 +351,22 @@ ADMIN_REORDER = [
 ]
 
 
+# Number of rows fetched from the database at a time by the admin export
+# actions, which stream their response.
+CSV_EXPORT_CHUNK_SIZE = config('CSV_EXPORT_CHUNK_SIZE', default=2000, cast=int)
+
 SLACK_ENABLE = config('SLACK_ENABLE', default=False, cast=bool)
 SLACK_WEBHOOK = config('SLACK_WEBHOOK', default='')
+# Slack messages are queued in the SlackMessage outbox and sent by the
+# send_slack_messages command in batches of SLACK_OUTBOX_BATCH_SIZE.
+SLACK_OUTBOX_BATCH_SIZE = config('SLACK_OUTBOX_BATCH_SIZE', default=50, cast=int)
+# Failed messages are retried after SLACK_RETRY_BACKOFF seconds, doubling
+# on every attempt, up to SLACK_MAX_ATTEMPTS times.
+SLACK_MAX_ATTEMPTS = config('SLACK_MAX_ATTEMPTS', default=5, cast=int)
+SLACK_RETRY_BACKOFF = config('SLACK_RETRY_BACKOFF', default=60, cast=int)
+# Merge Job status change messages waiting together into digest messages.
+SLACK_DIGEST = config('SLACK_DIGEST', default=True, cast=bool)
+SLACK_DIGEST_MAX_ATTACHMENTS = config('SLACK_DIGEST_MAX_ATTACHMENTS', default=20, cast=int)
 
 IMAGE_OPTIMIZE = config('IMAGE_OPTIMIZE', default=True, cast=bool)
 # Set to zero to disable
@@ -347,9 +386,20 @@ REDASH_JOB_QUERY_ID = config('REDASH_JOB_QUERY_ID', default=63146)
 REDASH_JOB_QUERY_BIGQUERY_ID = config('REDASH_JOB_QUERY_BIGQUERY_ID', default=66681)
 
 REDASH_UPDATE_INTERVAL = config('REDASH_UPDATE_INTERVAL', default=600)
+# Query returning the metrics of multiple Jobs, used by fetch_metrics instead
+# of one query per Job when set.
+REDASH_JOB_BATCH_QUERY_ID = config('REDASH_JOB_BATCH_QUERY_ID', default=None)
+# Number of Redash queries fetch_metrics and fetch_daily_metrics run
+# concurrently.
+REDASH_FETCH_WORKERS = config('REDASH_FETCH_WORKERS', default=1, cast=int)
 
 # Create Bundles instantly when in development mode.
 INSTANT_BUNDLE_GENERATION = config('INSTANT_BUNDLE_GENERATION', default=DEBUG, cast=bool)
+# Bundles generated instantly are cached per process. Set to a cache alias,
+# e.g. `default`, to also share them between processes.
+INSTANT_BUNDLE_CACHE = config('INSTANT_BUNDLE_CACHE', default='')
+INSTANT_BUNDLE_CACHE_MAX_ENTRIES = config('INSTANT_BUNDLE_CACHE_MAX_ENTRIES', default=500,
+                                          cast=int)
 
 RATELIMIT_ENABLE = config('RATELIMIT_ENABLE', default=False, cast=bool)
 RATELIMIT_RATE = config('RATELIMIT_RATE', default='10/m')